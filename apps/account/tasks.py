@@ -1,4 +1,4 @@
-from django.core.mail import send_mail
+from django.core.mail import EmailMultiAlternatives, get_connection, send_mail
 from django.conf import settings
 from django.template import loader
 
@@ -54,8 +54,7 @@ def send_activation_email(to_email, username, user_id):
     logger.info(f'Activation email has been sent to {receiver[0]}')
 
 
-@shared_task
-def send_order_email(to_email, username, order_number, order_status):
+def order_email_message(to_email, username, order_number, order_status):
     url = f'{domain}/account/order/'
     customer = username
     if username[:6] == 'guest_':
@@ -101,9 +100,28 @@ def send_order_email(to_email, username, order_number, order_status):
         'text': text,
     })
 
-    send_mail(subject, message, sender, receiver, html_message=html_message)
+    email = EmailMultiAlternatives(subject, message, sender, receiver)
+    email.attach_alternative(html_message, 'text/html')
+    return email
+
+
+@shared_task
+def send_order_email(to_email, username, order_number, order_status):
+    order_email_message(to_email, username, order_number, order_status).send()
     logger.info(
-        f'Order at {order_status} email has been sent to {username} ({receiver[0]})')
+        f'Order at {order_status} email has been sent to {username} ({to_email})')
+
+
+@shared_task
+def send_order_emails(emails):
+    """
+    Send order emails queued in one batch by bulk jobs over one mail connection,
+    emails is a list of (to_email, username, order_number, order_status)
+    """
+    messages = [order_email_message(*email) for email in emails]
+    sent = get_connection().send_messages(messages)
+    logger.info(f'{sent} order emails have been sent')
+    return sent
 
 
 @shared_task
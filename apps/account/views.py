@@ -21,8 +21,10 @@ from itsdangerous import SignatureExpired, BadData
 from ratelimit.decorators import ratelimit
 
 from cart.cart import get_watch_history_products
+from cart.repository import toggle_wishlist
 from order.models import Order
 from shop.models import ProductSKU
+from shop.wishlist import WishlistProducts
 
 from .forms import RegisterForm, UserInfoForm, AddressForm, PasswordResetForm, LoginForm
 from .models import User, Address
@@ -39,8 +41,9 @@ class AccountCenterView(AccountInfoCheckMixin, FormMixin, View):
         user = request.user
         form = UserInfoForm(instance=user, request_user=user)
         pw_form = PasswordResetForm()
-        # get recent watch history
-        recent_products = get_watch_history_products(user.id)
+        # get recent watch history, flagged if wishlisted
+        recent_products = WishlistProducts(
+            get_watch_history_products(user.id), user.id)
 
         context = {
             'user': user,
@@ -198,23 +201,18 @@ class WishlistView(LoginRequiredMixin, ListView):
         except ProductSKU.DoesNotExist:
             return JsonResponse({'res': '0', 'errmsg': 'Item does not exist'})
 
-        conn = get_redis_connection('cart')
-        wish_key = f'wish_{user.id}'
-        wish_count = conn.scard(wish_key)
-        # check if in wishlist already
-        if conn.sismember(wish_key, sku_id):
-            conn.srem(wish_key, sku_id)
+        # remove if in wishlist already, if not add to list
+        added, wish_count = toggle_wishlist(user.id, sku_id)
+        if not added:
             return JsonResponse({
                 'res': 1,
                 'msg': 'Item removed from wishlist',
-                'wish_count': int(wish_count) - 1
+                'wish_count': wish_count
             })
-        # if not add to list
-        conn.sadd(wish_key, sku_id)
         return JsonResponse({
             'res': 1,
             'msg': 'Item added to wishlist',
-            'wish_count': int(wish_count) + 1
+            'wish_count': wish_count
         })
 
 
@@ -1,25 +1,8 @@
 import uuid
-from django_redis import get_redis_connection
 from django.db.models import Case, When
 from shop.models import ProductSKU
 
-conn = get_redis_connection('cart')
-
-
-def cal_cart_count(user_id):
-    """
-    Get data from redis and calculate types of products in the shopping cart
-    """
-    cart_key = f'cart_{user_id}'
-    cart_count = conn.hlen(cart_key)
-    return cart_count
-
-
-def get_product_id_list(user_id):
-    cart_key = f'cart_{user_id}'
-    sku_list = conn.hkeys(cart_key)
-    sku_list = [int(i) for i in sku_list]
-    return sku_list
+from .repository import get_cart_items, get_watch_history
 
 
 def get_cart_all_in_order(user_id):
@@ -27,11 +10,7 @@ def get_cart_all_in_order(user_id):
     Return all key value pairs in current shopping cart and the order
     Ordering can be used in filter queries to keep the order of cart
     """
-    # hgetall returns a dictionary {sku_id:count}, expand keys and values to list
-    cart_dict = conn.hgetall(f'cart_{user_id}')
-    # or use higher-order function [*map(int,[*cart_dict])]
-    sku_ids = [int(i) for i in [*cart_dict]]
-    counts = [int(c) for c in [*cart_dict.values()]]
+    sku_ids, counts = get_cart_items(user_id)
 
     """HIGHLIGHT: Dynamite super trick from Django ORM magic"""
     ordering = Case(*[When(pk=pk, then=pos)
@@ -64,17 +43,6 @@ def cal_total_count_subtotal(user_id):
         return [], 0, 0
 
 
-def delete_cart_item(user_id, sku_id):
-    """
-    Delete selected item from shopping cart, return total items count for update
-    """
-    try:
-        cart_key = f'cart_{user_id}'
-        conn.hdel(cart_key, sku_id)
-    except:
-        print('Item not found in cart')
-
-
 def cal_shipping_fee(subtotal, total_count):
     """ Shipping fee calculation simplified as much as possible """
     if subtotal > 10000:
@@ -103,7 +71,7 @@ def is_first_time_guest(request):
 def get_watch_history_products(user_id):
     """ Return a queryset with recent watched products """
 
-    sku_ids = conn.lrange(f'history_{user_id}', 0, 7)
+    sku_ids = get_watch_history(user_id)
     ordering = Case(*[When(pk=pk, then=pos)
                       for pos, pk in enumerate(sku_ids)])
     # NOTE: Use forloop will create duplicate queries
@@ -1,9 +1,13 @@
 from django.http import JsonResponse
-from shop.models import ProductSKU
 import json
 
 
 class DataIntegrityCheckMixin:
+    """
+    Validate request data only, existence and stock of the item are checked
+    against the cached stock ceiling by the cart operations.
+    """
+
     def dispatch(self, request, *args, **kwargs):
         # validate data
         try:
@@ -22,14 +26,6 @@ class DataIntegrityCheckMixin:
         except ValueError:
             return JsonResponse({'res': 0, 'errmsg': 'Invalid item count'})
 
-        try:
-            product = ProductSKU.objects.get(id=sku_id)
-        except ProductSKU.DoesNotExist:
-            return JsonResponse({'res': 0, 'errmsg': 'Item does not exist'})
-
-        if count > product.stock:
-            return JsonResponse({'res': 0, 'errmsg': 'Understocked'})
-
         if count <= 0:
             return JsonResponse({'res': 0, 'errmsg': 'At least 1 item required'})
 
@@ -0,0 +1,228 @@
+"""
+Redis access for per user cart, wishlist and watch history keys.
+Each function costs one round trip, several commands are grouped
+into a pipeline or a lua script.
+    cart_<user_id>: hash {<sku_id>: <count>}
+    wish_<user_id>: set {<sku_id>}
+    history_<user_id>: list [<sku_id>], most recent first
+    stock_<sku_id>: stock ceiling of a product cached from DB
+Cart mutations run as lua scripts, the stock check and the write are atomic,
+concurrent requests cannot lose an update or exceed the stock ceiling.
+"""
+from django_redis import get_redis_connection
+
+from shop.models import ProductSKU
+
+conn = get_redis_connection('cart')
+
+HISTORY_LENGTH = 8
+STOCK_TIMEOUT = 60 * 10
+
+# status of cart mutations
+OK = 1
+UNDERSTOCKED = 0
+STOCK_UNKNOWN = -1
+NOT_FOUND = -2
+
+# KEYS: cart, stock ceiling; ARGV: sku_id, count to add
+# return {status, count in cart, cart length}
+ADD_TO_CART = conn.register_script("""
+local stock = redis.call('GET', KEYS[2])
+if not stock then
+    return {-1, 0, 0}
+end
+local current = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0')
+local count = current + tonumber(ARGV[2])
+if count > tonumber(stock) then
+    return {0, current, redis.call('HLEN', KEYS[1])}
+end
+redis.call('HSET', KEYS[1], ARGV[1], count)
+return {1, count, redis.call('HLEN', KEYS[1])}
+""")
+
+# KEYS: cart, stock ceiling; ARGV: sku_id, new count
+# return {status, count in cart, cart length}
+SET_CART_ITEM = conn.register_script("""
+local stock = redis.call('GET', KEYS[2])
+if not stock then
+    return {-1, 0, 0}
+end
+local count = tonumber(ARGV[2])
+if count > tonumber(stock) then
+    return {0, tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0'), redis.call('HLEN', KEYS[1])}
+end
+redis.call('HSET', KEYS[1], ARGV[1], count)
+return {1, count, redis.call('HLEN', KEYS[1])}
+""")
+
+# KEYS: cart; ARGV: sku_id, return cart length after deletion
+REMOVE_FROM_CART = conn.register_script("""
+redis.call('HDEL', KEYS[1], ARGV[1])
+return redis.call('HLEN', KEYS[1])
+""")
+
+# KEYS: guest cart, user cart; count of the same item is kept from user cart,
+# return user cart length after merging
+MERGE_CARTS = conn.register_script("""
+local items = redis.call('HGETALL', KEYS[1])
+for i = 1, #items, 2 do
+    redis.call('HSETNX', KEYS[2], items[i], items[i + 1])
+end
+redis.call('DEL', KEYS[1])
+return redis.call('HLEN', KEYS[2])
+""")
+
+# remove the item if in wishlist, otherwise add it,
+# return {added, wishlist length}
+TOGGLE_WISHLIST = conn.register_script("""
+local added = 1
+if redis.call('SISMEMBER', KEYS[1], ARGV[1]) == 1 then
+    redis.call('SREM', KEYS[1], ARGV[1])
+    added = 0
+else
+    redis.call('SADD', KEYS[1], ARGV[1])
+end
+return {added, redis.call('SCARD', KEYS[1])}
+""")
+
+
+def cart_key(user_id):
+    return f'cart_{user_id}'
+
+
+def wish_key(user_id):
+    return f'wish_{user_id}'
+
+
+def history_key(user_id):
+    return f'history_{user_id}'
+
+
+def stock_key(sku_id):
+    return f'stock_{sku_id}'
+
+
+def cache_stock(sku_id):
+    """
+    Load stock of a product on the shelf into redis, return the stock,
+    None if the product does not exist.
+    """
+    stock = ProductSKU.objects.filter(id=sku_id).values_list(
+        'stock', flat=True).first()
+    if stock is not None:
+        conn.set(stock_key(sku_id), stock, ex=STOCK_TIMEOUT)
+    return stock
+
+
+def invalidate_stock(*sku_ids):
+    """
+    Drop cached stock ceilings after stock changes in DB,
+    they are loaded again on the next cart mutation.
+    """
+    if sku_ids:
+        conn.delete(*[stock_key(sku_id) for sku_id in sku_ids])
+
+
+def _run_with_stock(script, user_id, sku_id, count):
+    keys = [cart_key(user_id), stock_key(sku_id)]
+    status, total, cart_count = script(keys=keys, args=[sku_id, count])
+    if status == STOCK_UNKNOWN:
+        # only a cold stock ceiling costs a DB query
+        if cache_stock(sku_id) is None:
+            return NOT_FOUND, 0, 0
+        status, total, cart_count = script(keys=keys, args=[sku_id, count])
+    return status, total, cart_count
+
+
+def add_to_cart(user_id, sku_id, count):
+    """
+    Add count of an item to cart unless the total is over the stock ceiling,
+    return (status, count in cart, cart length).
+    """
+    return _run_with_stock(ADD_TO_CART, user_id, sku_id, count)
+
+
+def set_cart_item(user_id, sku_id, count):
+    """
+    Reset count of an item in cart unless it is over the stock ceiling,
+    return (status, count in cart, cart length).
+    """
+    return _run_with_stock(SET_CART_ITEM, user_id, sku_id, count)
+
+
+def remove_from_cart(user_id, sku_id):
+    """
+    Delete an item from cart, return the cart length after deletion.
+    """
+    return REMOVE_FROM_CART(keys=[cart_key(user_id)], args=[sku_id])
+
+
+def merge_carts(from_user_id, to_user_id):
+    """
+    Merge a guest cart into user cart and delete the guest cart,
+    count of the same item is kept from user cart.
+    Return the user cart length.
+    """
+    return MERGE_CARTS(keys=[cart_key(from_user_id), cart_key(to_user_id)])
+
+
+def get_cart_items(user_id):
+    """
+    Return ([sku_id], [count]) of all items in cart in the order they were added,
+    both are empty if the cart is empty.
+    """
+    items = conn.hgetall(cart_key(user_id))
+    return [int(sku_id) for sku_id in items], [int(count) for count in items.values()]
+
+
+def get_cart_and_wishlist_count(user_id, with_wishlist=True):
+    """
+    Return (cart length, wishlist length), wishlist is 0 for guests.
+    """
+    pipe = conn.pipeline(transaction=False)
+    pipe.hlen(cart_key(user_id))
+    if with_wishlist:
+        pipe.scard(wish_key(user_id))
+    counts = pipe.execute()
+    return (counts + [0])[:2]
+
+
+def toggle_wishlist(user_id, sku_id):
+    """
+    Add an item to or remove it from wishlist,
+    return (added, wishlist length).
+    """
+    added, wish_count = TOGGLE_WISHLIST(
+        keys=[wish_key(user_id)], args=[sku_id])
+    return bool(added), wish_count
+
+
+def check_wishlist(user_id, sku_ids):
+    """
+    Return a list of booleans, if each item is in the wishlist,
+    checked with one SMISMEMBER (redis 6.2+) however long the wishlist is.
+    """
+    if not sku_ids:
+        return []
+    flags = conn.execute_command('SMISMEMBER', wish_key(user_id), *sku_ids)
+    return [bool(flag) for flag in flags]
+
+
+def get_watch_history(user_id):
+    """ Return ids of the recently watched items, most recent first """
+    return [int(sku_id) for sku_id in
+            conn.lrange(history_key(user_id), 0, HISTORY_LENGTH-1)]
+
+
+def record_view(user_id, sku_id):
+    """
+    Move the item to the beginning of watch history, keep the latest items only,
+    return if the item is in the wishlist.
+    """
+    key = history_key(user_id)
+    pipe = conn.pipeline()
+    pipe.lrem(key, 0, sku_id)
+    pipe.lpush(key, sku_id)
+    pipe.ltrim(key, 0, HISTORY_LENGTH-1)
+    pipe.sismember(wish_key(user_id), sku_id)
+    return bool(pipe.execute()[-1])
@@ -1,7 +1,7 @@
 from django.contrib.auth.signals import user_logged_in
 from django.dispatch import receiver
 
-from django_redis import get_redis_connection
+from .repository import merge_carts
 
 
 @receiver(user_logged_in)
@@ -10,20 +10,11 @@ def merge_shopping_cart(sender, user, request,  **kwargs):
     Check if there are items in shopping cart before login,
     merge guest shopping cart to user cart and remove guest cart data
     uuid cookie will be expired in 7 days
+    NOTE: this merge will overwrite the count of same product with user cart data
     """
     try:
         uuid = request.COOKIES['uuid']
-        conn = get_redis_connection('cart')
-
-        user_key = f'cart_{user.id}'
-        guest_key = f'cart_{uuid}'
-        guest_cart = conn.hgetall(guest_key)
-        user_cart = conn.hgetall(user_key)
-        updated_cart = {**guest_cart, **user_cart}
-        # user_cart |= guest_cart  # new in python3.9+
-        # NOTE: this merge will overwrite the count of same product with user cart data
-        conn.hset(user_key, mapping=updated_cart)
-        conn.delete(guest_key)
-    except:
+    except (AttributeError, KeyError):
         # no uuid found, do nothing
         return
+    merge_carts(uuid, user.id)
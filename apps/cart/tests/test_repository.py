@@ -0,0 +1,99 @@
+from django.test import TestCase
+
+from django_redis import get_redis_connection
+
+from cart.repository import (
+    OK, UNDERSTOCKED, NOT_FOUND, add_to_cart, set_cart_item, remove_from_cart,
+    merge_carts, get_cart_items, get_cart_and_wishlist_count, toggle_wishlist,
+    check_wishlist, get_watch_history, record_view,
+)
+from shop.tests.factory import SkuFactory
+
+
+class TestCartRepository(TestCase):
+
+    def setUp(self):
+        self.conn = get_redis_connection('cart')
+        for sku_id in [1010, 1011]:
+            self.conn.set(f'stock_{sku_id}', 5)
+
+    def tearDown(self):
+        self.conn.flushdb()
+
+    def test_add_to_cart_within_stock(self):
+        self.assertEqual(add_to_cart(1, 1010, 2), (OK, 2, 1))
+        self.assertEqual(add_to_cart(1, 1010, 3), (OK, 5, 1))
+        self.assertEqual(add_to_cart(1, 1011, 1), (OK, 1, 2))
+
+    def test_add_to_cart_over_stock(self):
+        add_to_cart(1, 1010, 4)
+        self.assertEqual(add_to_cart(1, 1010, 2), (UNDERSTOCKED, 4, 1))
+        self.assertEqual(self.conn.hget('cart_1', 1010), b'4')
+
+    def test_stock_ceiling_loaded_from_db(self):
+        sku = SkuFactory(stock=3)
+        with self.assertNumQueries(1):
+            self.assertEqual(add_to_cart(1, sku.id, 2), (OK, 2, 1))
+            self.assertEqual(add_to_cart(1, sku.id, 2), (UNDERSTOCKED, 2, 1))
+        self.assertEqual(self.conn.get(f'stock_{sku.id}'), b'3')
+
+    def test_stock_ceiling_invalidated_on_save(self):
+        sku = SkuFactory(stock=3)
+        add_to_cart(1, sku.id, 3)
+        sku.stock = 10
+        sku.save()
+        self.assertEqual(add_to_cart(1, sku.id, 3), (OK, 6, 1))
+
+    def test_item_not_found(self):
+        self.assertEqual(add_to_cart(1, 999, 1), (NOT_FOUND, 0, 0))
+        self.assertEqual(set_cart_item(1, 999, 1), (NOT_FOUND, 0, 0))
+
+    def test_set_cart_item(self):
+        add_to_cart(1, 1010, 1)
+        self.assertEqual(set_cart_item(1, 1010, 4), (OK, 4, 1))
+        self.assertEqual(set_cart_item(1, 1010, 6), (UNDERSTOCKED, 4, 1))
+
+    def test_remove_from_cart(self):
+        add_to_cart(1, 1010, 1)
+        add_to_cart(1, 1011, 1)
+        self.assertEqual(remove_from_cart(1, 1010), 1)
+
+    def test_get_cart_items(self):
+        self.assertEqual(get_cart_items(1), ([], []))
+        add_to_cart(1, 1011, 2)
+        add_to_cart(1, 1010, 1)
+        self.assertEqual(get_cart_items(1), ([1011, 1010], [2, 1]))
+
+    def test_merge_carts(self):
+        add_to_cart('guest', 1010, 1)
+        add_to_cart('guest', 1011, 1)
+        add_to_cart(1, 1011, 3)
+
+        self.assertEqual(merge_carts('guest', 1), 2)
+        self.assertEqual(self.conn.hgetall('cart_1'), {b'1010': b'1', b'1011': b'3'})
+        self.assertFalse(self.conn.exists('cart_guest'))
+
+    def test_toggle_wishlist(self):
+        self.assertEqual(toggle_wishlist(1, 1010), (True, 1))
+        self.assertEqual(toggle_wishlist(1, 1011), (True, 2))
+        self.assertEqual(toggle_wishlist(1, 1010), (False, 1))
+        self.assertEqual(get_cart_and_wishlist_count(1), [0, 1])
+
+    def test_check_wishlist(self):
+        toggle_wishlist(1, 1010)
+        toggle_wishlist(1, 1012)
+        self.assertEqual(check_wishlist(1, [1010, 1011, 1012]), [True, False, True])
+        self.assertEqual(check_wishlist(2, [1010]), [False])
+        self.assertEqual(check_wishlist(1, []), [])
+
+    def test_record_view(self):
+        for sku_id in range(10):
+            self.assertFalse(record_view(1, sku_id))
+        record_view(1, 5)
+        toggle_wishlist(1, 3)
+
+        self.assertTrue(record_view(1, 3))
+        self.assertEqual(self.conn.lrange('history_1', 0, -1),
+                         [b'3', b'5', b'9', b'8', b'7', b'6', b'4', b'2'])
+        self.assertEqual(get_watch_history(1), [3, 5, 9, 8, 7, 6, 4, 2])
+        self.assertEqual(get_watch_history(2), [])
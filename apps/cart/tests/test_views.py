@@ -24,17 +24,19 @@ class TestCartView(TestCase):
 
     @classmethod
     def setUpTestData(cls) -> None:
-        cls.payload = {'sku_id': '1', 'count': '1'}
         cls.content_type = "application/json"
         cls.user = UserFactory()
         cls.category = CategoryFactory()
         cls.conn = get_redis_connection('cart')
         cls.key = f'cart_{cls.user.id}'
+        cls.sku_ids = []
         for _ in range(5):
             dummy = SkuFactory()
             dummy.stock = 10
             dummy.category = cls.category
             dummy.save()
+            cls.sku_ids.append(str(dummy.id))
+        cls.payload = {'sku_id': cls.sku_ids[0], 'count': '1'}
 
     def test_show_cart_info_view(self):
         self.client.force_login(self.user)
@@ -67,7 +69,7 @@ class TestCartView(TestCase):
 
     def test_add_cart_understock(self):
         self.client.force_login(self.user)
-        payload = {'sku_id': '2', 'count': '100'}
+        payload = {'sku_id': self.sku_ids[1], 'count': '100'}
         res = self.client.post(reverse('cart:add'),
                                payload, content_type=self.content_type)
         res_data = res.json()
@@ -97,7 +99,7 @@ class TestCartView(TestCase):
 
     def test_add_invalid_item_count(self):
         self.client.force_login(self.user)
-        payload = {'sku_id': '1', 'count': 'c'}
+        payload = {'sku_id': self.sku_ids[0], 'count': 'c'}
         res = self.client.post(reverse('cart:add'),
                                payload, content_type=self.content_type)
         res_data = res.json()
@@ -107,7 +109,7 @@ class TestCartView(TestCase):
 
     def test_add_item_count_less_than_one(self):
         self.client.force_login(self.user)
-        payload = {'sku_id': '1', 'count': '0'}
+        payload = {'sku_id': self.sku_ids[0], 'count': '0'}
         res = self.client.post(reverse('cart:add'),
                                payload, content_type=self.content_type)
         res_data = res.json()
@@ -117,18 +119,18 @@ class TestCartView(TestCase):
 
     def test_update_item(self):
         self.client.force_login(self.user)
-        payload = {'sku_id': '3', 'count': '3'}
+        payload = {'sku_id': self.sku_ids[2], 'count': '3'}
         self.client.post(reverse('cart:add'),
                          payload, content_type=self.content_type)
 
-        payload_update = {'sku_id': '3', 'count': '2'}
+        payload_update = {'sku_id': self.sku_ids[2], 'count': '2'}
         res = self.client.post(reverse('cart:update'),
                                payload_update, content_type=self.content_type)
         res_data = res.json()
         self.assertEqual(res.status_code, 200)
         self.assertEqual(res_data['res'], 1)
         self.assertEqual(res_data['msg'], 'Cart updated')
-        self.assertEqual(res_data['sku_id'], '3')
+        self.assertEqual(res_data['sku_id'], self.sku_ids[2])
         self.assertEqual(res_data['count'], '2')
         self.assertEqual(res.resolver_match.func.__name__,
                          CartUpdateView.as_view().__name__)
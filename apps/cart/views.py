@@ -6,15 +6,16 @@ from django.views.generic import View
 from django.urls.base import reverse
 
 import json
-from django_redis import get_redis_connection
 
 from account.models import Address
 from account.forms import GuestAddressForm, AddressForm
-from shop.models import ProductSKU
 
-from .cart import (cal_cart_count, cal_total_count_subtotal,
-                   delete_cart_item, cal_shipping_fee, get_user_id, is_first_time_guest)
+from .cart import (cal_total_count_subtotal, cal_shipping_fee,
+                   get_user_id, is_first_time_guest)
 from .mixins import DataIntegrityCheckMixin
+from .repository import (
+    NOT_FOUND, UNDERSTOCKED, add_to_cart, remove_from_cart, set_cart_item,
+)
 
 
 class CartAddView(DataIntegrityCheckMixin, View):
@@ -32,19 +33,13 @@ class CartAddView(DataIntegrityCheckMixin, View):
         sku_id = data.get('sku_id')
         count = int(data.get('count'))
 
-        conn = get_redis_connection('cart')
-        cart_key = f'cart_{user_id}'
-        cart_count = conn.hget(cart_key, sku_id)
-        if cart_count:
-            count += int(cart_count)
-
-        stock = ProductSKU.objects.get(id=sku_id).stock
-        if count > stock:
+        # stock check and update atomically in one round trip
+        status, _, cart_count = add_to_cart(user_id, sku_id, count)
+        if status == NOT_FOUND:
+            return JsonResponse({'res': 0, 'errmsg': 'Item does not exist'})
+        if status == UNDERSTOCKED:
             return JsonResponse({'res': 0, 'errmsg': 'Understocked'})
 
-        conn.hset(cart_key, sku_id, count)
-        cart_count = conn.hlen(cart_key)
-
         response = JsonResponse({
             'res': 1,
             'msg': 'Added to cart',
@@ -89,11 +84,12 @@ class CartUpdateView(DataIntegrityCheckMixin, View):
         sku_id = data.get('sku_id')
         count = data.get('count')
 
-        # connect redis, reset product count
-        conn = get_redis_connection('cart')
-        cart_key = f'cart_{user_id}'
-
-        conn.hset(cart_key, sku_id, count)
+        # reset product count under the stock ceiling
+        status, _, _ = set_cart_item(user_id, sku_id, int(count))
+        if status == NOT_FOUND:
+            return JsonResponse({'res': 0, 'errmsg': 'Item does not exist'})
+        if status == UNDERSTOCKED:
+            return JsonResponse({'res': 0, 'errmsg': 'Understocked'})
 
         return JsonResponse({
             'res': 1,
@@ -112,8 +108,7 @@ class CartDeleteView(DataIntegrityCheckMixin, View):
         data = json.loads(request.body.decode())
         sku_id = data.get('sku_id')
 
-        delete_cart_item(user_id, sku_id)
-        cart_count = cal_cart_count(user_id)
+        cart_count = remove_from_cart(user_id, sku_id)
 
         return JsonResponse({
             'res': 1,
@@ -134,13 +129,11 @@ class CheckoutView(View):
         form = GuestAddressForm()
         # formset = create_address_formset(user)
 
-        cart_count = cal_cart_count(user_id)
-        if cart_count == 0:
+        products, total_count, subtotal = cal_total_count_subtotal(user_id)
+        if total_count == 0:
             messages.error(request, 'Cart is empty')
             return redirect(reverse('cart:info'))
 
-        products, total_count, subtotal = cal_total_count_subtotal(user_id)
-
         # shipping should be an independant module in a more complex project
         shipping_fee = cal_shipping_fee(subtotal, total_count)
         total_price = subtotal + shipping_fee
@@ -1,11 +1,14 @@
 from django.contrib import admin
+from django.db import transaction
 from django.db.models import Sum, Q, F, Prefetch
 from django.http.response import JsonResponse
 
+from functools import partial
+
 from simpleui.admin import AjaxAdmin
 
-from account.tasks import send_order_email, send_refund_email
-from .models import OrderProduct, Order, Payment, Review
+from account.tasks import send_order_email, send_order_emails, send_refund_email
+from .models import OrderProduct, Order, Payment, Review, WebhookEvent, restore_orders_stock
 # from .actions import create_refund
 
 
@@ -152,7 +155,7 @@ class OrderAdmin(AjaxAdmin):
                 })
 
         orders = Order.objects.filter(
-            Q(id__in=ids), status='CL').select_related('payment')
+            Q(id__in=ids), status='CL').select_related('payment', 'user')
         # print('qs', queryset, request.POST)
         if not orders:
             return JsonResponse(data={
@@ -160,21 +163,27 @@ class OrderAdmin(AjaxAdmin):
                 'msg': 'None of selected order can be cancelled'
             })
 
-        for order in orders:
-            order.confirm_cancel()
-            order.save()
-            send_order_email.delay(
-                order.user.email, order.user.username, order.number, order.status)
-            order.restore_product_stock()
-
-            if refund == 'YES':
-                payment = order.payment
-                refund_amount = order.subtotal if not amount else amount
-                payment.refund(refund_amount)
-                payment.save()
-                # send refund email
-                send_refund_email.delay(
-                    order.user.email, order.user.username, order.number, refund_amount)
+        emails = []
+        # a failed refund rolls back the orders cancelled before it
+        with transaction.atomic():
+            for order in orders:
+                order.confirm_cancel()
+                order.save()
+                emails.append(
+                    (order.user.email, order.user.username, order.number, order.status))
+
+                if refund == 'YES':
+                    payment = order.payment
+                    refund_amount = order.subtotal if not amount else amount
+                    payment.refund(refund_amount)
+                    payment.save()
+                    # send refund email
+                    transaction.on_commit(partial(
+                        send_refund_email.delay,
+                        order.user.email, order.user.username, order.number, refund_amount))
+            # restore stock of all cancelled orders in one statement
+            restore_orders_stock([order.id for order in orders])
+            transaction.on_commit(partial(send_order_emails.delay, emails))
 
         return JsonResponse(data={
             'status': 'success',
@@ -293,22 +302,29 @@ class PaymentAdmin(AjaxAdmin):
                 'msg': 'No refundable payment'
             })
 
-        for payment in payments:
-            amount = payment.refund_amount
-            payment.refund(amount)
-            payment.save()
-            # send refund email
-            for order in payment.orders.select_related('user').filter(status__in=['CL', 'RT']):
-                order.confirm_cancel()
-                order.save()
-                send_order_email.delay(
-                    order.user.email, order.user.username, order.number, order.status)
-                order.restore_product_stock()
-            number = payment.orders.first().number  # pick one order number
-            send_refund_email(
-                payment.user.email, payment.user.username, number, amount)
-            # listen to failed event in webhook
-            # create a cancellation record
+        cancelled = []
+        emails = []
+        # a failed refund rolls back the orders cancelled before it
+        with transaction.atomic():
+            for payment in payments:
+                amount = payment.refund_amount
+                payment.refund(amount)
+                payment.save()
+                # send refund email
+                for order in payment.orders.select_related('user').filter(status__in=['CL', 'RT']):
+                    order.confirm_cancel()
+                    order.save()
+                    cancelled.append(order.id)
+                    emails.append(
+                        (order.user.email, order.user.username, order.number, order.status))
+                number = payment.orders.first().number  # pick one order number
+                transaction.on_commit(partial(
+                    send_refund_email, payment.user.email, payment.user.username, number, amount))
+                # listen to failed event in webhook
+                # create a cancellation record
+            # restore stock of all cancelled orders in one statement
+            restore_orders_stock(cancelled)
+            transaction.on_commit(partial(send_order_emails.delay, emails))
         return JsonResponse(data={
             'status': 'success',
             'msg': 'Refund created'
@@ -343,3 +359,13 @@ class PaymentAdmin(AjaxAdmin):
             }]
         }, ]
     }
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'event_id', 'type', 'status',
+                    'attempts', 'created_at', 'processed_at',)
+    search_fields = ('event_id',)
+    list_filter = ('status', 'type', 'created_at')
+    readonly_fields = ('event_id', 'type', 'payload', 'status',
+                       'attempts', 'error', 'processed_at',)
@@ -0,0 +1,178 @@
+"""
+Payment gateways behind checkout, the one in use is set by settings.PAYMENT_GATEWAY.
+StripeGateway calls Stripe API, FakeGateway is a local stand-in without network
+for development and load tests, it creates sessions, signs checkout.session.completed
+events the same way as Stripe and accepts refunds.
+"""
+import hashlib
+import hmac
+import json
+import time
+import uuid
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+import stripe
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+
+class SignatureError(Exception):
+    """ Webhook event signature does not match the payload """
+
+
+class PaymentGateway(ABC):
+    """
+    Sessions, events and refunds are returned as stripe objects,
+    the callers read them in the same way whichever gateway is in use.
+    A gateway missing any abstract method fails when it is instantiated.
+    """
+
+    @abstractmethod
+    def create_checkout_session(self, payment_method, customer_email, item_name,
+                                amount, success_url, cancel_url):
+        pass
+
+    def construct_event(self, payload, sig_header):
+        """
+        Verify the signature header and parse the webhook payload,
+        raise ValueError on invalid payload, SignatureError on invalid signature.
+        Stripe verifies the signature locally, it works for any gateway
+        signing events in the same scheme.
+        """
+        try:
+            return stripe.Webhook.construct_event(
+                payload, sig_header, settings.WEBHOOK_SECRET)
+        except stripe.error.SignatureVerificationError as e:
+            raise SignatureError(str(e))
+
+    @abstractmethod
+    def create_refund(self, payment_intent, amount=None):
+        pass
+
+    @abstractmethod
+    def get_payment_method_detail(self, payment_intent):
+        pass
+
+
+class StripeGateway(PaymentGateway):
+
+    def __init__(self):
+        self.api_key = settings.STRIPE_SECRET_KEY
+
+    def create_checkout_session(self, payment_method, customer_email, item_name,
+                                amount, success_url, cancel_url):
+        return stripe.checkout.Session.create(
+            api_key=self.api_key,
+            payment_method_types=[payment_method],
+            customer_email=customer_email,
+            line_items=[{
+                'price_data': {
+                    'currency': 'jpy',
+                    'product_data': {
+                        'name': item_name,
+                    },
+                    'unit_amount': int(amount),
+                },
+                'quantity': 1,
+            }],
+            mode='payment',
+            success_url=success_url,
+            cancel_url=cancel_url,
+        )
+
+    def create_refund(self, payment_intent, amount=None):
+        return stripe.Refund.create(
+            api_key=self.api_key, amount=amount, payment_intent=payment_intent)
+
+    # NOTE: slow on first time request, need to use with caching
+    def get_payment_method_detail(self, payment_intent):
+        intent = stripe.PaymentIntent.retrieve(
+            payment_intent, api_key=self.api_key)
+        return intent.charges.data[0].payment_method_details
+
+
+class FakeGateway(PaymentGateway):
+    """
+    Sessions live in the default cache, so that any web worker can complete them.
+    A session is paid by complete_session, which returns a signed event
+    to post to the checkout webhook, like Stripe does after the customer pays.
+    """
+    SESSION_TIMEOUT = 60 * 60 * 24
+
+    def session_key(self, session_id):
+        return f'fake_session_{session_id}'
+
+    def create_checkout_session(self, payment_method, customer_email, item_name,
+                                amount, success_url, cancel_url):
+        session_id = f'cs_fake_{uuid.uuid4().hex}'
+        session = {
+            'id': session_id,
+            'object': 'checkout.session',
+            'payment_intent': f'pi_fake_{uuid.uuid4().hex}',
+            'payment_method_types': [payment_method],
+            'payment_status': 'unpaid',
+            'customer_email': customer_email,
+            'amount_total': int(amount),
+            'currency': 'jpy',
+            'mode': 'payment',
+            'metadata': {'item_name': item_name},
+            'success_url': success_url.replace('{CHECKOUT_SESSION_ID}', session_id),
+            'cancel_url': cancel_url,
+        }
+        cache.set(self.session_key(session_id), session, self.SESSION_TIMEOUT)
+        return stripe.checkout.Session.construct_from(session, None)
+
+    def complete_session(self, session_id):
+        """
+        Mark the session paid, return (payload, signature header) of
+        its checkout.session.completed event, KeyError if session not found.
+        """
+        session = cache.get(self.session_key(session_id))
+        if session is None:
+            raise KeyError(session_id)
+        session['payment_status'] = 'paid'
+        cache.set(self.session_key(session_id), session, self.SESSION_TIMEOUT)
+        event = {
+            'id': f'evt_fake_{uuid.uuid4().hex}',
+            'object': 'event',
+            'type': 'checkout.session.completed',
+            'created': int(time.time()),
+            'data': {'object': session},
+        }
+        payload = json.dumps(event)
+        return payload, self.sign(payload)
+
+    def sign(self, payload, timestamp=None):
+        """ Signature header in Stripe scheme, t=<timestamp>,v1=<hmac sha256> """
+        timestamp = timestamp or int(time.time())
+        signature = hmac.new(
+            settings.WEBHOOK_SECRET.encode('utf-8'),
+            msg=f'{timestamp}.{payload}'.encode('utf-8'),
+            digestmod=hashlib.sha256,
+        ).hexdigest()
+        return f't={timestamp},v1={signature}'
+
+    def create_refund(self, payment_intent, amount=None):
+        refund = {
+            'id': f're_fake_{uuid.uuid4().hex}',
+            'object': 'refund',
+            'amount': amount,
+            'payment_intent': payment_intent,
+            'status': 'succeeded',
+        }
+        # kept for assertions in load tests
+        cache.set(f'fake_refund_{refund["id"]}', refund, self.SESSION_TIMEOUT)
+        return stripe.Refund.construct_from(refund, None)
+
+    def get_payment_method_detail(self, payment_intent):
+        return stripe.StripeObject.construct_from({
+            'type': 'card',
+            'card': {'brand': 'visa', 'country': 'JP', 'last4': '4242'},
+        }, None)
+
+
+@lru_cache(maxsize=None)
+def get_gateway():
+    return import_string(settings.PAYMENT_GATEWAY)()
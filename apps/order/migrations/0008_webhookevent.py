@@ -0,0 +1,36 @@
+# Generated by Django 3.1.4 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0007_auto_20201222_2337'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated')),
+                ('is_deleted', models.BooleanField(default=False, verbose_name='deleted')),
+                ('event_id', models.CharField(max_length=100, unique=True, verbose_name='event id')),
+                ('type', models.CharField(max_length=100, verbose_name='event type')),
+                ('payload', models.JSONField(verbose_name='payload')),
+                ('status', models.CharField(choices=[('RC', 'Received'), ('PC', 'Processed'), ('FL', 'Failed')], default='RC', max_length=2, verbose_name='processing status')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='attempts')),
+                ('error', models.TextField(blank=True, default='', verbose_name='last error')),
+                ('processed_at', models.DateTimeField(null=True, verbose_name='processed at')),
+            ],
+            options={
+                'ordering': ('-created_at',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='webhookevent',
+            index=models.Index(fields=['status', 'created_at'], name='order_webhook_status_idx'),
+        ),
+    ]
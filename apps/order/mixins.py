@@ -10,8 +10,8 @@ import json
 from account.forms import GuestAddressForm
 from account.models import Address, User
 from shop.models import ProductSKU
-from cart.cart import get_user_id, is_first_time_guest, cal_cart_count, get_cart_all_in_order
-from .models import Order, OrderProduct
+from cart.cart import get_user_id, is_first_time_guest, get_cart_all_in_order
+from .models import Order, OrderProduct, Review
 
 
 class OrderProcessCheckMixin:
@@ -63,10 +63,12 @@ class OrderProcessCheckMixin:
             return JsonResponse({'res': 0, 'errmsg': 'Invalid payment method'})
 
         user_id = get_user_id(request)
-        if is_first_time_guest(request) or cal_cart_count(user_id) == 0:
+        if is_first_time_guest(request):
             return JsonResponse({'res': 0, 'errmsg': 'Cart is empty'})
 
         sku_list, count_list, ordering = get_cart_all_in_order(user_id)
+        if not sku_list:
+            return JsonResponse({'res': 0, 'errmsg': 'Cart is empty'})
         qs = ProductSKU.objects.filter(id__in=sku_list).order_by(ordering)
 
         if len(sku_list) > qs.count():
@@ -169,9 +171,18 @@ class OrderReviewDataMixin(LoginRequiredMixin):
         star = data.get('star')
         comment = data.get('comment')
 
+        # only the order product is needed to delete a review
+        if request.method == 'DELETE':
+            if not op_id:
+                return JsonResponse({'res': '0', 'errmsg': 'Incompleted Data'})
+            return super().dispatch(request, *args, **kwargs)
+
         if not all([op_id, star, comment]):
             return JsonResponse({'res': '0', 'errmsg': 'Incompleted Data'})
 
+        if str(star) not in [str(value) for value in Review.Star.values]:
+            return JsonResponse({'res': '0', 'errmsg': 'Invalid rating star'})
+
         if len(comment) < 10:
             return JsonResponse({'res': '0', 'errmsg': 'Comment cannot be less than 10 characters'})
 
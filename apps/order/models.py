@@ -1,19 +1,22 @@
 from django.conf import settings
-from django.db import models
-from django.db.models import F
+from django.db import models, transaction
 from django.utils.translation import ugettext_lazy as _
 
 import os
+from collections import defaultdict
 from datetime import datetime, timedelta, timezone
 
-import stripe
 from django_fsm import FSMField, transition, RETURN_VALUE
 
 from account.models import User, Address
 from account.tasks import async_send_email
 from db.base_model import BaseModel
+from cart.repository import invalidate_stock
+from shop.cache import invalidate_product_detail
 from shop.models import ProductSKU
 
+from .gateways import get_gateway
+from .reservations import release_reservations
 from .utils import generate_order_number
 
 
@@ -34,6 +37,10 @@ class Payment(BaseModel):
     class Method(models.TextChoices):
         CARD = 'CARD', _('Credit Card')
         ALIPAY = 'ALIPAY', _('Alipay')
+    # time windows after creation, also used by bulk jobs in order.tasks
+    EXPIRE_AFTER = timedelta(minutes=30, hours=23)
+    AUTO_CANCEL_AFTER = timedelta(hours=48)
+
     # payment_intent id, create refund
     number = models.CharField(_("payment number"), max_length=100, default='')
     status = FSMField(
@@ -52,6 +59,11 @@ class Payment(BaseModel):
         permissions = [
             ('refund', 'can create a refund'),
         ]
+        indexes = [
+            # payment expiry and auto cancel jobs
+            models.Index(fields=['status', 'created_at'],
+                         name='order_payment_status_idx'),
+        ]
 
     def __str__(self):
         return f'Payment {self.number} for {self.user}'
@@ -62,8 +74,7 @@ class Payment(BaseModel):
 
         # NOTE: slow on first time request, need to use with caching
     def get_payment_method_detail(self):
-        intent = stripe.PaymentIntent.retrieve(self.number)
-        return intent.charges.data[0].payment_method_details
+        return get_gateway().get_payment_method_detail(self.number)
 
     def is_expired(self):
         """
@@ -71,14 +82,14 @@ class Payment(BaseModel):
         minimum expired time need to deduct the time interval of expire_payments cron job
         """
         time_elapsed = (datetime.now(timezone.utc) - self.created_at)
-        return timedelta(hours=48) > time_elapsed > timedelta(minutes=30, hours=23) and self.status == 'PD'
+        return self.AUTO_CANCEL_AFTER > time_elapsed > self.EXPIRE_AFTER and self.status == 'PD'
 
     def is_auto_canceled(self):
         """
         check if need to cancel payment and all attached orders after 48hrs
         """
         time_elapsed = (datetime.now(timezone.utc) - self.created_at)
-        return time_elapsed > timedelta(hours=48) and self.status in ['PD', 'EX']
+        return time_elapsed > self.AUTO_CANCEL_AFTER and self.status in ['PD', 'EX']
 
     @transition(field=status, source='PD', target='SC')
     def pay(self):
@@ -94,6 +105,15 @@ class Payment(BaseModel):
         self.session_id = ''
         self.number = ''
 
+    def attach_session(self, session):
+        """
+        Attach the checkout session to a pending payment,
+        the session is created after the order is committed
+        """
+        self.session_id = session.id
+        self.number = session.payment_intent
+        self.save(update_fields=['session_id', 'number', 'updated_at'])
+
     @transition(field=status, source='EX', target='PD')
     def renew_payment(self, session):
         self.session_id = session.id
@@ -102,8 +122,7 @@ class Payment(BaseModel):
 
     @transition(field=status, source='EX', target='PD')
     def refund(self, amount=None):
-        refund = stripe.Refund.create(
-            amount=amount, payment_intent=self.number)
+        refund = get_gateway().create_refund(self.number, amount)
         if refund.status == 'succeeded':
             subject = f'Payment Refunded'
             message = f'Payment {self.number} has been successfully refunded.'
@@ -145,6 +164,10 @@ class Order(BaseModel):
         RETURNING = 'RT', _('Returning')
         COMPLETED = 'CP', _('Completed')
 
+    # shipped orders complete after 32 days, returning orders 30 days after request
+    COMPLETE_AFTER = timedelta(days=32)
+    RETURN_COMPLETE_AFTER = timedelta(days=30)
+
     number = models.CharField(
         _("order number"), max_length=100, default='', unique=True)
     # NOTE: protected=True will cause error in testing
@@ -170,6 +193,11 @@ class Order(BaseModel):
             ('ship_order', 'can ship orders'),
             ('cancel_order', 'can cancel orders'),
         ]
+        indexes = [
+            # order history of a customer
+            models.Index(fields=['user', 'is_deleted', 'created_at'],
+                         name='order_order_user_history_idx'),
+        ]
 
     def __str__(self):
         return f'Order {self.number} for {self.user}'
@@ -202,24 +230,20 @@ class Order(BaseModel):
         now = datetime.now(timezone.utc)
         if self.status == 'SP':
             time_elapsed = (now - self.created_at)
-            return time_elapsed >= timedelta(days=32)
+            return time_elapsed >= self.COMPLETE_AFTER
         elif self.status == 'RT':
             time_elapsed = (now - self.return_at)
-            return time_elapsed >= timedelta(days=30)
+            return time_elapsed >= self.RETURN_COMPLETE_AFTER
         else:
             return False
 
     def restore_product_stock(self):
         """
-        Use to restore product stock and sales data after cancellation
+        Use to restore product stock and sales data after cancellation,
+        see restore_orders_stock to restore many orders at once
         """
         if self.status == 'CX':
-            products = [
-                op.product for op in self.order_products.select_related('product')]
-            for product in products:
-                product.sales = F('sales') - 1
-                product.stock = F('stock') + 1
-            ProductSKU.objects.bulk_update(products, ['sales', 'stock'])
+            restore_orders_stock([self.id])
         else:
             raise Exception(
                 'This method can only be applied to cancelled orders')
@@ -368,3 +392,61 @@ class Review(BaseModel):
 
     def __str__(self):
         return f'review for {self.order_product.product} by {self.user}'
+
+
+class WebhookEvent(BaseModel):
+    """
+    Inbox of payment webhook events, an event is saved and acknowledged at once,
+    then processed from celery queue by order.tasks.process_webhook_event,
+    the unique event id keeps an event retried by the gateway from being processed twice
+    """
+    class Status(models.TextChoices):
+        RECEIVED = 'RC', _('Received')
+        PROCESSED = 'PC', _('Processed')
+        FAILED = 'FL', _('Failed')
+
+    event_id = models.CharField(_("event id"), max_length=100, unique=True)
+    type = models.CharField(_("event type"), max_length=100)
+    payload = models.JSONField(_("payload"))
+    status = models.CharField(
+        _("processing status"), choices=Status.choices, default=Status.RECEIVED, max_length=2)
+    attempts = models.PositiveSmallIntegerField(_("attempts"), default=0)
+    error = models.TextField(_("last error"), blank=True, default='')
+    processed_at = models.DateTimeField(_("processed at"), null=True)
+
+    class Meta:
+        ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['status', 'created_at'],
+                         name='order_webhook_status_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.type} event {self.event_id}'
+
+
+def restore_orders_stock(orders):
+    """
+    Restore product stock and sales data of many cancelled orders at once,
+    counts are summed per product and written by one UPDATE ... FROM (VALUES ...),
+    caches and reservations are released after commit.
+    orders is a list of order ids, a queryset is evaluated in the query as a subquery.
+    Return the number of updated products.
+    """
+    order_items = defaultdict(list)
+    items = []
+    for number, sku_id, count in OrderProduct.objects.filter(
+            order__in=orders).order_by().values_list('order__number', 'product_id', 'count'):
+        order_items[number].append((sku_id, count))
+        items.append((sku_id, count))
+    updated = ProductSKU.objects.restock(items)
+
+    sku_ids = {sku_id for sku_id, _ in items}
+
+    def release():
+        # update sends no signals, detail pages and carts use stock
+        invalidate_product_detail(*sku_ids)
+        invalidate_stock(*sku_ids)
+        release_reservations(order_items)
+    transaction.on_commit(release)
+    return updated
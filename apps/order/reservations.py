@@ -0,0 +1,216 @@
+"""
+Redis ledger of stock reserved by orders, checkout takes stock off
+a counter in redis atomically instead of locking product rows in DB,
+the DB update is a short conditional write at the end of the transaction.
+    available_<sku_id>: units left for new reservations, loaded from DB stock
+    reservation_<order_number>: hash {<sku_id>: <count>}, held until the order
+        is paid or cancelled, expires after the auto cancel window
+    reservations_pending: sorted set {<order_number>: <reserved at>} of
+        reservations not written to DB yet
+DB stock stays the source of truth, counters are reset from it by
+reconcile_reservations, a counter too high only lets a conditional
+DB update fail, it never oversells.
+"""
+import time
+
+from django_redis import get_redis_connection
+
+from shop.models import ProductSKU
+
+conn = get_redis_connection('cart')
+
+PENDING_KEY = 'reservations_pending'
+# orders are auto cancelled 48hrs after payment creation, by an hourly job
+RESERVATION_TIMEOUT = 60 * 60 * 49
+# a reservation still pending after it is left by a crashed request
+PENDING_TIMEOUT = 60 * 5
+
+# status of reservations
+OK = 1
+UNDERSTOCKED = 0
+STOCK_UNKNOWN = -1
+NOT_FOUND = -2
+
+# KEYS: reservation, pending set, available counters;
+# ARGV: order number, timestamp, timeout, sku ids, counts
+# all items are reserved or none, return {status, index of the failed item}
+RESERVE_STOCK = conn.register_script("""
+local n = #KEYS - 2
+for i = 1, n do
+    local available = redis.call('GET', KEYS[i + 2])
+    if not available then
+        return {-1, i}
+    end
+    if tonumber(available) < tonumber(ARGV[3 + n + i]) then
+        return {0, i}
+    end
+end
+for i = 1, n do
+    redis.call('DECRBY', KEYS[i + 2], ARGV[3 + n + i])
+    redis.call('HINCRBY', KEYS[1], ARGV[3 + i], ARGV[3 + n + i])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+return {1, 0}
+""")
+
+# KEYS: reservation, pending set; ARGV: order number, key prefix of counters,
+# sku ids and counts to release in pairs, the reservation itself if not given.
+# Counters not loaded are left to be loaded from DB again,
+# return the number of released units
+RELEASE_STOCK = conn.register_script("""
+local items = ARGV
+local start = 3
+if #ARGV == 2 then
+    items = redis.call('HGETALL', KEYS[1])
+    start = 1
+end
+local released = 0
+for i = start, #items, 2 do
+    local key = ARGV[2] .. items[i]
+    if redis.call('EXISTS', key) == 1 then
+        redis.call('INCRBY', key, items[i + 1])
+    end
+    released = released + tonumber(items[i + 1])
+end
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+return released
+""")
+
+
+def available_key(sku_id):
+    return f'available_{sku_id}'
+
+
+def reservation_key(order_number):
+    return f'reservation_{order_number}'
+
+
+def load_available(*sku_ids):
+    """
+    Load DB stock into counters not loaded yet, a counter loaded
+    meanwhile by another request is kept. Return ids found in DB.
+    """
+    stocks = dict(ProductSKU.objects.filter(
+        id__in=sku_ids).values_list('id', 'stock'))
+    pipe = conn.pipeline(transaction=False)
+    for sku_id, stock in stocks.items():
+        pipe.set(available_key(sku_id), stock, nx=True)
+    pipe.execute()
+    return set(stocks)
+
+
+def invalidate_available(*sku_ids):
+    """
+    Drop counters after stock is changed outside checkout, e.g. restocking,
+    they are loaded from DB again on the next reservation.
+    """
+    if sku_ids:
+        conn.delete(*[available_key(sku_id) for sku_id in sku_ids])
+
+
+def reserve_stock(order_number, items):
+    """
+    Reserve (sku_id, count) items for an order in one atomic step,
+    return (status, sku_id of the item failed or None).
+    """
+    sku_ids, counts = zip(*items)
+    keys = [reservation_key(order_number), PENDING_KEY,
+            *[available_key(sku_id) for sku_id in sku_ids]]
+    args = [order_number, time.time(), RESERVATION_TIMEOUT, *sku_ids, *counts]
+    status, index = RESERVE_STOCK(keys=keys, args=args)
+    if status == STOCK_UNKNOWN:
+        # only cold counters cost a DB query
+        missing = set(sku_ids) - load_available(*sku_ids)
+        if missing:
+            return NOT_FOUND, missing.pop()
+        status, index = RESERVE_STOCK(keys=keys, args=args)
+    return status, sku_ids[index - 1] if index else None
+
+
+def confirm_reservation(order_number):
+    """
+    Mark the reservation as written to DB after the order is committed,
+    it is held until the order is paid or cancelled.
+    """
+    conn.zrem(PENDING_KEY, order_number)
+
+
+def consume_reservation(order_number):
+    """ The order is paid, reserved units are sold """
+    pipe = conn.pipeline()
+    pipe.delete(reservation_key(order_number))
+    pipe.zrem(PENDING_KEY, order_number)
+    pipe.execute()
+
+
+def _release_args(order_number, items):
+    args = [order_number, available_key('')]
+    for sku_id, count in items or []:
+        args += [sku_id, count]
+    return args
+
+
+def release_reservation(order_number, items=None):
+    """
+    Put reserved units back to the counters, e.g. the order failed or is cancelled,
+    items as (sku_id, count) overrides the reservation, e.g. the reservation
+    of a paid order is already consumed. Return the number of released units.
+    """
+    return RELEASE_STOCK(keys=[reservation_key(order_number), PENDING_KEY],
+                         args=_release_args(order_number, items))
+
+
+def release_reservations(orders):
+    """
+    Release reservations of many orders in one round trip,
+    orders is a dict {order_number: [(sku_id, count)]}
+    """
+    pipe = conn.pipeline(transaction=False)
+    for order_number, items in orders.items():
+        RELEASE_STOCK(keys=[reservation_key(order_number), PENDING_KEY],
+                      args=_release_args(order_number, items), client=pipe)
+    return sum(pipe.execute())
+
+
+def get_reservation(order_number):
+    return {int(sku_id): int(count) for sku_id, count in
+            conn.hgetall(reservation_key(order_number)).items()}
+
+
+def reconcile_reservations(pending_timeout=PENDING_TIMEOUT):
+    """
+    Settle reservations left pending by crashed requests, confirm them if the
+    order is in DB, otherwise release them, then reset loaded counters from DB stock
+    less units still pending. Return (number of settled reservations, number of reset counters).
+    """
+    from .models import Order
+
+    stale = [number.decode() for number in conn.zrangebyscore(
+        PENDING_KEY, '-inf', time.time() - pending_timeout)]
+    placed = set(Order.objects.filter(
+        number__in=stale).values_list('number', flat=True))
+    for number in stale:
+        if number in placed:
+            confirm_reservation(number)
+        else:
+            release_reservation(number)
+
+    sku_ids = [int(key.decode().split('_')[-1])
+               for key in conn.scan_iter(match=available_key('*'))]
+    if not sku_ids:
+        return len(stale), 0
+    pending = {}
+    for number in conn.zrange(PENDING_KEY, 0, -1):
+        for sku_id, count in get_reservation(number.decode()).items():
+            pending[sku_id] = pending.get(sku_id, 0) + count
+    stocks = ProductSKU.objects.filter(
+        id__in=sku_ids).values_list('id', 'stock')
+    pipe = conn.pipeline()
+    # counters of removed products are dropped
+    pipe.delete(*[available_key(sku_id) for sku_id in sku_ids])
+    for sku_id, stock in stocks:
+        pipe.set(available_key(sku_id), max(stock - pending.get(sku_id, 0), 0))
+    pipe.execute()
+    return len(stale), len(sku_ids)
@@ -0,0 +1,42 @@
+from django.dispatch import receiver
+from django.db.models.signals import post_save, post_delete
+
+from shop.cache import invalidate_product_detail
+from shop.models import ProductSKU
+
+from .models import OrderProduct, Review
+
+
+@receiver(post_save, sender=OrderProduct)
+@receiver(post_delete, sender=OrderProduct)
+def invalidate_order_product(sender, instance, **kwargs):
+    invalidate_product_detail(instance.product_id)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_product_reviews(sender, instance, **kwargs):
+    """
+    Reviews are shown on the detail page of the reviewed product.
+    """
+    invalidate_product_detail(instance.order_product.product_id)
+
+
+@receiver(post_save, sender=Review)
+def add_review_stats(sender, instance, created, **kwargs):
+    """
+    Keep denormalized review stats of the product in the same transaction,
+    a changed review (e.g. from admin) is recounted from scratch.
+    """
+    product_id = instance.order_product.product_id
+    if created:
+        ProductSKU.objects.add_review_stats(product_id, int(instance.star))
+    else:
+        ProductSKU.objects.rebuild_review_stats(
+            ProductSKU._base_manager.filter(id=product_id))
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_stats(sender, instance, **kwargs):
+    ProductSKU.objects.add_review_stats(
+        instance.order_product.product_id, int(instance.star), delta=-1)
@@ -1,50 +1,179 @@
 
 from core.celery import app
+from django.db import transaction
+from django.db.models import F, Q
 from django_celery_beat.models import CrontabSchedule, PeriodicTask
-from datetime import timezone
+from datetime import datetime, timedelta, timezone
+from functools import partial
 
-from order.models import Payment, Order
-from account.tasks import send_order_email
+from order.models import Payment, Order, WebhookEvent, restore_orders_stock
+from order.reservations import consume_reservation, reconcile_reservations
+from account.tasks import send_order_email, send_order_emails
 
 import logging
 
 logger = logging.getLogger(__name__)
 
-# @app.task(name='order.mark_expired_payments')
+# rows locked and updated in one transaction
+BATCH_SIZE = 500
+
+
+def update_in_batches(queryset, batch_size=BATCH_SIZE, on_batch=None, **values):
+    """
+    Lock candidate rows of queryset in batches, skipping rows locked by another worker,
+    apply values with one UPDATE ... WHERE id IN per batch (update skips auto_now,
+    updated_at is set here), on_batch(ids) runs in the
+    same transaction. The values must move rows out of queryset, e.g. change status.
+    Return the number of updated rows.
+    """
+    updated = 0
+    while True:
+        with transaction.atomic():
+            ids = list(queryset.select_for_update(skip_locked=True, of=('self',))
+                       .order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return updated
+            updated += queryset.model.objects.filter(id__in=ids).update(
+                updated_at=datetime.now(timezone.utc), **values)
+            if on_batch is not None:
+                on_batch(ids)
+
+
+def queue_order_emails(order_ids, status):
+    """ Queue emails of orders after commit, in one batch """
+    emails = [(email, username, number, status) for email, username, number in
+              Order.objects.filter(id__in=order_ids).order_by().values_list(
+                  'user__email', 'user__username', 'number')]
+    transaction.on_commit(partial(send_order_emails.delay, emails))
 
 
+# @app.task(name='order.mark_expired_payments')
 @app.task
-def expire_payments():
-    payments = Payment.objects.filter(status='PD').all()
-    for payment in payments:
-        if payment.is_expired():
-            payment.expire_payment()
-            payment.save()
+def expire_payments(batch_size=BATCH_SIZE):
+    """
+    Expire pending payments in the window of Payment.is_expired,
+    clear the session like Payment.expire_payment
+    """
+    now = datetime.now(timezone.utc)
+    payments = Payment.objects.filter(
+        status='PD',
+        created_at__lt=now - Payment.EXPIRE_AFTER,
+        created_at__gt=now - Payment.AUTO_CANCEL_AFTER)
+    expired = update_in_batches(
+        payments, batch_size, status='EX', session_id='', number='')
+    logger.info(f'{expired} payments expired')
+    return expired
 
 
 # @app.task(name='order.mark_auto_canceled_orders')
 @app.task
-def auto_cancel_orders():
-    # payments = Payment.objects.filter(status__in=['EX','PD']).all()
-    orders = Order.objects.filter(status='NW').select_related('payment')
-    for order in orders:
-        if order.payment.is_auto_canceled():
-            order.auto_cancel()
-            order.save()
-            order.restore_product_stock()
-            send_order_email.delay(
-                order.user.email, order.user.username, order.number, order.status)
+def auto_cancel_orders(batch_size=BATCH_SIZE):
+    """
+    Cancel new orders of payments unpaid in the window of Payment.is_auto_canceled,
+    restore stock of each batch in one aggregated update per product
+    """
+    now = datetime.now(timezone.utc)
+    orders = Order.objects.filter(
+        status='NW', payment__status__in=['PD', 'EX'],
+        payment__created_at__lt=now - Payment.AUTO_CANCEL_AFTER)
+
+    def on_batch(ids):
+        restore_orders_stock(ids)
+        queue_order_emails(ids, 'CX')
+    cancelled = update_in_batches(orders, batch_size, on_batch, status='CX')
+    logger.info(f'{cancelled} orders auto cancelled')
+    return cancelled
+
+
+@app.task
+def reconcile_stock_reservations():
+    """
+    Settle reservations left by crashed checkout requests
+    and reset stock counters in redis from DB
+    """
+    settled, reset = reconcile_reservations()
+    logger.info(f'{settled} reservations settled, {reset} stock counters reset')
+    return settled, reset
+
+
+@app.task
+def auto_complete_orders(batch_size=BATCH_SIZE):
+    """ Complete shipped and returning orders in the window of Order.is_completed """
+    now = datetime.now(timezone.utc)
+    orders = Order.objects.filter(
+        Q(status='SP', created_at__lte=now - Order.COMPLETE_AFTER) |
+        Q(status='RT', return_at__lte=now - Order.RETURN_COMPLETE_AFTER))
+    completed = update_in_batches(
+        orders, batch_size, partial(queue_order_emails, status='CP'), status='CP')
+    logger.info(f'{completed} orders completed')
+    return completed
+
+
+def fulfill_order(intent_id):
+    """
+    Change payment status to succeeded, order status to confirmed,
+    run in the transaction of a webhook event, the payment row is locked,
+    so a concurrent event of the same payment waits and then skips it.
+    Return False if the payment is not pending.
+    """
+    payment = Payment.objects.select_for_update(of=('self',)).select_related(
+        'user').get(number=intent_id)
+    if payment.status != Payment.Status.PENDING:
+        return False
+    user = payment.user
+    payment.pay()
+    payment.save()
+    for order in payment.orders.all():
+        order.confirm()
+        order.save()  # status New to Confirmed
+        transaction.on_commit(partial(consume_reservation, order.number))
+        transaction.on_commit(partial(
+            send_order_email.delay, user.email, user.username, order.number, order.status))
+    return True
+
+
+@app.task(bind=True, max_retries=5, default_retry_delay=60)
+def process_webhook_event(self, webhook_event_id):
+    """
+    Process a saved webhook event once, the event row is locked for the
+    whole processing, a processed event is skipped. Failures are recorded
+    on the event and retried.
+    """
+    try:
+        with transaction.atomic():
+            event = WebhookEvent.objects.select_for_update().get(id=webhook_event_id)
+            if event.status == WebhookEvent.Status.PROCESSED:
+                return False
+            # Handle the checkout.session.completed event
+            if event.type == 'checkout.session.completed':
+                session = event.payload['data']['object']
+                fulfill_order(session['payment_intent'])
+            event.status = WebhookEvent.Status.PROCESSED
+            event.attempts = F('attempts') + 1
+            event.error = ''
+            event.processed_at = datetime.now(timezone.utc)
+            event.save()
+    except Exception as e:
+        logger.exception(f'webhook event {webhook_event_id} failed')
+        WebhookEvent.objects.filter(id=webhook_event_id).update(
+            status=WebhookEvent.Status.FAILED, attempts=F('attempts') + 1, error=str(e))
+        raise self.retry(exc=e)
+    return True
 
 
 @app.task
-def auto_complete_orders():
-    orders = Order.objects.filter(status__in=['SP', 'RT'])
-    for order in orders:
-        if order.is_completed():
-            order.complete()
-            order.save()
-            send_order_email.delay(
-                order.user.email, order.user.username, order.number, order.status)
+def requeue_webhook_events():
+    """
+    Queue events again which are left unprocessed, e.g. lost by the broker
+    or out of retries, stop after 10 attempts
+    """
+    before = datetime.now(timezone.utc) - timedelta(minutes=10)
+    event_ids = list(WebhookEvent.objects.filter(
+        status__in=[WebhookEvent.Status.RECEIVED, WebhookEvent.Status.FAILED],
+        created_at__lt=before, attempts__lt=10).values_list('id', flat=True))
+    for event_id in event_ids:
+        process_webhook_event.delay(event_id)
+    return len(event_ids)
 
 
 def create_one_time_task():
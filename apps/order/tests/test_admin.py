@@ -0,0 +1,57 @@
+from django.contrib.admin.sites import site
+from django.db.models.signals import post_save
+from django.test import RequestFactory, TestCase
+
+from types import SimpleNamespace
+from unittest import mock
+
+import factory
+
+from order.admin import OrderAdmin
+from order.models import Order
+from shop.models import ProductSKU
+from shop.tests.factory import SkuFactory
+from .factory import OrderFactory, OrderProductFactory
+
+
+class TestOrderAdmin(TestCase):
+
+    def setUp(self):
+        self.admin = OrderAdmin(Order, site)
+        with factory.django.mute_signals(post_save):
+            self.sku = SkuFactory(stock=5, sales=10)
+        self.orders = [
+            OrderFactory(status='CL', payment__status='EX') for _ in range(2)]
+        for order in self.orders:
+            OrderProductFactory(order=order, product=self.sku, count=2)
+
+    def cancel(self):
+        request = RequestFactory().post('/', {
+            '_selected': ','.join(str(order.id) for order in self.orders),
+            'refund': 'YES',
+            'amount': '100',
+        })
+        return self.admin.cancel_order(request, Order.objects.none())
+
+    def test_cancel_order_restores_stock(self):
+        refunded = SimpleNamespace(status='succeeded')
+        with mock.patch('order.models.get_gateway') as gateway:
+            gateway().create_refund.return_value = refunded
+            self.cancel()
+
+        self.assertEqual(
+            list(Order.objects.filter(id__in=[o.id for o in self.orders])
+                 .values_list('status', flat=True)), ['CX', 'CX'])
+        sku = ProductSKU.objects.get(id=self.sku.id)
+        self.assertEqual((sku.stock, sku.sales), (9, 6))
+
+    def test_failed_refund_rolls_back_cancellation(self):
+        statuses = [SimpleNamespace(status='succeeded'), SimpleNamespace(status='failed')]
+        with mock.patch('order.models.get_gateway') as gateway:
+            gateway().create_refund.side_effect = statuses
+            with self.assertRaises(Exception):
+                self.cancel()
+
+        self.assertFalse(Order.objects.filter(status='CX').exists())
+        sku = ProductSKU.objects.get(id=self.sku.id)
+        self.assertEqual((sku.stock, sku.sales), (5, 10))
@@ -0,0 +1,67 @@
+import json
+
+from django.test import TestCase
+
+from django_redis import get_redis_connection
+
+from order.gateways import FakeGateway, PaymentGateway, SignatureError, get_gateway
+
+
+class TestFakeGateway(TestCase):
+
+    def setUp(self):
+        self.gateway = FakeGateway()
+
+    def tearDown(self):
+        get_redis_connection('default').flushdb()
+
+    def create_session(self):
+        return self.gateway.create_checkout_session(
+            'card', 'test@example.com', 'matcha', 5500,
+            'http://testserver/order/success/?session_id={CHECKOUT_SESSION_ID}',
+            'http://testserver/')
+
+    def test_gateway_in_use(self):
+        self.assertIsInstance(get_gateway(), FakeGateway)
+
+    def test_incomplete_gateway_not_instantiated(self):
+        class SessionOnlyGateway(PaymentGateway):
+            def create_checkout_session(self, *args, **kwargs):
+                pass
+
+        with self.assertRaises(TypeError):
+            SessionOnlyGateway()
+
+    def test_create_checkout_session(self):
+        session = self.create_session()
+        self.assertTrue(session.id.startswith('cs_fake_'))
+        self.assertTrue(session.payment_intent.startswith('pi_fake_'))
+        self.assertEqual(session.amount_total, 5500)
+        self.assertTrue(session.success_url.endswith(session.id))
+
+    def test_completed_event_is_verified(self):
+        session = self.create_session()
+        payload, signature = self.gateway.complete_session(session.id)
+        event = self.gateway.construct_event(payload, signature)
+
+        self.assertEqual(event['type'], 'checkout.session.completed')
+        completed = event['data']['object']
+        self.assertEqual(completed.payment_intent, session.payment_intent)
+        self.assertEqual(completed.payment_status, 'paid')
+
+    def test_tampered_event_rejected(self):
+        session = self.create_session()
+        payload, signature = self.gateway.complete_session(session.id)
+        event = json.loads(payload)
+        event['data']['object']['amount_total'] = 1
+        with self.assertRaises(SignatureError):
+            self.gateway.construct_event(json.dumps(event), signature)
+
+    def test_complete_unknown_session(self):
+        with self.assertRaises(KeyError):
+            self.gateway.complete_session('cs_fake_missing')
+
+    def test_create_refund(self):
+        refund = self.gateway.create_refund('pi_fake_1', 500)
+        self.assertEqual(refund.status, 'succeeded')
+        self.assertEqual(refund.amount, 500)
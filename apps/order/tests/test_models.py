@@ -1,5 +1,6 @@
 from core.settings.base import DATABASES
 from django import utils
+from django.db import connection
 from django.test import TestCase
 from datetime import datetime, timezone, timedelta
 from django.db.models.signals import post_save
@@ -8,7 +9,8 @@ from django.test.utils import override_settings
 import factory
 
 from shop.tests.factory import SkuFactory
-from order.models import Order, Payment, OrderProduct, Review
+from order.models import Order, Payment, OrderProduct, Review, restore_orders_stock
+from shop.models import ProductSKU
 from account.tests.factory import UserFactory
 
 from ..utils import generate_order_number
@@ -79,16 +81,35 @@ class TestOrderModel(TestCase):
 
     def test_cancel_restore_product_stock(self):
         order = OrderFactory(status='CL')
-        sku = self.skus[0]
-        op = OrderProductFactory(product=sku)
+        sku = SkuFactory(stock=5, sales=3)
+        op = OrderProductFactory(product=sku, count=2)
         op.order = order
         op.save()
         order.confirm_cancel()
         order.restore_product_stock()
         sku.refresh_from_db()
         self.assertEqual(order.status, 'CX')
-        self.assertEqual(sku.stock, 6)
-        self.assertEqual(sku.sales, 0)
+        self.assertEqual(sku.stock, 7)
+        self.assertEqual(sku.sales, 1)
+
+    def test_restore_orders_stock_aggregated(self):
+        sku1 = SkuFactory(stock=5, sales=10)
+        sku2 = SkuFactory(stock=0, sales=10)
+        orders = [OrderFactory(status='CX') for _ in range(3)]
+        for order in orders:
+            # the same product twice in one order
+            OrderProductFactory(order=order, product=sku1, count=1)
+            OrderProductFactory(order=order, product=sku1, count=2)
+        OrderProductFactory(order=orders[0], product=sku2, count=4)
+
+        with self.assertNumQueries(2):
+            updated = restore_orders_stock([order.id for order in orders])
+
+        self.assertEqual(updated, 2)
+        sku1 = ProductSKU.objects.get(id=sku1.id)
+        sku2 = ProductSKU.objects.get(id=sku2.id)
+        self.assertEqual((sku1.stock, sku1.sales), (14, 1))
+        self.assertEqual((sku2.stock, sku2.sales), (4, 6))
 
 
 class TestPaymentModel(TestCase):
@@ -173,3 +194,44 @@ class TestReviewModel(TestCase):
         self.review.user = UserFactory(username='awesomeguy')
         self.assertEqual(str(self.review),
                          'review for awesome item by awesomeguy')
+
+
+class TestOrderIndexes(TestCase):
+    """
+    Check with EXPLAIN that order history and payment jobs are served by their indexes,
+    sequential scans are disabled since the test tables are tiny.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.order = OrderFactory()
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET enable_seqscan = off')
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            cursor.execute('RESET enable_seqscan')
+
+    def test_order_history_uses_index(self):
+        # account order list, newest first by Meta.ordering
+        plan = Order.objects.filter(
+            user=self.order.user, is_deleted=False)[:4].explain()
+        self.assertIn('order_order_user_history_idx', plan)
+        self.assertNotIn('Sort', plan)
+
+    def test_payment_jobs_use_index(self):
+        # candidates of expire_payments and auto_cancel_orders
+        now = datetime.now(timezone.utc)
+        expired = Payment.objects.filter(
+            status='PD',
+            created_at__lt=now - Payment.EXPIRE_AFTER,
+            created_at__gt=now - Payment.AUTO_CANCEL_AFTER).order_by('id')
+        cancelled = Order.objects.filter(
+            status='NW', payment__status__in=['PD', 'EX'],
+            payment__created_at__lt=now - Payment.AUTO_CANCEL_AFTER).order_by('id')
+        for queryset in [expired, cancelled]:
+            plan = queryset.select_for_update(
+                skip_locked=True, of=('self',)).values('id')[:500].explain()
+            self.assertIn('order_payment_status_idx', plan)
@@ -0,0 +1,89 @@
+from django.test import TestCase
+
+from django_redis import get_redis_connection
+
+from order.reservations import (
+    OK, UNDERSTOCKED, NOT_FOUND, PENDING_KEY, reserve_stock, confirm_reservation,
+    consume_reservation, release_reservation, get_reservation, reconcile_reservations,
+)
+from shop.models import ProductSKU
+from shop.tests.factory import SkuFactory
+from .factory import OrderFactory
+
+
+class TestStockReservation(TestCase):
+
+    def setUp(self):
+        self.conn = get_redis_connection('cart')
+        self.sku1 = SkuFactory(stock=5)
+        self.sku2 = SkuFactory(stock=2)
+
+    def tearDown(self):
+        self.conn.flushdb()
+
+    def available(self, sku):
+        return int(self.conn.get(f'available_{sku.id}'))
+
+    def test_reserve_all_items(self):
+        status, sku_id = reserve_stock(
+            '001', [(self.sku1.id, 3), (self.sku2.id, 2)])
+        self.assertEqual((status, sku_id), (OK, None))
+        self.assertEqual(self.available(self.sku1), 2)
+        self.assertEqual(self.available(self.sku2), 0)
+        self.assertEqual(get_reservation('001'), {
+                         self.sku1.id: 3, self.sku2.id: 2})
+        self.assertIsNotNone(self.conn.zscore(PENDING_KEY, '001'))
+        self.assertGreater(self.conn.ttl('reservation_001'), 0)
+
+    def test_reserve_none_if_any_understocked(self):
+        reserve_stock('001', [(self.sku2.id, 2)])
+        status, sku_id = reserve_stock(
+            '002', [(self.sku1.id, 1), (self.sku2.id, 1)])
+        self.assertEqual((status, sku_id), (UNDERSTOCKED, self.sku2.id))
+        self.assertEqual(self.available(self.sku1), 5)
+        self.assertEqual(get_reservation('002'), {})
+
+    def test_reserve_item_not_found(self):
+        status, sku_id = reserve_stock('001', [(self.sku1.id, 1), (9999, 1)])
+        self.assertEqual((status, sku_id), (NOT_FOUND, 9999))
+
+    def test_counters_loaded_once(self):
+        with self.assertNumQueries(1):
+            reserve_stock('001', [(self.sku1.id, 1)])
+            reserve_stock('002', [(self.sku1.id, 1)])
+        self.assertEqual(self.available(self.sku1), 3)
+
+    def test_release_reservation(self):
+        reserve_stock('001', [(self.sku1.id, 3)])
+        self.assertEqual(release_reservation('001'), 3)
+        self.assertEqual(self.available(self.sku1), 5)
+        self.assertFalse(self.conn.exists('reservation_001'))
+        self.assertIsNone(self.conn.zscore(PENDING_KEY, '001'))
+
+    def test_release_consumed_reservation_with_items(self):
+        reserve_stock('001', [(self.sku1.id, 3)])
+        confirm_reservation('001')
+        consume_reservation('001')
+        self.assertEqual(release_reservation('001'), 0)
+        self.assertEqual(self.available(self.sku1), 2)
+        self.assertEqual(release_reservation('001', [(self.sku1.id, 3)]), 3)
+        self.assertEqual(self.available(self.sku1), 5)
+
+    def test_reconcile_stale_pending_reservations(self):
+        order = OrderFactory()
+        reserve_stock(order.number, [(self.sku1.id, 1)])
+        reserve_stock('lost', [(self.sku1.id, 2)])
+        ProductSKU.objects.filter(id=self.sku1.id).update(stock=4)
+        self.assertEqual(reconcile_reservations(pending_timeout=-1), (2, 1))
+        # placed order is confirmed and kept, the lost one is released
+        self.assertEqual(get_reservation(order.number), {self.sku1.id: 1})
+        self.assertEqual(get_reservation('lost'), {})
+        self.assertEqual(self.conn.zcard(PENDING_KEY), 0)
+        self.assertEqual(self.available(self.sku1), 4)
+
+    def test_reconcile_keeps_units_in_flight(self):
+        reserve_stock('001', [(self.sku1.id, 2)])
+        self.conn.set(f'available_{self.sku2.id}', 0)
+        self.assertEqual(reconcile_reservations(), (0, 2))
+        self.assertEqual(self.available(self.sku1), 3)
+        self.assertEqual(self.available(self.sku2), 2)
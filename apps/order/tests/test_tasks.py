@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta, timezone
+
+from django.test import TestCase
+
+from django_redis import get_redis_connection
+
+from order.models import Order, Payment
+from order.tasks import expire_payments, auto_cancel_orders, auto_complete_orders
+from shop.models import ProductSKU
+from shop.tests.factory import SkuFactory
+from .factory import OrderFactory, OrderProductFactory, PaymentFactory
+
+
+def hours_ago(hours):
+    return datetime.now(timezone.utc) - timedelta(hours=hours)
+
+
+class TestBulkOrderJobs(TestCase):
+
+    def tearDown(self):
+        get_redis_connection('cart').flushdb()
+        get_redis_connection('default').flushdb()
+
+    def test_expire_payments_in_window(self):
+        recent = PaymentFactory(number='pi_1', session_id='cs_1')
+        expiring = [PaymentFactory(number='pi_2', session_id='cs_2')
+                    for _ in range(3)]
+        overdue = PaymentFactory()
+        Payment.objects.filter(id__in=[p.id for p in expiring]).update(
+            created_at=hours_ago(24))
+        Payment.objects.filter(id=overdue.id).update(created_at=hours_ago(49))
+
+        self.assertEqual(expire_payments(batch_size=2), 3)
+
+        self.assertEqual(Payment.objects.get(id=recent.id).status, 'PD')
+        self.assertEqual(Payment.objects.get(id=overdue.id).status, 'PD')
+        for payment in Payment.objects.filter(id__in=[p.id for p in expiring]):
+            self.assertEqual(payment.status, 'EX')
+            self.assertEqual((payment.number, payment.session_id), ('', ''))
+
+    def test_auto_cancel_orders_restores_stock(self):
+        sku1 = SkuFactory(stock=5, sales=10)
+        sku2 = SkuFactory(stock=5, sales=10)
+        orders = [OrderFactory() for _ in range(3)]
+        kept = OrderFactory()
+        for order in orders + [kept]:
+            OrderProductFactory(order=order, product=sku1, count=2)
+        OrderProductFactory(order=orders[0], product=sku2, count=3)
+        Payment.objects.filter(id__in=[o.payment_id for o in orders]).update(
+            created_at=hours_ago(49))
+
+        # per batch: lock, update orders, read order products, restore stock,
+        # read emails, plus savepoints, and the last empty batch
+        with self.assertNumQueries(7 + 7 + 3):
+            self.assertEqual(auto_cancel_orders(batch_size=2), 3)
+
+        self.assertEqual(Order.objects.filter(status='CX').count(), 3)
+        self.assertEqual(Order.objects.get(id=kept.id).status, 'NW')
+        sku1 = ProductSKU.objects.get(id=sku1.id)
+        sku2 = ProductSKU.objects.get(id=sku2.id)
+        self.assertEqual((sku1.stock, sku1.sales), (11, 4))
+        self.assertEqual((sku2.stock, sku2.sales), (8, 7))
+
+    def test_auto_complete_orders(self):
+        shipped = OrderFactory(status='SP')
+        returning = OrderFactory(status='RT', return_at=hours_ago(24 * 31))
+        recent = OrderFactory(status='SP')
+        Order.objects.filter(id=shipped.id).update(created_at=hours_ago(24 * 33))
+
+        self.assertEqual(auto_complete_orders(), 2)
+
+        self.assertEqual(Order.objects.get(id=shipped.id).status, 'CP')
+        self.assertEqual(Order.objects.get(id=returning.id).status, 'CP')
+        self.assertEqual(Order.objects.get(id=recent.id).status, 'SP')
@@ -1,4 +1,5 @@
 from datetime import datetime
+from unittest import mock
 from django.test import TestCase, Client
 from django.test.client import FakePayload
 from django.urls import reverse
@@ -12,7 +13,9 @@ from account.tests.factory import UserFactory, AddressFactory
 from shop.tests.factory import SkuFactory
 from order.tests.factory import OrderFactory, OrderProductFactory, PaymentFactory
 from order.views import (OrderProcessView, PaymentSuccessView)
-from order.models import Order, Payment, OrderProduct, Review
+from order.models import Order, Payment, OrderProduct, Review, WebhookEvent
+from order.tasks import fulfill_order, process_webhook_event
+from order.reservations import reserve_stock
 from shop.models import ProductSKU
 
 
@@ -168,6 +171,63 @@ class TestOrderProcessView(TestCase):
         self.assertEqual(
             str(msg[0]), f'Item {understock_sku.name} understocked')
 
+    def test_stock_reserved_by_other_order(self):
+        self.client.force_login(self.user)
+        sku = SkuFactory(price=5000, stock=2)
+        self.conn.hset(self.key, sku.id, 2)
+        reserve_stock('001', [(sku.id, 1)])
+
+        res = self.client.post(self.url, data=self.payload,
+                               content_type=self.content_type)
+        res_data = res.json()
+
+        self.assertEqual(res_data['res'], 0)
+        self.assertEqual(res_data['errmsg'], f'Item {sku.name} understocked')
+        self.assertEqual(Order.objects.count(), 0)
+
+    @mock.patch('order.views.create_checkout_session', side_effect=Exception)
+    def test_reservation_released_on_failure(self, mocked_session):
+        self.client.force_login(self.user)
+        sku = SkuFactory(price=5000, stock=2)
+        self.conn.hset(self.key, sku.id, 2)
+        order_products = OrderProduct.objects.count()
+
+        res = self.client.post(self.url, data=self.payload,
+                               content_type=self.content_type)
+        res_data = res.json()
+
+        self.assertEqual(res_data['res'], 0)
+        self.assertEqual(res_data['errmsg'], 'Failed to create payment session')
+        # placed order is revoked, stock and cart are kept
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(Payment.objects.count(), 0)
+        self.assertEqual(OrderProduct.objects.count(), order_products)
+        self.assertEqual(ProductSKU.objects.get(id=sku.id).stock, 2)
+        self.assertEqual(ProductSKU.objects.get(id=sku.id).sales, sku.sales)
+        self.assertEqual(self.conn.get(f'available_{sku.id}'), b'2')
+        self.assertEqual(self.conn.zcard('reservations_pending'), 0)
+        self.assertEqual(self.conn.hget(self.key, sku.id), b'2')
+
+    @mock.patch('order.views.create_checkout_session')
+    def test_payment_session_attached_after_commit(self, mocked_session):
+        mocked_session.return_value = type(
+            'Session', (dict,), {'id': 'cs_1', 'payment_intent': 'pi_1'})()
+        self.client.force_login(self.user)
+        sku = SkuFactory(price=5000, stock=2)
+        self.conn.hset(self.key, sku.id, 2)
+
+        res = self.client.post(self.url, data=self.payload,
+                               content_type=self.content_type)
+
+        self.assertEqual(res.json()['res'], 1)
+        order = Order.objects.select_related('payment').get()
+        self.assertEqual(order.payment.status, 'PD')
+        self.assertEqual(order.payment.session_id, 'cs_1')
+        self.assertEqual(order.payment.number, 'pi_1')
+        self.assertEqual(order.payment.amount, order.total_amount)
+        self.assertEqual(ProductSKU.objects.get(id=sku.id).stock, 0)
+        self.assertEqual(self.conn.hlen(self.key), 0)
+
 
 class TestPaymentSuccessView(TestCase):
 
@@ -230,6 +290,104 @@ class TestPaymentSuccessView(TestCase):
     # TODO: test guest checkout redirect
 
 
+class TestCheckoutWebhook(TestCase):
+
+    def setUp(self) -> None:
+        self.client = Client()
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user = UserFactory()
+        cls.address = AddressFactory()
+        cls.conn = get_redis_connection('cart')
+        cls.payload = {'addr_id': cls.address.id,
+                       'payment_method': 'card'}
+
+    def tearDown(self) -> None:
+        get_redis_connection('cart').flushdb()
+        get_redis_connection('default').flushdb()
+
+    def place_order(self):
+        self.client.force_login(self.user)
+        sku = SkuFactory(price=5000, stock=2)
+        self.conn.hset(f'cart_{self.user.id}', sku.id, 1)
+        res = self.client.post(reverse('order:process'), data=self.payload,
+                               content_type='application/json')
+        return res.json()['session']['id']
+
+    def post_event(self, payload, signature):
+        return self.client.post(reverse('order:webhook'), data=payload,
+                                content_type='application/json',
+                                HTTP_STRIPE_SIGNATURE=signature)
+
+    def test_fake_checkout_fulfills_order(self):
+        session_id = self.place_order()
+        res = self.client.post(
+            reverse('order:fake-checkout', args=[session_id]))
+        event = res.json()
+
+        res = self.post_event(event['payload'], event['signature'])
+
+        # acknowledged before processing
+        self.assertEqual(res.status_code, 200)
+        webhook_event = WebhookEvent.objects.get()
+        self.assertEqual(webhook_event.type, 'checkout.session.completed')
+        self.assertEqual(webhook_event.status, 'RC')
+        self.assertEqual(Order.objects.get().status, 'NW')
+
+        self.assertTrue(process_webhook_event(webhook_event.id))
+        order = Order.objects.select_related('payment').get()
+        self.assertEqual(order.payment.status, 'SC')
+        self.assertEqual(order.status, 'CF')
+        webhook_event.refresh_from_db()
+        self.assertEqual(webhook_event.status, 'PC')
+        self.assertEqual(webhook_event.attempts, 1)
+
+    def test_retried_event_processed_once(self):
+        session_id = self.place_order()
+        event = self.client.post(
+            reverse('order:fake-checkout', args=[session_id])).json()
+
+        for _ in range(2):
+            res = self.post_event(event['payload'], event['signature'])
+            self.assertEqual(res.status_code, 200)
+        webhook_event = WebhookEvent.objects.get()
+
+        self.assertTrue(process_webhook_event(webhook_event.id))
+        self.assertFalse(process_webhook_event(webhook_event.id))
+        self.assertEqual(Order.objects.get().status, 'CF')
+
+    def test_payment_fulfilled_once(self):
+        session_id = self.place_order()
+        payment = Payment.objects.get()
+        # two events of the same payment, e.g. completed twice
+        for _ in range(2):
+            event = self.client.post(
+                reverse('order:fake-checkout', args=[session_id])).json()
+            self.post_event(event['payload'], event['signature'])
+
+        self.assertTrue(fulfill_order(payment.number))
+        self.assertFalse(fulfill_order(payment.number))
+        for webhook_event in WebhookEvent.objects.all():
+            self.assertTrue(process_webhook_event(webhook_event.id))
+        self.assertEqual(Payment.objects.get().status, 'SC')
+
+    def test_invalid_signature(self):
+        session_id = self.place_order()
+        event = self.client.post(
+            reverse('order:fake-checkout', args=[session_id])).json()
+
+        res = self.post_event(event['payload'], 't=1,v1=invalid')
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(Order.objects.get().status, 'NW')
+
+    def test_fake_checkout_session_not_found(self):
+        res = self.client.post(
+            reverse('order:fake-checkout', args=['cs_fake_missing']))
+        self.assertEqual(res.status_code, 404)
+
+
 class TestPaymentRenewView(TestCase):
     pass
 
@@ -379,6 +537,36 @@ class TestOrderCommentView(TestCase):
         self.assertEqual(Review.objects.count(), 1)
         # self.assertEqual(str(msg[0]), 'Comment submitted')
 
+    def test_delete_review(self):
+        op = OrderProductFactory(order=self.order)
+        payload = {'op_id': op.id, 'star': '4',
+                   'comment': 'good good item'}
+        self.client.force_login(self.user)
+        self.client.post(self.url, data=payload,
+                         content_type=self.content_type)
+        op.product.refresh_from_db()
+        self.assertEqual(op.product.review_star_4, 1)
+
+        res = self.client.delete(self.url, data={'op_id': op.id},
+                                 content_type=self.content_type)
+        op.product.refresh_from_db()
+
+        self.assertEqual(res.json(), {'res': '1', 'msg': 'Comment deleted'})
+        self.assertEqual(Review.objects.count(), 0)
+        self.assertEqual(op.product.review_count, 0)
+        self.assertEqual(op.product.review_avg, 0)
+
+    def test_invalid_star(self):
+        payload = {'op_id': self.op.id, 'star': '6',
+                   'comment': 'awesome product'}
+        self.client.force_login(self.user)
+        res = self.client.post(self.url, data=payload,
+                               content_type=self.content_type)
+
+        self.assertEqual(
+            res.json(), {'res': '0', 'errmsg': 'Invalid rating star'})
+        self.assertEqual(Review.objects.count(), 0)
+
     def test_comment_too_short(self):
         op = OrderProductFactory(order=self.order)
         payload = {'op_id': op.id, 'star': '5',
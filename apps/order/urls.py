@@ -1,6 +1,6 @@
 from django.urls import path
 from .views import (OrderProcessView, PaymentSuccessView, PaymentRenewView,
-                    checkout_webhook, OrderCancelView, OrderSearchView, OrderCommentView)
+                    checkout_webhook, fake_checkout, OrderCancelView, OrderSearchView, OrderCommentView)
 
 app_name = 'order'
 urlpatterns = [
@@ -11,4 +11,5 @@ urlpatterns = [
     path('comment/', OrderCommentView.as_view(), name='comment'),
     path('paymentrenew/', PaymentRenewView.as_view(), name='payment-renew'),
     path('webhook/', checkout_webhook, name='webhook'),
+    path('fake-checkout/<str:session_id>/', fake_checkout, name='fake-checkout'),
 ]
@@ -3,7 +3,7 @@ from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.db import transaction
 from django.db.models.query_utils import Q
-from django.http import JsonResponse, HttpResponse
+from django.http import Http404, JsonResponse, HttpResponse
 from django.shortcuts import render, redirect
 from django.urls.base import reverse
 from django.views.decorators.csrf import csrf_exempt
@@ -14,120 +14,98 @@ import json
 import logging
 from datetime import datetime, timedelta, timezone
 
-import stripe
 from django_redis import get_redis_connection
 
 from account.models import User
 from account.tasks import send_order_email
 from cart.cart import cal_shipping_fee, get_user_id, get_cart_all_in_order
+from cart.repository import invalidate_stock
+from shop.cache import invalidate_product_detail
 from shop.models import ProductSKU
 
+from . import reservations
+from .gateways import FakeGateway, SignatureError, get_gateway
 from .mixins import OrderProcessCheckMixin, OrderManagementMixin, OrderReviewDataMixin
-from .models import Order, Payment, OrderProduct, Review
+from .models import Order, Payment, OrderProduct, Review, WebhookEvent
+from .reservations import (
+    confirm_reservation, release_reservation, reserve_stock,
+)
+from .tasks import process_webhook_event
+from .utils import generate_order_number
 # from .tasks import create_one_time_task
 
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
 logger = logging.getLogger(__name__)
 
 
+class OrderProcessError(Exception):
+    """ Placing an order failed, the message is returned to the customer """
+
+
 class OrderProcessView(OrderProcessCheckMixin, View):
     """
     Customer click place order to send an ajax request,
     receive address and payment method only from request data,
     retrieve shopping cart data from redis and calculate price,
-    add lock when retrieve product data from DB (using pessimistic lock here),
-    create a stripe checkout session, response a json containing sessionId,
-    and in the frontend use the sessionId to redirect customer to stripe checkout
+    reserve stock in redis rather than locking product rows (see order.reservations).
+    Order is placed in two phases, so no transaction is open during a stripe request:
+    1. a short transaction creates the order with a pending payment and takes stock off,
+    product rows are locked only by the conditional stock update right before commit
+    2. create a stripe checkout session and attach it to the payment,
+    if it fails the order is revoked and the stock is put back.
+    Response a json containing sessionId, in the frontend
+    use the sessionId to redirect customer to stripe checkout.
     """
 
-    @transaction.atomic
     def post(self, request):
         # retreive data from request
         data = json.loads(request.body.decode())
         payment_method = data.get('payment_method')
         user, address = self.get_user_and_address()
-        # make transaction savepoint before changing any data in database
-        save_id = transaction.savepoint()
-        try:
-            # create an Order instance
-            order = Order.objects.create(
-                subtotal=0, user=user, address=address)
-            logger.info(f'order# {order.number} created')
-
-            # get shopping cart cart data
-            user_id = get_user_id(request)
-            conn = get_redis_connection('cart')
-            sku_ids, counts, ordering = get_cart_all_in_order(user_id)
-
-            # add lock when retrieve product data
-            try:
-                products = ProductSKU.objects.select_for_update().filter(
-                    id__in=sku_ids).order_by(ordering)
-            except ProductSKU.DoesNotExist:
-                transaction.savepoint_rollback(save_id)
-                return JsonResponse({'res': 0, 'errmsg': 'Item does not exist'})
-
-            for product, count in zip(products, counts):
-                if count > product.stock:
-                    transaction.savepoint_rollback(save_id)
-                    return JsonResponse({'res': 0, 'errmsg': f'Item {product.name} understocked'})
-                product.stock -= count
-                product.sales += count
-            # update products stock and sales
-            ProductSKU.objects.bulk_update(products, ['stock', 'sales'])
-            logger.info(f'order# {order.number} product stock, sales updated')
-
-            # create OrderProduct instance for earch product
-            OrderProduct.objects.bulk_create([
-                OrderProduct(order=order, product=product,
-                             count=count, unit_price=product.price)
-                for product, count in zip(products, counts)
-            ])
-            logger.info(f'order# {order.number} orderproducts created')
-
-            # update shipping fee and subtotal in order object
-            subtotal = sum([product.price*count for product,
-                            count in zip(products, counts)])
-            total_count = sum(counts)
-            shipping_fee = cal_shipping_fee(subtotal, total_count)
-            order.shipping_fee = shipping_fee
-            order.subtotal = subtotal
-            logger.info(
-                f'order# {order.number} subtotal, shipping fee updated ')
-
-            # create stripe checkout session, keep 1 item only
-            amount = order.total_amount
-            item_name = f'{products[0].name} ({len(products)} items in total)' \
-                if len(products) > 1 else f'{products[0].name}'
-
-            try:
-                session = create_checkout_session(
-                    user, payment_method, item_name, amount)
-            except:
-                transaction.savepoint_rollback(save_id)
-                return JsonResponse({'res': 0, 'errmsg': 'Failed to create payment session'})
-            logger.info(f'order# {order.number} checkout session created')
-
-            # create Payment instance
-            payment = Payment.objects.create(
-                number=session.payment_intent,
-                amount=amount,
-                method=payment_method,
-                user=user,
-                session_id=session.id
-            )
-            order.payment = payment
-            order.save()
-            logger.info(
-                f'order# {order.number} payment instance {payment.number} created')
 
-        except:
-            transaction.savepoint_rollback(save_id)
+        # get shopping cart cart data
+        user_id = get_user_id(request)
+        conn = get_redis_connection('cart')
+        sku_ids, counts, ordering = get_cart_all_in_order(user_id)
+        products = list(ProductSKU.objects.filter(
+            id__in=sku_ids).order_by(ordering))
+        if len(products) < len(sku_ids):
+            return JsonResponse({'res': 0, 'errmsg': 'Item does not exist'})
+
+        # reserve all items at once, buyers of the same product wait for no lock
+        number = generate_order_number()
+        items = list(zip(sku_ids, counts))
+        status, sku_id = reserve_stock(number, items)
+        if status == reservations.NOT_FOUND:
+            return JsonResponse({'res': 0, 'errmsg': 'Item does not exist'})
+        if status == reservations.UNDERSTOCKED:
+            name = next(p.name for p in products if p.id == sku_id)
+            return JsonResponse({'res': 0, 'errmsg': f'Item {name} understocked'})
+        logger.info(f'order# {number} stock reserved')
+
+        # phase 1
+        try:
+            order = self.place_order(
+                number, user, address, payment_method, products, counts)
+        except OrderProcessError as e:
+            release_reservation(number)
+            return JsonResponse({'res': 0, 'errmsg': str(e)})
+        except Exception:
+            logger.exception(f'order# {number} failed')
+            release_reservation(number)
             return JsonResponse({'res': 0, 'errmsg': 'Failed to create order'})
+        confirm_reservation(number)
+        # update skips signals, detail pages and carts use stock
+        invalidate_product_detail(*sku_ids)
+        invalidate_stock(*sku_ids)
 
-        # committ all changes to database
-        transaction.savepoint_commit(save_id)
+        # phase 2
+        try:
+            session = self.attach_payment_session(order, products)
+        except Exception:
+            logger.exception(f'order# {number} payment session failed')
+            self.revoke_order(order, items)
+            return JsonResponse({'res': 0, 'errmsg': 'Failed to create payment session'})
 
         # clear shopping cart in the end
         conn.hdel(f'cart_{user_id}', *sku_ids)
@@ -142,6 +120,73 @@ class OrderProcessView(OrderProcessCheckMixin, View):
 
         return JsonResponse({'res': 1, 'msg': 'Order created', 'session': session})
 
+    @transaction.atomic
+    def place_order(self, number, user, address, payment_method, products, counts):
+        """
+        Create the order, order products and a pending payment without session,
+        then take stock off, make no network request in here.
+        """
+        # update shipping fee and subtotal in order object
+        subtotal = sum([product.price*count for product,
+                        count in zip(products, counts)])
+        total_count = sum(counts)
+        shipping_fee = cal_shipping_fee(subtotal, total_count)
+        payment = Payment.objects.create(
+            amount=subtotal + shipping_fee,
+            method=payment_method,
+            user=user,
+        )
+        order = Order.objects.create(
+            number=number, subtotal=subtotal, shipping_fee=shipping_fee,
+            user=user, address=address, payment=payment)
+        logger.info(
+            f'order# {order.number} created with pending payment {payment.id}')
+
+        # create OrderProduct instance for earch product
+        OrderProduct.objects.bulk_create([
+            OrderProduct(order=order, product=product,
+                         count=count, unit_price=product.price)
+            for product, count in zip(products, counts)
+        ])
+        logger.info(f'order# {order.number} orderproducts created')
+
+        # take stock off at last, row locks are held only until commit
+        items = [(product.id, count) for product, count in zip(products, counts)]
+        if not ProductSKU.objects.deduct_stock(items):
+            raise OrderProcessError('Item understocked')
+        logger.info(f'order# {order.number} product stock, sales updated')
+        return order
+
+    def attach_payment_session(self, order, products):
+        # create stripe checkout session, keep 1 item only
+        payment = order.payment
+        item_name = f'{products[0].name} ({len(products)} items in total)' \
+            if len(products) > 1 else f'{products[0].name}'
+        session = create_checkout_session(
+            order.user, payment.method, item_name, payment.amount)
+        logger.info(f'order# {order.number} checkout session created')
+        payment.attach_session(session)
+        logger.info(
+            f'order# {order.number} payment instance {payment.number} created')
+        return session
+
+    def revoke_order(self, order, items):
+        """
+        Compensate a placed order which cannot be paid, the customer never sees it,
+        delete it and put the stock back, the cart is kept to try again.
+        """
+        with transaction.atomic():
+            ProductSKU.objects.restock(items)
+            payment = order.payment
+            # order products are kept (SET_NULL) when an order is deleted
+            order.order_products.all().delete()
+            order.delete()
+            payment.delete()
+        release_reservation(order.number)
+        invalidate_product_detail(*[sku_id for sku_id, _ in items])
+        invalidate_stock(*[sku_id for sku_id, _ in items])
+        logger.info(f'order# {order.number} revoked')
+
 
 def create_checkout_session(user, payment_method, item_name, amount):
     domain = settings.DOMAIN
@@ -150,29 +195,11 @@ def create_checkout_session(user, payment_method, item_name, amount):
 
     if user.is_active:
         cancel_url = domain + reverse('account:order')
-    print('create session', user.is_active, success_url, cancel_url)
     try:
-        print('try session', payment_method, user.email, item_name, amount)
-        session = stripe.checkout.Session.create(
-            payment_method_types=[payment_method],
-            customer_email=user.email,
-            line_items=[{
-                'price_data': {
-                    'currency': 'jpy',
-                    'product_data': {
-                        'name': item_name,
-                    },
-                    'unit_amount': int(amount),
-                },
-                'quantity': 1,
-            }],
-            mode='payment',
-            success_url=success_url+'?session_id={CHECKOUT_SESSION_ID}',
-            cancel_url=cancel_url,
-        )
-        print('session', session)
-        return session
-    except:
+        return get_gateway().create_checkout_session(
+            payment_method, user.email, item_name, amount,
+            success_url+'?session_id={CHECKOUT_SESSION_ID}', cancel_url)
+    except Exception:
         raise Exception('Error on creating payment session')
 
 
@@ -209,46 +236,46 @@ class PaymentSuccessView(TemplateView):
 @require_POST
 @csrf_exempt
 def checkout_webhook(request):
-    print('event received, processing...')
-    endpoint_secret = settings.WEBHOOK_SECRET
     payload = request.body
     sig_header = request.META['HTTP_STRIPE_SIGNATURE']
     event = None
-    # print('webhook', payload, sig_header, endpoint_secret)
     try:
-        event = stripe.Webhook.construct_event(
-            payload, sig_header, endpoint_secret
-        )
-        print(event['type'])
-    except ValueError as e:
-        # Invalid payload
-        print('invalid payload')
+        event = get_gateway().construct_event(payload, sig_header)
+    except ValueError:
+        logger.warning('webhook event rejected, invalid payload')
         return HttpResponse(status=400)
-    except stripe.error.SignatureVerificationError as e:
-        # Invalid signature
-        print('invalid signature')
+    except SignatureError:
+        logger.warning('webhook event rejected, invalid signature')
         return HttpResponse(status=400)
-
-    # Handle the checkout.session.completed event
-    if event['type'] == 'checkout.session.completed':
-        session = event['data']['object']
-        fulfill_order(session.payment_intent)
-    # Passed signature verification
+    logger.info(f"webhook event {event['id']} {event['type']} received")
+
+    # Passed signature verification, save the event and acknowledge at once,
+    # a retried event is saved only once, it is processed from celery queue
+    webhook_event, created = WebhookEvent.objects.get_or_create(
+        event_id=event['id'],
+        defaults={'type': event['type'], 'payload': json.loads(payload)})
+    if created:
+        transaction.on_commit(
+            lambda: process_webhook_event.delay(webhook_event.id))
     return HttpResponse(status=200)
 
 
-def fulfill_order(intent_id):
-    # change payment status to succeeded, order status to confirmed
-    payment = Payment.objects.prefetch_related('orders').select_related('user').get(
-        number=intent_id)
-    user = payment.user
-    payment.pay()
-    payment.save()
-    for order in payment.orders.all():
-        order.confirm()
-        order.save()  # status New to Confirmed
-        send_order_email.delay(user.email, user.username,
-                               order.number, order.status)
+@require_POST
+@csrf_exempt
+def fake_checkout(request, session_id):
+    """
+    Pay a session created by the fake gateway, stands for the stripe checkout page
+    in load tests, response the signed checkout.session.completed event,
+    which the client posts to the webhook
+    """
+    gateway = get_gateway()
+    if not isinstance(gateway, FakeGateway):
+        raise Http404
+    try:
+        payload, signature = gateway.complete_session(session_id)
+    except KeyError:
+        raise Http404
+    return JsonResponse({'res': 1, 'payload': payload, 'signature': signature})
 
 
 class PaymentRenewView(LoginRequiredMixin, View):
@@ -382,13 +409,28 @@ class OrderSearchView(ListView):
 
 
 class OrderCommentView(OrderReviewDataMixin, View):
+    """
+    Create or delete a review of a purchased item, review stats of the
+    product are updated by signals in the same transaction.
+    """
 
     def update(self, request, *args, **kwargs):
         pass
 
+    @transaction.atomic
     def delete(self, request, *args, **kwargs):
-        pass
+        data = json.loads(request.body.decode())
+        op_id = data.get('op_id')
+        try:
+            review = Review.objects.select_related('order_product').get(
+                order_product_id=op_id, order_product__order__user=request.user)
+        except Review.DoesNotExist:
+            return JsonResponse({'res': '0', 'errmsg': 'Review does not exist'})
 
+        review.delete()
+        return JsonResponse({'res': '1', 'msg': 'Comment deleted'})
+
+    @transaction.atomic
     def post(self, request, *args, **kwargs):
         data = json.loads(request.body.decode())
         op_id = data.get('op_id')
@@ -396,7 +438,8 @@ class OrderCommentView(OrderReviewDataMixin, View):
 
         Review.objects.create(
             order_product=order_product,
-            star=data['star'],
-            comment=data['comment']
+            star=int(data['star']),
+            comment=data['comment'],
+            user=request.user
         )
         return JsonResponse({'res': '1', 'msg': 'Comment submitted'})
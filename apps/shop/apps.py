@@ -4,5 +4,5 @@ from django.apps import AppConfig
 class ShopConfig(AppConfig):
     name = 'shop'
 
-    # def ready(self) -> None:
-    #     import shop.signals
+    def ready(self) -> None:
+        import shop.signals
@@ -0,0 +1,214 @@
+from django.core.cache import cache
+from django.db.models import Case, When
+
+import hashlib
+import time
+
+from django_redis import get_redis_connection
+
+CATALOG_VERSION_KEY = 'catalog_version'
+CATEGORY_VERSION_KEY = 'category_version'
+CATEGORY_TREE_TIMEOUT = 60 * 60 * 24
+SEARCH_RESULT_TIMEOUT = 60 * 15
+PRODUCT_DETAIL_TIMEOUT = 60 * 60
+TRENDING_PRODUCTS_KEY = 'trending_products'
+# marks a computed but empty trending set, redis does not keep empty sets
+TRENDING_EMPTY_KEY = 'trending_products_empty'
+# refreshed by celery beat every 10 minutes, kept longer in case a run is missed
+TRENDING_PRODUCTS_TIMEOUT = 60 * 30
+RECOMMENDATIONS_KEY = 'product_recommendations'
+
+
+def get_version(key):
+    """
+    Return current version stored under key, cached data are keyed by it.
+    The version starts from a timestamp, so that a version lost by eviction
+    will not collide with the keys of older data.
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time()), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    """
+    Invalidate all data cached under the version by moving to a new one,
+    old entries are left to expire by their timeout.
+    """
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = int(time.time())
+        cache.set(key, version, None)
+        return version
+
+
+def get_catalog_version():
+    """ Version of cached product lists """
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    return bump_version(CATALOG_VERSION_KEY)
+
+
+def get_category_tree(queryset_func):
+    """
+    Return the list of all categories in tree order, cached under
+    the category version, recursetree can render it without queries.
+    """
+    key = f'category_tree_{get_version(CATEGORY_VERSION_KEY)}'
+    categories = cache.get(key)
+    if categories is None:
+        categories = list(queryset_func())
+        cache.set(key, categories, CATEGORY_TREE_TIMEOUT)
+    return categories
+
+
+def bump_category_version():
+    return bump_version(CATEGORY_VERSION_KEY)
+
+
+def search_result_key(search='', category='', tags=(), sorting='', facets=None,
+                      tags_match_all=True):
+    """
+    Normalize the list filters into a cache key, search text is case and
+    whitespace insensitive, hashed to keep the key short.
+    """
+    search = ' '.join(search.lower().split())
+    tags = ('+' if tags_match_all else ',').join(sorted(tags))
+    facets = [f'{name}={value}' for name, value in sorted((facets or {}).items())]
+    raw = '|'.join([search, category, tags, sorting, *facets])
+    digest = hashlib.md5(raw.encode('utf-8')).hexdigest()
+    return f'search_{get_catalog_version()}_{digest}'
+
+
+def get_search_result_ids(key, queryset_func):
+    """
+    Return the ranked id list cached under key, on a miss call queryset_func
+    to build the queryset, evaluate ids only and cache them.
+    """
+    sku_ids = cache.get(key)
+    if sku_ids is None:
+        queryset = queryset_func().prefetch_related(None)
+        sku_ids = list(queryset.values_list('id', flat=True))
+        cache.set(key, sku_ids, SEARCH_RESULT_TIMEOUT)
+    return sku_ids
+
+
+def get_facet_counts(key, counts_func):
+    """
+    Return the facet counts of the result set cached under key,
+    on a miss call counts_func to aggregate and cache them.
+    """
+    key = f'facets_{key}'
+    facets = cache.get(key)
+    if facets is None:
+        facets = counts_func()
+        cache.set(key, facets, SEARCH_RESULT_TIMEOUT)
+    return facets
+
+
+def product_detail_key(sku_id):
+    return f'product_detail_{sku_id}'
+
+
+def get_product_detail(sku_id, payload_func):
+    """
+    Read through cache for the detail page payload of a product,
+    on a miss call payload_func to build it, an exception raised
+    by payload_func (e.g. Http404) is not cached.
+    """
+    key = product_detail_key(sku_id)
+    payload = cache.get(key)
+    if payload is None:
+        payload = payload_func()
+        cache.set(key, payload, PRODUCT_DETAIL_TIMEOUT)
+    return payload
+
+
+def invalidate_product_detail(*sku_ids):
+    if not sku_ids:
+        return
+    cache.delete_many([product_detail_key(sku_id) for sku_id in sku_ids])
+
+
+def get_related_product_ids(sku_id, queryset_func):
+    """
+    Related products depend on other products in the same category,
+    keep their ids under the catalog version rather than the detail payload.
+    """
+    key = f'product_related_{get_catalog_version()}_{sku_id}'
+    return get_search_result_ids(key, queryset_func)
+
+
+def get_recommended_product_ids(sku_id):
+    """
+    Return ids of products often bought with the product, most similar first,
+    computed offline by shop.recommendations, an empty list if there is none.
+    """
+    conn = get_redis_connection('default')
+    value = conn.hget(RECOMMENDATIONS_KEY, sku_id)
+    return [int(i) for i in value.split(b',')] if value else []
+
+
+def set_trending_product_ids(sku_ids):
+    """
+    Replace the trending products set atomically, readers never see
+    a partially written set. An empty result is cached as a marker,
+    so that readers do not recompute it on every request.
+    """
+    conn = get_redis_connection('default')
+    pipe = conn.pipeline()
+    if not sku_ids:
+        pipe.delete(TRENDING_PRODUCTS_KEY)
+        pipe.set(TRENDING_EMPTY_KEY, 1, ex=TRENDING_PRODUCTS_TIMEOUT)
+        pipe.execute()
+        return
+    temp_key = f'{TRENDING_PRODUCTS_KEY}_tmp'
+    pipe.delete(temp_key, TRENDING_EMPTY_KEY)
+    pipe.sadd(temp_key, *sku_ids)
+    pipe.expire(temp_key, TRENDING_PRODUCTS_TIMEOUT)
+    pipe.rename(temp_key, TRENDING_PRODUCTS_KEY)
+    pipe.execute()
+
+
+def get_random_trending_product_ids(count):
+    """
+    Return up to count distinct random ids from the trending products set,
+    None if the set has not been computed yet or has expired.
+    """
+    conn = get_redis_connection('default')
+    sku_ids = conn.srandmember(TRENDING_PRODUCTS_KEY, count)
+    if not sku_ids and not conn.exists(TRENDING_PRODUCTS_KEY, TRENDING_EMPTY_KEY):
+        return None
+    return [int(i) for i in sku_ids]
+
+
+class ProductIdList:
+    """
+    A lazy sequence over a cached id list, e.g. for the paginator, counting
+    is free and slicing fetches only the products in the slice,
+    in the same order as the id list.
+    """
+
+    def __init__(self, sku_ids, queryset):
+        self.sku_ids = sku_ids
+        self.queryset = queryset
+
+    def __len__(self):
+        return len(self.sku_ids)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            if index < 0:
+                index += len(self)
+            return self[index:index + 1][0]
+        sku_ids = self.sku_ids[index]
+        if not sku_ids:
+            return []
+        ordering = Case(*[When(pk=pk, then=pos)
+                          for pos, pk in enumerate(sku_ids)])
+        return list(self.queryset.filter(id__in=sku_ids).order_by(ordering))
@@ -0,0 +1,89 @@
+from django.core.cache import cache
+
+import uuid
+
+CATEGORY_INDEX_KEY = 'category_index'
+CATEGORY_INDEX_BUILD_KEY = 'category_index_build'
+CATEGORY_INDEX_TIMEOUT = 60 * 60 * 24
+
+_local_index = {'index': None}
+
+
+def build_category_index():
+    """
+    Walk the category tree once in (tree_id, lft) order, return a dict with
+        slugs: {slug: id}
+        descendants: {id: [id, ids of all descendants]}
+        breadcrumbs: {id: [(id, name, slug) from the root down to the category]}
+    and a random build id, so that a copy in process memory is checked by one redis read.
+    """
+    # imported here as models read the index
+    from .models import Category
+    nodes = list(Category.objects.order_by('tree_id', 'lft').values_list(
+        'id', 'name', 'slug', 'tree_id', 'lft', 'rght'))
+
+    slugs, descendants, breadcrumbs = {}, {}, {}
+    path = []
+    for i, (category_id, name, slug, tree_id, lft, rght) in enumerate(nodes):
+        slugs[slug] = category_id
+        # descendants are the following nodes of the same tree inside (lft, rght)
+        end = i + 1
+        while end < len(nodes) and nodes[end][3] == tree_id and nodes[end][4] < rght:
+            end += 1
+        descendants[category_id] = [node[0] for node in nodes[i:end]]
+        # ancestors are the open nodes on the path, closed ones are popped
+        while path and (path[-1][0] != tree_id or path[-1][1] < lft):
+            path.pop()
+        path.append((tree_id, rght, (category_id, name, slug)))
+        breadcrumbs[category_id] = [node for _, _, node in path]
+
+    return {
+        'build': uuid.uuid4().hex,
+        'slugs': slugs,
+        'descendants': descendants,
+        'breadcrumbs': breadcrumbs,
+    }
+
+
+def get_category_index():
+    """
+    Return the category index from process memory if it is the current build,
+    otherwise from redis, build it only if redis does not have it either.
+    """
+    build = cache.get(CATEGORY_INDEX_BUILD_KEY)
+    index = _local_index['index']
+    if build is not None and index is not None and index['build'] == build:
+        return index
+    index = cache.get(CATEGORY_INDEX_KEY) if build is not None else None
+    if index is None or index['build'] != build:
+        index = build_category_index()
+        cache.set_many({
+            CATEGORY_INDEX_KEY: index,
+            CATEGORY_INDEX_BUILD_KEY: index['build'],
+        }, CATEGORY_INDEX_TIMEOUT)
+    _local_index['index'] = index
+    return index
+
+
+def invalidate_category_index():
+    """
+    Drop the index after the tree is changed, other processes see
+    the build is gone on their next read and drop their copy.
+    """
+    cache.delete_many([CATEGORY_INDEX_KEY, CATEGORY_INDEX_BUILD_KEY])
+    _local_index['index'] = None
+
+
+def get_category_id(slug):
+    """ Return the id of the category with slug, None if not found """
+    return get_category_index()['slugs'].get(slug)
+
+
+def get_descendant_ids(category_id):
+    """ Return ids of the category and all of its descendants """
+    return get_category_index()['descendants'].get(category_id, [category_id])
+
+
+def get_breadcrumbs(category_id):
+    """ Return [(id, name, slug)] from the root down to the category, None if not found """
+    return get_category_index()['breadcrumbs'].get(category_id)
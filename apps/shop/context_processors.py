@@ -1,21 +1,38 @@
-from django_redis import get_redis_connection
+from django.utils.functional import SimpleLazyObject, new_method_proxy
+
 from cart.cart import get_user_id
+from cart.repository import get_cart_and_wishlist_count
 
+from .cache import get_category_tree
 from .models import Category
 
 
-def base_template_data_processor(request):
-    user_id = get_user_id(request)
-    categories = Category.objects.all()
+class LazyCount(SimpleLazyObject):
+    """
+    A lazy number which can be rendered in templates or cast to int
+    """
+    __int__ = new_method_proxy(int)
+
 
-    conn = get_redis_connection('cart')
-    cart_count = conn.hlen(f'cart_{user_id}')
-    wishlist_count = 0
-    if request.user.is_authenticated:
-        wishlist_count = conn.scard(f'wish_{user_id}')
+def get_request_counts(request):
+    """
+    Return (cart count, wishlist count) with one pipelined redis call,
+    memorized on the request as both counts are evaluated separately.
+    """
+    if not hasattr(request, '_cart_wishlist_count'):
+        # guest does not have a wishlist
+        request._cart_wishlist_count = get_cart_and_wishlist_count(
+            get_user_id(request), request.user.is_authenticated)
+    return request._cart_wishlist_count
 
+
+def base_template_data_processor(request):
+    """
+    All values are lazy, nothing is fetched unless a template renders it.
+    """
     return {
-        'wishlist_count': wishlist_count,
-        'cart_count': cart_count,
-        'categories': categories,
+        'wishlist_count': LazyCount(lambda: get_request_counts(request)[1]),
+        'cart_count': LazyCount(lambda: get_request_counts(request)[0]),
+        'categories': SimpleLazyObject(
+            lambda: get_category_tree(Category.objects.all)),
     }
@@ -0,0 +1,146 @@
+"""
+Faceted navigation of product lists, counts of tag, origin, brand, SPU and
+price bucket over the filtered products are aggregated in one grouped query with
+GROUPING SETS, and cached with the result ids under the catalog version.
+"""
+from django.core.exceptions import EmptyResultSet
+from django.db import connection
+
+from taggit.models import Tag
+
+from .models import Origin, ProductSKU, ProductSPU
+
+# upper bounds of price buckets in yen, the last bucket has no upper bound
+PRICE_BUCKETS = [1000, 3000, 5000, 10000]
+# query params of facet filters, tags are read by get_tag_filters
+FACETS = ['origin', 'brand', 'spu', 'price']
+FACET_LIMIT = 10
+# values of the tag_match param, products with all or any of the tags
+TAG_MATCHES = ['all', 'any']
+
+
+def price_bucket_range(bucket):
+    """ Return (lower, upper) bound of the price bucket, None if unbounded """
+    bounds = [None, *PRICE_BUCKETS, None]
+    return bounds[bucket], bounds[bucket + 1]
+
+
+def price_bucket_label(bucket):
+    lower, upper = price_bucket_range(bucket)
+    if lower is None:
+        return f'Under ¥{upper:,}'
+    if upper is None:
+        return f'¥{lower:,} and above'
+    return f'¥{lower:,} - ¥{upper:,}'
+
+
+def get_facet_filters(params):
+    """
+    Read facet filters from query params, invalid values are ignored,
+    return a dict of the facets in use.
+    """
+    filters = {}
+    for facet in FACETS:
+        value = params.get(facet, '')
+        if not value:
+            continue
+        if facet == 'brand':
+            filters[facet] = value
+            continue
+        try:
+            filters[facet] = int(value)
+        except ValueError:
+            continue
+    if not 0 <= filters.get('price', 0) <= len(PRICE_BUCKETS):
+        del filters['price']
+    return filters
+
+
+def get_tag_filters(params):
+    """
+    Read tags from the repeated tag param, names are normalized into slugs the way
+    taggit does, return (sorted unique slugs, match_all) of the tag_match param.
+    """
+    slugs = {Tag().slugify(tag) for tag in params.getlist('tag')}
+    slugs.discard('')
+    match_all = params.get('tag_match', TAG_MATCHES[0]) != 'any'
+    return sorted(slugs), match_all
+
+
+def filter_facets(queryset, filters):
+    if 'origin' in filters:
+        queryset = queryset.filter(origin=filters['origin'])
+    if 'brand' in filters:
+        queryset = queryset.filter(brand=filters['brand'])
+    if 'spu' in filters:
+        queryset = queryset.filter(spu=filters['spu'])
+    if 'price' in filters:
+        lower, upper = price_bucket_range(filters['price'])
+        if lower is not None:
+            queryset = queryset.filter(price__gte=lower)
+        if upper is not None:
+            queryset = queryset.filter(price__lt=upper)
+    return queryset
+
+
+def count_facets(queryset, limit=FACET_LIMIT):
+    """
+    Count products of the filtered queryset per facet value in one grouped query,
+    the filters are applied as a subquery, tags are read from the denormalized
+    tag_slugs column. Return {facet: [{'value', 'label', 'count'}]}, most common
+    values first, at most limit values per facet, price buckets in price order.
+    """
+    facets = {'tag': [], 'origin': [], 'brand': [], 'spu': [], 'price': []}
+    try:
+        filtered_sql, filtered_params = \
+            queryset.order_by().values('id').query.sql_with_params()
+    except EmptyResultSet:
+        # e.g. filtered by an empty id list, nothing to count
+        return facets
+    sql = f'''
+        SELECT GROUPING(tagged.slug), GROUPING(sku.origin_id), GROUPING(sku.brand),
+               GROUPING(sku.spu_id), tagged.slug, tag.name, sku.origin_id, origin.name,
+               sku.brand, sku.spu_id, spu.name, width_bucket(sku.price, %s::numeric[]),
+               COUNT(DISTINCT sku.id)
+        FROM {ProductSKU._meta.db_table} AS sku
+        JOIN {Origin._meta.db_table} AS origin ON origin.id = sku.origin_id
+        JOIN {ProductSPU._meta.db_table} AS spu ON spu.id = sku.spu_id
+        LEFT JOIN LATERAL unnest(sku.tag_slugs) AS tagged (slug) ON true
+        LEFT JOIN {Tag._meta.db_table} AS tag ON tag.slug = tagged.slug
+        WHERE sku.id IN ({filtered_sql})
+        GROUP BY GROUPING SETS (
+            (tagged.slug, tag.name), (sku.origin_id, origin.name), (sku.brand),
+            (sku.spu_id, spu.name), (width_bucket(sku.price, %s::numeric[]))
+        )
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [PRICE_BUCKETS, *filtered_params, PRICE_BUCKETS])
+        rows = cursor.fetchall()
+
+    for (no_tag, no_origin, no_brand, no_spu, tag_slug, tag, origin_id, origin,
+         brand, spu_id, spu, bucket, count) in rows:
+        if not no_tag:
+            # products without tags are grouped under null
+            if tag_slug is not None:
+                facets['tag'].append(
+                    {'value': tag_slug, 'label': tag or tag_slug, 'count': count})
+        elif not no_origin:
+            facets['origin'].append(
+                {'value': origin_id, 'label': origin, 'count': count})
+        elif not no_brand:
+            facets['brand'].append(
+                {'value': brand, 'label': brand, 'count': count})
+        elif not no_spu:
+            facets['spu'].append(
+                {'value': spu_id, 'label': spu, 'count': count})
+        else:
+            facets['price'].append(
+                {'value': bucket, 'label': price_bucket_label(bucket), 'count': count})
+
+    for facet, values in facets.items():
+        if facet == 'price':
+            values.sort(key=lambda value: value['value'])
+        else:
+            values.sort(key=lambda value: (-value['count'], str(value['label'])))
+            del values[limit:]
+    return facets
@@ -0,0 +1,38 @@
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.lookups import PostgresOperatorLookup
+from django.db.models import Aggregate, CharField, FloatField, Func
+
+
+@CharField.register_lookup
+class TrigramWordSimilar(PostgresOperatorLookup):
+    """
+    pg_trgm word similarity operator, `name %> 'text'` is true when the text
+    is similar to any word extent of name, can be served by a gin_trgm_ops index
+    """
+    lookup_name = 'trigram_word_similar'
+    postgres_operator = '%%>'
+
+
+class TrigramWordSimilarity(Func):
+    """
+    WORD_SIMILARITY(text, field), the argument order is reversed compared to TrigramSimilarity
+    """
+    function = 'WORD_SIMILARITY'
+    output_field = FloatField()
+
+    def __init__(self, expression, string, **extra):
+        super().__init__(string, expression, **extra)
+
+
+class PercentileCont(Aggregate):
+    """
+    Continuous percentiles of a column in one pass, return a list of floats,
+    e.g. PercentileCont('sales', [0.5, 0.9]) -> [median, 90th percentile]
+    """
+    function = 'PERCENTILE_CONT'
+    template = '%(function)s(ARRAY[%(fractions)s]) WITHIN GROUP (ORDER BY %(expressions)s)'
+
+    def __init__(self, expression, fractions, **extra):
+        fractions = ', '.join(str(float(fraction)) for fraction in fractions)
+        super().__init__(expression, fractions=fractions,
+                         output_field=ArrayField(FloatField()), **extra)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from shop.models import ProductSKU
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized review stats of all products in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='number of products updated per batch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = ProductSKU._base_manager.order_by('id')
+        ids = list(queryset.values_list('id', flat=True))
+
+        updated = 0
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start+batch_size]
+            updated += ProductSKU.objects.rebuild_review_stats(
+                queryset.filter(id__in=batch))
+        self.stdout.write(self.style.SUCCESS(
+            f'Review stats rebuilt for {updated} products'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from shop.models import ProductSKU
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized tag slugs of all products in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='number of products updated per statement')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = ProductSKU._base_manager.order_by('id')
+        ids = list(queryset.values_list('id', flat=True))
+
+        updated = 0
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start+batch_size]
+            updated += ProductSKU.objects.sync_tag_slugs(
+                queryset.filter(id__in=batch))
+        self.stdout.write(self.style.SUCCESS(
+            f'Tag slugs updated for {updated} products'))
@@ -1,14 +1,31 @@
-from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.contrib.postgres.fields import ArrayField
 from django.contrib.postgres.search import (
     SearchQuery, SearchRank, SearchVector, TrigramSimilarity,
 )
-from django.db.models import Manager, Q, Avg
-from django.db.models.expressions import ExpressionWrapper
-from django.db.models.fields import BooleanField
+from django.db import connection
+from django.db.models import (
+    Manager, Q, Case, CharField, Count, DecimalField, F, Func, OuterRef,
+    Subquery, Value, When,
+)
+from django.db.models.functions import Cast, Coalesce
 
+from collections import Counter
 from datetime import datetime, timedelta, timezone
 
-from django_redis import get_redis_connection
+from taggit.models import TaggedItem
+
+from .category_index import get_descendant_ids
+from .lookups import TrigramWordSimilarity
+from .stats import get_catalog_stats
+
+# weighted document used for product FTS, stored in ProductSKU.search_vector
+SEARCH_VECTOR = (
+    SearchVector('name', weight='A', config='english')
+    + SearchVector('detail', weight='B', config='english')
+    + SearchVector('summary', weight='C', config='english')
+)
 
 
 class SKUManager(Manager):
@@ -33,39 +50,28 @@ class SKUManager(Manager):
 
     def filter_category_products(self, category, queryset):
         """
-        Filter a queryset with a category, if the category has descendants,
+        Filter a queryset with a category (instance or id), if the category has descendants,
         all of the items in descendant catogories will be return.
-        NOTE: in this project a parent category will not have direct items,
-        therefore the second Q condition is not necessary
+        Descendant ids are read from the category index, no query is made.
         """
-        if category.get_descendant_count() > 0:
-            queryset = queryset.filter(
-                Q(category__in=category.get_descendants()) | Q(category=category))
+        category_id = getattr(category, 'id', category)
+        category_ids = get_descendant_ids(category_id)
+        if len(category_ids) > 1:
+            queryset = queryset.filter(category__in=category_ids)
         else:
-            queryset = queryset.filter(category=category)
+            queryset = queryset.filter(category=category_id)
         return queryset
 
-    def filter_wishlisted_products(self, user_id, queryset):
+    def filter_tags(self, queryset, slugs, match_all=True):
         """
-        Filter a queryset and dynamically add a boolean property 'wishlist' to
-        all items.
+        Filter a queryset with tag slugs on the denormalized tag_slugs column (GIN indexed),
+        products having all of the tags (@>) if match_all, otherwise any of them (&&).
         """
-        conn = get_redis_connection('cart')
-        wishlisted = conn.smembers(f'wish_{user_id}')
-        wishlisted = [int(i) for i in wishlisted]
-
-        queryset = queryset.annotate(wishlist=ExpressionWrapper(
-            Q(id__in=wishlisted),
-            output_field=BooleanField(),
-        ),)
-        return queryset
-
-        # NOTE: alternative solution:
-        # queryset = queryset.annotate(wishlist=Case(
-        #     When(id__in=wishlisted, then=Value(True)),
-        #     default=Value(False),
-        #     output_field=BooleanField(),
-        # ))
+        if not slugs:
+            return queryset
+        if match_all:
+            return queryset.filter(tag_slugs__contains=list(slugs))
+        return queryset.filter(tag_slugs__overlap=list(slugs))
 
     def get_products_with_review(self):
         """
@@ -83,49 +89,170 @@ class SKUManager(Manager):
         """
         Return products with most sales or new items
         """
-        avg_sales = self.aggregate(Avg('sales'))
+        avg_sales = get_catalog_stats()['avg_sales']
         date_range = (datetime.now(tz=timezone.utc)-timedelta(days=14))
         return self.get_queryset().filter(
             Q(created_at__gt=date_range) |
-            Q(sales__gt=avg_sales['sales__avg'])
+            Q(sales__gt=avg_sales)
+        )
+
+    def deduct_stock(self, items):
+        """
+        Take sold (sku_id, count) items off stock with conditional updates in id order,
+        return False if any product is understocked, the caller has to roll back.
+        Row locks are held from here until the transaction commits,
+        call it at the end of the transaction.
+        """
+        for sku_id, count in sorted(items):
+            updated = self.get_queryset().filter(id=sku_id, stock__gte=count).update(
+                stock=F('stock') - count, sales=F('sales') + count)
+            if not updated:
+                return False
+        return True
+
+    def restock(self, items):
+        """
+        Put (sku_id, count) items back to stock and take them off sales,
+        e.g. orders are revoked or cancelled. Counts of the same product are summed,
+        all products are updated by one UPDATE ... FROM (VALUES ...) statement,
+        including those off the shelf. Return the number of updated products.
+        """
+        totals = Counter()
+        for sku_id, count in items:
+            totals[sku_id] += count
+        if not totals:
+            return 0
+        values = ', '.join(['(%s, %s)'] * len(totals))
+        params = [value for item in sorted(totals.items()) for value in item]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                UPDATE {table} AS sku
+                SET stock = sku.stock + restored.count,
+                    sales = sku.sales - restored.count
+                FROM (VALUES {values}) AS restored (id, count)
+                WHERE sku.id = restored.id
+            """, params)
+            return cursor.rowcount
+
+    def add_review_stats(self, sku_id, star, delta=1):
+        """
+        Add (delta=1) or remove (delta=-1) a review with star to the
+        denormalized review stats of a product in a single UPDATE,
+        the average is calculated from the histogram in the same statement.
+        Call it in the transaction creating or deleting the review.
+        """
+        star_field = f'review_star_{star}'
+        star_sum = sum(F(f'review_star_{n}') * n for n in range(1, 6))
+        review_count = F('review_count') + delta
+        review_avg = Case(
+            # no review left
+            When(review_count__lte=-delta, then=Value(0)),
+            default=Cast(star_sum + star * delta, DecimalField(
+                max_digits=9, decimal_places=2)) / review_count,
+            output_field=DecimalField(max_digits=3, decimal_places=2),
         )
+        return self.model._base_manager.filter(id=sku_id).update(**{
+            'review_count': review_count,
+            'review_avg': review_avg,
+            star_field: F(star_field) + delta,
+        })
+
+    def rebuild_review_stats(self, queryset=None):
+        """
+        Recalculate the denormalized review stats from reviews,
+        for all products (including those off the shelf) if no queryset is given.
+        Return the number of updated rows.
+        """
+        if queryset is None:
+            queryset = self.model._base_manager.all()
+        star_fields = [f'review_star_{star}' for star in range(1, 6)]
+        products = queryset.prefetch_related(None).annotate(**{
+            f'{field}_count': Count('order_products__review', filter=Q(
+                order_products__review__star=star))
+            for star, field in enumerate(star_fields, start=1)
+        })
+        products = list(products)
+        for product in products:
+            histogram = [getattr(product, f'{field}_count')
+                         for field in star_fields]
+            for field, count in zip(star_fields, histogram):
+                setattr(product, field, count)
+            product.review_count = sum(histogram)
+            star_sum = sum(count * star for star,
+                           count in enumerate(histogram, start=1))
+            product.review_avg = round(
+                star_sum / product.review_count, 2) if product.review_count else 0
+        self.model._base_manager.bulk_update(
+            products, ['review_count', 'review_avg', *star_fields])
+        return len(products)
+
+    def update_search_vector(self, queryset=None):
+        """
+        Write the weighted search document into the stored search_vector column,
+        for all products (including those off the shelf) if no queryset is given.
+        Return the number of updated rows.
+        """
+        if queryset is None:
+            queryset = self.model._base_manager.all()
+        return queryset.update(search_vector=SEARCH_VECTOR)
+
+    def sync_tag_slugs(self, queryset=None):
+        """
+        Write the sorted slugs of product tags into the denormalized tag_slugs column,
+        for all products (including those off the shelf) if no queryset is given.
+        Return the number of updated rows.
+        """
+        if queryset is None:
+            queryset = self.model._base_manager.all()
+        content_type = ContentType.objects.get_for_model(self.model)
+        slugs = TaggedItem.objects.filter(
+            content_type=content_type, object_id=OuterRef('pk'),
+        ).values('object_id').annotate(
+            slugs=ArrayAgg('tag__slug', ordering='tag__slug')).values('slugs')
+        array = ArrayField(CharField(max_length=100))
+        return queryset.update(tag_slugs=Coalesce(
+            Subquery(slugs, output_field=array), Value([]), output_field=array))
+
+    def remove_tag_slug(self, slug):
+        """
+        Take a slug off the tag_slugs of all products having it, e.g. the tag is deleted,
+        return the number of updated rows.
+        """
+        array = ArrayField(CharField(max_length=100))
+        return self.model._base_manager.filter(tag_slugs__contains=[slug]).update(
+            tag_slugs=Func(F('tag_slugs'), Value(slug), function='array_remove',
+                           output_field=array))
 
     def search(self, search_text):
         """
         FTS for products, search in name, summary and detail.
+        Match against the stored search_vector column (GIN indexed),
+        the vector is written on save or by the update_search_vector command.
         """
-        search_vectors = (
-            SearchVector(
-                'name', weight='A', config='english'
-            )
-            + SearchVector(
-                StringAgg('detail', delimiter=' '),
-                weight='B',
-                config='english',
-            )
-            + SearchVector(
-                StringAgg('summary', delimiter=' '),
-                weight='C',
-                config='english',
-            )
-        )
         search_query = SearchQuery(
             search_text, config='english'
         )
-        search_rank = SearchRank(search_vectors, search_query)
+        search_rank = SearchRank(F('search_vector'), search_query)
         trigram_similarity = TrigramSimilarity(
             'name', search_text
         )
         queryset = self.get_queryset()\
-            .annotate(search=search_vectors)\
-            .filter(search=search_query)\
+            .filter(search_vector=search_query)\
             .annotate(rank=search_rank+trigram_similarity).order_by('-rank')
         return queryset
-        # not working when fiter search_vector with search_query,
-        # better to make use of vector field instead of on the fly
-        # qs = (
-        #     self.get_queryset()
-        #     .filter(search_vector=search_query)
-        #     .annotate(rank=search_rank + trigram_similarity)
-        #     .order_by('-rank')
-        # )
+
+    def suggest(self, search_text, limit=8):
+        """
+        Typo tolerant autocomplete on product names, matched with the trigram
+        word similarity operator backed by the gin_trgm_ops index on name.
+        Return a list of dicts with id, name and slug, most similar first.
+        """
+        similarity = TrigramWordSimilarity('name', Value(search_text))
+        return list(
+            self.get_queryset().prefetch_related(None)
+            .filter(name__trigram_word_similar=search_text)
+            .annotate(similarity=similarity)
+            .order_by('-similarity', '-sales')
+            .values('id', 'name', 'slug')[:limit]
+        )
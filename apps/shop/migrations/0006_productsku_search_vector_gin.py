@@ -0,0 +1,29 @@
+# Generated by Django 3.1.4 on 2026-10-18 12:00
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+
+def backfill_search_vector(apps, schema_editor):
+    ProductSKU = apps.get_model('shop', 'ProductSKU')
+    ProductSKU.objects.update(search_vector=(
+        SearchVector('name', weight='A', config='english')
+        + SearchVector('detail', weight='B', config='english')
+        + SearchVector('summary', weight='C', config='english')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_auto_20201203_2138'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productsku',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='shop_produc_search__884a4b_gin'),
+        ),
+        migrations.RunPython(backfill_search_vector, migrations.RunPython.noop),
+    ]
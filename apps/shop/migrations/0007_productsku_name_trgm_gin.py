@@ -0,0 +1,18 @@
+# Generated by Django 3.1.4 on 2026-10-18 12:30
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_productsku_search_vector_gin'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productsku',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='shop_sku_name_trgm_gin', opclasses=['gin_trgm_ops']),
+        ),
+    ]
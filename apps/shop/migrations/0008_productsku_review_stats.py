@@ -0,0 +1,73 @@
+# Generated by Django 3.1.4 on 2026-10-18 12:00
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_review_stats(apps, schema_editor):
+    ProductSKU = apps.get_model('shop', 'ProductSKU')
+    products = ProductSKU.objects.annotate(**{
+        f'star_{star}': Count('order_products__review', filter=Q(
+            order_products__review__star=star))
+        for star in range(1, 6)
+    })
+    for product in products:
+        histogram = [getattr(product, f'star_{star}') for star in range(1, 6)]
+        if not any(histogram):
+            continue
+        for star, count in enumerate(histogram, start=1):
+            setattr(product, f'review_star_{star}', count)
+        product.review_count = sum(histogram)
+        product.review_avg = round(sum(
+            count * star for star, count in enumerate(histogram, start=1)
+        ) / product.review_count, 2)
+        product.save(update_fields=[
+            'review_count', 'review_avg',
+            *[f'review_star_{star}' for star in range(1, 6)]])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0007_auto_20201222_2337'),
+        ('shop', '0007_productsku_name_trgm_gin'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productsku',
+            name='review_avg',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=3, verbose_name='average stars'),
+        ),
+        migrations.AddField(
+            model_name='productsku',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='review count'),
+        ),
+        migrations.AddField(
+            model_name='productsku',
+            name='review_star_1',
+            field=models.PositiveIntegerField(default=0, verbose_name='1 star reviews'),
+        ),
+        migrations.AddField(
+            model_name='productsku',
+            name='review_star_2',
+            field=models.PositiveIntegerField(default=0, verbose_name='2 star reviews'),
+        ),
+        migrations.AddField(
+            model_name='productsku',
+            name='review_star_3',
+            field=models.PositiveIntegerField(default=0, verbose_name='3 star reviews'),
+        ),
+        migrations.AddField(
+            model_name='productsku',
+            name='review_star_4',
+            field=models.PositiveIntegerField(default=0, verbose_name='4 star reviews'),
+        ),
+        migrations.AddField(
+            model_name='productsku',
+            name='review_star_5',
+            field=models.PositiveIntegerField(default=0, verbose_name='5 star reviews'),
+        ),
+        migrations.RunPython(backfill_review_stats, migrations.RunPython.noop),
+    ]
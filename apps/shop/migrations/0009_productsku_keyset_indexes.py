@@ -0,0 +1,25 @@
+# Generated by Django 3.1.4 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_productsku_review_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productsku',
+            index=models.Index(condition=models.Q(status='ON'), fields=['created_at', 'id'], name='shop_sku_on_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productsku',
+            index=models.Index(condition=models.Q(status='ON'), fields=['sales', 'id'], name='shop_sku_on_sales_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productsku',
+            index=models.Index(condition=models.Q(status='ON'), fields=['price', 'id'], name='shop_sku_on_price_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.4 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_productsku_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='productsku',
+            name='shop_produc_summary_f72e1d_idx',
+        ),
+        migrations.AddIndex(
+            model_name='productsku',
+            index=models.Index(condition=models.Q(status='ON'), fields=['category', 'created_at'], name='shop_sku_on_cat_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productsku',
+            index=models.Index(condition=models.Q(status='ON'), fields=['category', 'sales'], name='shop_sku_on_cat_sales_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productsku',
+            index=models.Index(condition=models.Q(status='ON'), fields=['category', 'price'], name='shop_sku_on_cat_price_idx'),
+        ),
+    ]
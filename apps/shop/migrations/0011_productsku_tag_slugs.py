@@ -0,0 +1,49 @@
+# Generated by Django 3.1.4 on 2026-10-18 12:00
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+def backfill_tag_slugs(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    content_type = ContentType.objects.filter(
+        app_label='shop', model='productsku').first()
+    if content_type is None:
+        # fresh database, no product is tagged yet
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('''
+            UPDATE shop_productsku AS sku
+            SET tag_slugs = tagged.slugs
+            FROM (
+                SELECT item.object_id, array_agg(tag.slug ORDER BY tag.slug) AS slugs
+                FROM taggit_taggeditem AS item
+                JOIN taggit_tag AS tag ON tag.id = item.tag_id
+                WHERE item.content_type_id = %s
+                GROUP BY item.object_id
+            ) AS tagged
+            WHERE sku.id = tagged.object_id
+        ''', [content_type.id])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('taggit', '0003_taggeditem_add_unique_index'),
+        ('shop', '0010_productsku_category_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productsku',
+            name='tag_slugs',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=100), blank=True, default=list, size=None, verbose_name='tag slugs'),
+        ),
+        migrations.AddIndex(
+            model_name='productsku',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['tag_slugs'], name='shop_sku_tag_slugs_gin'),
+        ),
+        migrations.RunPython(backfill_tag_slugs, migrations.RunPython.noop),
+    ]
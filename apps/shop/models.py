@@ -1,10 +1,10 @@
 
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
-from django.db.models import Avg
 from django.urls import reverse
-from django.utils.functional import cached_property
 from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
 
@@ -15,7 +15,9 @@ from mptt.models import MPTTModel, TreeForeignKey
 from taggit.managers import TaggableManager
 
 from db.base_model import BaseModel
+from .category_index import get_breadcrumbs
 from .managers import SKUManager
+from .stats import get_catalog_stats
 
 
 class Category(MPTTModel):
@@ -42,6 +44,10 @@ class Category(MPTTModel):
         return self.name
 
     def get_full_category_name(self):
+        breadcrumbs = get_breadcrumbs(self.id) if self.id else None
+        if breadcrumbs is not None:
+            return '/'.join(name for _, name, _ in breadcrumbs)
+        # not indexed yet, walk up the tree
         full_name = [self.name]
         parent = self.parent
         while parent is not None:
@@ -102,6 +108,9 @@ class ProductSKU(BaseModel):
     cover_img = models.ImageField(
         _("cover image"), upload_to='media/sku_cover/', blank=True, null=True)
     tags = TaggableManager(_("tags"))
+    # denormalized slugs of tags, maintained by SKUManager.sync_tag_slugs
+    tag_slugs = ArrayField(models.CharField(max_length=100),
+                           verbose_name=_("tag slugs"), default=list, blank=True)
     status = models.CharField(
         _("shelf status"), choices=Status.choices, default=Status.ON, max_length=3)
     origin = models.ForeignKey(Origin, verbose_name=_(
@@ -111,6 +120,15 @@ class ProductSKU(BaseModel):
     spu = models.ForeignKey(ProductSPU, verbose_name=_(
         "SPU"), on_delete=models.CASCADE, related_name='sku')
     search_vector = SearchVectorField(null=True)
+    # denormalized review stats, maintained by SKUManager.add_review_stats
+    review_count = models.PositiveIntegerField(_("review count"), default=0)
+    review_avg = models.DecimalField(
+        _("average stars"), max_digits=3, decimal_places=2, default=0)
+    review_star_1 = models.PositiveIntegerField(_("1 star reviews"), default=0)
+    review_star_2 = models.PositiveIntegerField(_("2 star reviews"), default=0)
+    review_star_3 = models.PositiveIntegerField(_("3 star reviews"), default=0)
+    review_star_4 = models.PositiveIntegerField(_("4 star reviews"), default=0)
+    review_star_5 = models.PositiveIntegerField(_("5 star reviews"), default=0)
     # future update for promotion discount
     # promotion = models.ForeignKey("app.Model", verbose_name=_(""), on_delete=models.CASCADE)
 
@@ -123,7 +141,24 @@ class ProductSKU(BaseModel):
         get_latest_by = ('created_at',)
         indexes = [
             models.Index(fields=['name', ]),
-            models.Index(fields=['summary', 'detail', ]),
+            GinIndex(fields=['search_vector', ]),
+            GinIndex(fields=['tag_slugs', ], name='shop_sku_tag_slugs_gin'),
+            GinIndex(fields=['name', ], name='shop_sku_name_trgm_gin',
+                     opclasses=['gin_trgm_ops', ]),
+            # keyset pagination of products on the shelf, see shop.pagination
+            models.Index(fields=['created_at', 'id', ], name='shop_sku_on_created_idx',
+                         condition=models.Q(status='ON')),
+            models.Index(fields=['sales', 'id', ], name='shop_sku_on_sales_idx',
+                         condition=models.Q(status='ON')),
+            models.Index(fields=['price', 'id', ], name='shop_sku_on_price_idx',
+                         condition=models.Q(status='ON')),
+            # category listings in the same orderings
+            models.Index(fields=['category', 'created_at', ], name='shop_sku_on_cat_created_idx',
+                         condition=models.Q(status='ON')),
+            models.Index(fields=['category', 'sales', ], name='shop_sku_on_cat_sales_idx',
+                         condition=models.Q(status='ON')),
+            models.Index(fields=['category', 'price', ], name='shop_sku_on_cat_price_idx',
+                         condition=models.Q(status='ON')),
         ]
 
     def __str__(self):
@@ -133,6 +168,11 @@ class ProductSKU(BaseModel):
         if not self.slug:
             self.slug = slugify(self.name, allow_unicode=True)
         super(ProductSKU, self).save(*args, **kwargs)
+        # keep the stored search vector in sync with the searchable text fields
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or set(update_fields) & {'name', 'summary', 'detail'}:
+            ProductSKU.objects.update_search_vector(
+                ProductSKU._base_manager.filter(pk=self.pk))
 
     def get_absolute_url(self):
         return reverse("shop:product-detail", kwargs={"pk": self.pk, 'slug': self.slug})
@@ -147,10 +187,12 @@ class ProductSKU(BaseModel):
         return float('{0:.2f}'.format(tax_in_price))
 
     @property
-    def review_count(self):
-        order_products = self.order_products.all()
-        count = sum(op.is_reviewed for op in order_products)
-        return count
+    def review_histogram(self):
+        """
+        Return review counts from 1 star to 5 stars
+        """
+        return [getattr(self, f'review_star_{star}') for star in range(1, 6)]
+
     # @property
     # def sku_number(self):
     #     """
@@ -167,11 +209,9 @@ class ProductSKU(BaseModel):
     #     """
     #     pass
 
-    # TODO: find a better way to calculate average salse to avoid duplicate queries
-    @cached_property
+    @property
     def avg_sales(self):
-        avg_sales = ProductSKU.objects.aggregate(Avg('sales'))
-        return avg_sales['sales__avg']
+        return get_catalog_stats()['avg_sales']
 
     def get_product_label(self):
         """
@@ -181,7 +221,8 @@ class ProductSKU(BaseModel):
 
         if datetime.now(timezone.utc) - self.created_at < timedelta(days=14):
             label = 'new'
-        if self.sales >= 1:
+        # top quarter of products by sales
+        if self.sales >= 1 and self.sales >= get_catalog_stats()['sales_p75']:
             label = 'hot'
         if self.stock == 0:
             label = 'sold'
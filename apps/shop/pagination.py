@@ -0,0 +1,60 @@
+from django.core import signing
+from django.db.models import Q
+
+# supported orderings with the id tiebreaker, backed by partial indexes on
+# (<field>, id) of products on the shelf, descending orders scan them backward
+KEYSET_ORDERINGS = {
+    '-created_at': ('-created_at', '-id'),
+    'sales': ('sales', 'id'),
+    'price': ('price', 'id'),
+    '-price': ('-price', '-id'),
+}
+CURSOR_SALT = 'shop.product-feed'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(ordering, product):
+    """
+    Opaque cursor pointing after product, signed so that clients cannot
+    forge the values filtered on.
+    """
+    field = ordering.lstrip('-')
+    value = product._meta.get_field(field).value_to_string(product)
+    return signing.dumps([ordering, value, product.id], salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(cursor, ordering, model):
+    try:
+        cursor_ordering, value, pk = signing.loads(cursor, salt=CURSOR_SALT)
+    except (signing.BadSignature, ValueError, TypeError):
+        raise InvalidCursor
+    if cursor_ordering != ordering:
+        raise InvalidCursor
+    return model._meta.get_field(ordering.lstrip('-')).to_python(value), pk
+
+
+def keyset_page(queryset, ordering, cursor=None, limit=12):
+    """
+    Return a page of queryset in ordering and the cursor of the next page (None on the last page).
+    The page is read by seeking past the cursor on the (field, id) index, every page
+    costs one query whatever its depth, no count is needed.
+    Raise InvalidCursor if the cursor is forged or from another ordering.
+    """
+    field = ordering.lstrip('-')
+    descending = ordering.startswith('-')
+    queryset = queryset.order_by(*KEYSET_ORDERINGS[ordering])
+    if cursor:
+        value, pk = decode_cursor(cursor, ordering, queryset.model)
+        op = 'lt' if descending else 'gt'
+        # the inclusive bound lets the index range scan start at the cursor
+        queryset = queryset.filter(
+            Q(**{f'{field}__{op}e': value}),
+            Q(**{f'{field}__{op}': value}) | Q(**{f'id__{op}': pk}))
+    products = list(queryset[:limit + 1])
+    if len(products) <= limit:
+        return products, None
+    products = products[:limit]
+    return products, encode_cursor(ordering, products[-1])
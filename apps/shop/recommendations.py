@@ -0,0 +1,142 @@
+"""
+Co-purchase recommendations, products bought in the same orders are scored with
+the cosine similarity of their order vectors and the top TOP_K of each product
+are kept in redis, read by the detail page with one HGET:
+    product_recommendations: hash {<sku_id>: '<sku_id>,<sku_id>,...'}, most similar first
+The raw co-occurrence counts are kept as well, so that new orders are added
+without reading the whole order history again:
+    copurchase_matrix: SKU x SKU counts, scipy sparse npz, counts[i, i] is orders of i
+    copurchase_last_id: the last order product counted
+"""
+from django_redis import get_redis_connection
+from redis.exceptions import LockNotOwnedError
+
+import io
+import logging
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from scipy import sparse
+
+from order.models import OrderProduct
+from .cache import RECOMMENDATIONS_KEY
+
+logger = logging.getLogger(__name__)
+
+MATRIX_KEY = 'copurchase_matrix'
+LAST_ID_KEY = 'copurchase_last_id'
+LOCK_KEY = 'copurchase_lock'
+LOCK_TIMEOUT = 60 * 30
+TOP_K = 8
+# products bought together less often are left out as noise
+MIN_SUPPORT = 2
+# order products are counted once their transaction is surely committed,
+# ids are allocated before commit, a newer id may become visible earlier
+SETTLE_AFTER = timedelta(minutes=5)
+
+
+def count_copurchases(order_ids, product_ids, size):
+    """
+    Return the size x size co-occurrence counts of products in the given
+    order products, a product ordered twice in one order counts once.
+    """
+    orders, order_index = np.unique(order_ids, return_inverse=True)
+    baskets = sparse.csr_matrix(
+        (np.ones(len(product_ids), dtype=np.int32), (order_index, product_ids)),
+        shape=(len(orders), size))
+    # duplicates are summed on conversion, make the baskets binary
+    baskets.data[:] = 1
+    return (baskets.T @ baskets).tocsr()
+
+
+def top_neighbors(counts, rows, k=TOP_K, min_support=MIN_SUPPORT):
+    """
+    Return {row: [ids of the k most similar products]} of the given rows,
+    similarity of i and j is counts[i, j] / sqrt(counts[i, i] * counts[j, j]),
+    ties are broken by the higher count, then the lower id.
+    """
+    orders = counts.diagonal().astype(np.float64)
+    neighbors = {}
+    for row in rows:
+        start, end = counts.indptr[row], counts.indptr[row + 1]
+        ids, together = counts.indices[start:end], counts.data[start:end]
+        keep = (ids != row) & (together >= min_support)
+        ids, together = ids[keep], together[keep]
+        scores = together / np.sqrt(orders[row] * orders[ids])
+        order = np.lexsort((ids, -together, -scores))[:k]
+        neighbors[int(row)] = [int(i) for i in ids[order]]
+    return neighbors
+
+
+def load_counts(conn):
+    """ Return (counts, last order product id), (None, 0) if not built yet """
+    matrix, last_id = conn.mget(MATRIX_KEY, LAST_ID_KEY)
+    if matrix is None or last_id is None:
+        return None, 0
+    return sparse.load_npz(io.BytesIO(matrix)).tocsr(), int(last_id)
+
+
+def refresh_recommendations(full=False):
+    """
+    Count the order products settled since the last run into the co-occurrence
+    counts and rescore the products whose similarities changed, i.e. the products
+    of the new orders and everything bought with them. Rebuild from all orders
+    if full or nothing is counted yet. Return the number of rescored products.
+    """
+    conn = get_redis_connection('default')
+    lock = conn.lock(LOCK_KEY, timeout=LOCK_TIMEOUT)
+    if not lock.acquire(blocking=False):
+        logger.info('recommendations are being refreshed by another worker')
+        return 0
+    try:
+        return _refresh(conn, full)
+    finally:
+        try:
+            lock.release()
+        except LockNotOwnedError:
+            # ran past LOCK_TIMEOUT, the lock expired or another worker took it
+            logger.warning('recommendations lock expired before the refresh ended')
+
+
+def _refresh(conn, full):
+    counts, last_id = (None, 0) if full else load_counts(conn)
+    full = counts is None
+    settled = datetime.now(timezone.utc) - SETTLE_AFTER
+    rows = np.array(OrderProduct.objects.filter(
+        id__gt=last_id, created_at__lt=settled, order__isnull=False,
+    ).order_by().values_list('id', 'order_id', 'product_id'), dtype=np.int64)
+    if not len(rows) and not full:
+        return 0
+
+    size = int(rows[:, 2].max()) + 1 if len(rows) else 0
+    if counts is not None:
+        size = max(size, counts.shape[0])
+        counts.resize((size, size))
+    else:
+        counts = sparse.csr_matrix((size, size), dtype=np.int32)
+    if len(rows):
+        counts = counts + count_copurchases(rows[:, 1], rows[:, 2], size)
+        last_id = int(rows[:, 0].max())
+
+    if full:
+        changed = np.flatnonzero(counts.diagonal())
+    else:
+        bought = np.unique(rows[:, 2])
+        changed = np.union1d(bought, counts[bought].indices)
+    neighbors = top_neighbors(counts, changed)
+
+    buffer = io.BytesIO()
+    sparse.save_npz(buffer, counts)
+    pipe = conn.pipeline()
+    if full:
+        # products without orders any more are dropped with the old hash
+        pipe.delete(RECOMMENDATIONS_KEY)
+    values = {row: ','.join(map(str, ids)) for row, ids in neighbors.items() if ids}
+    if values:
+        pipe.hset(RECOMMENDATIONS_KEY, mapping=values)
+    empty = [row for row, ids in neighbors.items() if not ids]
+    if empty and not full:
+        pipe.hdel(RECOMMENDATIONS_KEY, *empty)
+    pipe.mset({MATRIX_KEY: buffer.getvalue(), LAST_ID_KEY: last_id})
+    pipe.execute()
+    return len(neighbors)
@@ -1,11 +1,85 @@
 from django.dispatch import receiver
-from django.db.models.signals import post_save
-from django.contrib.postgres.search import SearchVector
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save, post_delete
 
-from .models import ProductSKU
-from .tasks import update_search_vector
+from mptt.signals import node_moved
+from taggit.models import Tag, TaggedItem
+
+from cart.repository import invalidate_stock
+from order.reservations import invalidate_available
+
+from .cache import (
+    bump_catalog_version, bump_category_version, invalidate_product_detail,
+)
+from .category_index import invalidate_category_index
+from .models import Category, ProductSKU, Image
 
 
 @receiver(post_save, sender=ProductSKU)
-def update_sku(sender, instance, **kwargs):
-    update_search_vector.delay(instance.id)
+@receiver(post_delete, sender=ProductSKU)
+def invalidate_catalog(sender, instance, **kwargs):
+    """
+    Any change on products invalidates cached product lists,
+    the detail page, the stock ceiling for carts and the stock counter for checkout,
+    the search vector itself is written in ProductSKU.save. Catalog stats are
+    left to the beat refresh, stock changes at checkout would otherwise
+    recompute them on the next request.
+    """
+    bump_catalog_version()
+    invalidate_product_detail(instance.id)
+    invalidate_stock(instance.id)
+    invalidate_available(instance.id)
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Image)
+def invalidate_product_images(sender, instance, **kwargs):
+    invalidate_product_detail(instance.sku_id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(node_moved, sender=Category)
+def invalidate_category_tree(sender, instance, **kwargs):
+    """
+    The cached category tree and index are replaced on any change or move in the tree,
+    product lists filtered by category are invalidated too. The index is dropped again
+    after commit, in case it was rebuilt from the tree before the change was committed.
+    """
+    bump_category_version()
+    bump_catalog_version()
+    invalidate_category_index()
+    transaction.on_commit(invalidate_category_index)
+
+
+@receiver(m2m_changed, sender=ProductSKU.tags.through)
+def sync_product_tag_slugs(sender, instance, action, **kwargs):
+    """
+    Tags of products are added, removed or cleared through the taggable manager,
+    copy the tag slugs into the product so that tag filters read one indexed column.
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    ProductSKU.objects.sync_tag_slugs(
+        ProductSKU._base_manager.filter(id=instance.id))
+    bump_catalog_version()
+    invalidate_product_detail(instance.id)
+
+
+@receiver(post_save, sender=Tag)
+def sync_renamed_tag_slugs(sender, instance, created, **kwargs):
+    """ A renamed tag may change its slug, resync the products tagged with it """
+    if created:
+        return
+    product_ids = TaggedItem.objects.filter(
+        tag=instance, content_type__app_label='shop', content_type__model='productsku',
+    ).values('object_id')
+    if ProductSKU.objects.sync_tag_slugs(
+            ProductSKU._base_manager.filter(id__in=product_ids)):
+        bump_catalog_version()
+
+
+@receiver(post_delete, sender=Tag)
+def remove_deleted_tag_slug(sender, instance, **kwargs):
+    if ProductSKU.objects.remove_tag_slug(instance.slug):
+        bump_catalog_version()
@@ -0,0 +1,82 @@
+from django.core.cache import cache
+from django.db.models import Avg, Count, Max
+
+import time
+
+from .lookups import PercentileCont
+
+CATALOG_STATS_KEY = 'catalog_stats'
+CATALOG_STATS_TIMEOUT = 60 * 60
+# one process recomputes a cold cache, the lock expires if it dies meanwhile
+CATALOG_STATS_LOCK_KEY = 'catalog_stats_lock'
+CATALOG_STATS_LOCK_TIMEOUT = 30
+# stats are read several times per product on list pages, keep them in process briefly
+LOCAL_STATS_TIMEOUT = 60
+SALES_PERCENTILES = [50, 75, 90]
+
+_local_stats = {'stats': None, 'expires': 0}
+
+
+def compute_catalog_stats():
+    """
+    Aggregate sales and price statistics of products on the shelf,
+    and the count of products per category id.
+    """
+    # imported here as models read stats through the manager
+    from .models import ProductSKU
+    queryset = ProductSKU.objects.prefetch_related(None).order_by()
+    stats = queryset.aggregate(
+        avg_sales=Avg('sales'),
+        max_price=Max('price'),
+        sales_percentiles=PercentileCont(
+            'sales', [p / 100 for p in SALES_PERCENTILES]),
+    )
+    percentiles = stats.pop('sales_percentiles') or [0] * len(SALES_PERCENTILES)
+    for p, value in zip(SALES_PERCENTILES, percentiles):
+        stats[f'sales_p{p}'] = value
+    stats['avg_sales'] = stats['avg_sales'] or 0
+    stats['max_price'] = stats['max_price'] or 0
+    stats['category_counts'] = dict(
+        queryset.values_list('category').annotate(count=Count('id')))
+    return stats
+
+
+def refresh_catalog_stats():
+    """
+    Recalculate the stats into redis, called by celery beat.
+    """
+    stats = compute_catalog_stats()
+    cache.set(CATALOG_STATS_KEY, stats, CATALOG_STATS_TIMEOUT)
+    _local_stats.update(stats=stats, expires=time.monotonic()+LOCAL_STATS_TIMEOUT)
+    return stats
+
+
+def default_catalog_stats():
+    """
+    Stats served until the first ones are computed, no product is labeled hot.
+    """
+    stats = {'avg_sales': 0, 'max_price': 0, 'category_counts': {}}
+    for p in SALES_PERCENTILES:
+        stats[f'sales_p{p}'] = float('inf')
+    return stats
+
+
+def get_catalog_stats():
+    """
+    Return catalog stats from the process memory, then redis,
+    compute them only if neither has a fresh copy. While another process
+    computes them, return the expired local copy or the default stats.
+    """
+    local = _local_stats['stats']
+    if local is not None and time.monotonic() < _local_stats['expires']:
+        return local
+    stats = cache.get(CATALOG_STATS_KEY)
+    if stats is not None:
+        _local_stats.update(stats=stats, expires=time.monotonic()+LOCAL_STATS_TIMEOUT)
+        return stats
+    if cache.add(CATALOG_STATS_LOCK_KEY, 1, CATALOG_STATS_LOCK_TIMEOUT):
+        try:
+            return refresh_catalog_stats()
+        finally:
+            cache.delete(CATALOG_STATS_LOCK_KEY)
+    return local if local is not None else default_catalog_stats()
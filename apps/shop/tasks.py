@@ -1,14 +1,52 @@
-from django.contrib.postgres.search import SearchVector
 from celery import shared_task
+from . import stats
+from .cache import set_trending_product_ids
 from .models import ProductSKU
 
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def update_search_vector(obj_id=None):
+    """
+    Rewrite the stored search vector of a product, or of all products if no id is given
+    """
+    queryset = ProductSKU._base_manager.filter(id=obj_id) if obj_id else None
+    count = ProductSKU.objects.update_search_vector(queryset)
+    logger.info(f'search vector updated for {count} products')
+
+
+@shared_task
+def refresh_trending_products():
+    """
+    Compute ids of trending products into redis, sampled by the index page
+    """
+    sku_ids = list(ProductSKU.objects.get_trending_products()
+                   .values_list('id', flat=True))
+    set_trending_product_ids(sku_ids)
+    logger.info(f'{len(sku_ids)} trending products refreshed')
+    return sku_ids
+
+
+@shared_task
+def refresh_catalog_stats():
+    """
+    Recalculate catalog stats (sales, max price, category counts) into redis
+    """
+    stats.refresh_catalog_stats()
+    logger.info('catalog stats refreshed')
+
 
 @shared_task
-def update_search_vector(obj_id):
-    product = ProductSKU.objects.get(id=obj_id)
-    product.search_vector = (
-        SearchVector('name', weight='A')
-        + SearchVector('detail', weight='B')
-        + SearchVector('summary', weight='C')
-    )
-    print('search vector updated!')
+def refresh_recommendations(full=False):
+    """
+    Add new orders into the co-purchase recommendations read by the detail page,
+    rebuild them from all orders if full
+    """
+    # imported here, web processes import tasks but never build recommendations
+    from .recommendations import refresh_recommendations
+    count = refresh_recommendations(full)
+    logger.info(f'recommendations refreshed for {count} products')
+    return count
@@ -0,0 +1,63 @@
+from django.test import TestCase
+
+from django_redis import get_redis_connection
+
+from shop.category_index import (
+    get_breadcrumbs, get_category_id, get_category_index, get_descendant_ids,
+)
+from shop.models import Category, ProductSKU
+from .factory import CategoryFactory, SkuFactory
+
+
+class TestCategoryIndex(TestCase):
+
+    def tearDown(self):
+        get_redis_connection("default").flushdb()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.food = CategoryFactory(name='food')
+        cls.tea = CategoryFactory(name='tea', parent=cls.food)
+        cls.matcha = CategoryFactory(name='matcha', parent=cls.tea)
+        cls.sweets = CategoryFactory(name='sweets', parent=cls.food)
+        cls.drink = CategoryFactory(name='drink')
+
+    def test_descendant_ids(self):
+        self.assertCountEqual(get_descendant_ids(self.food.id), [
+            self.food.id, self.tea.id, self.matcha.id, self.sweets.id])
+        self.assertCountEqual(get_descendant_ids(self.tea.id),
+                              [self.tea.id, self.matcha.id])
+        self.assertEqual(get_descendant_ids(self.drink.id), [self.drink.id])
+
+    def test_slug_and_breadcrumbs(self):
+        self.assertEqual(get_category_id('matcha'), self.matcha.id)
+        self.assertIsNone(get_category_id('not-a-category'))
+        self.assertEqual([name for _, name, _ in get_breadcrumbs(self.matcha.id)],
+                         ['food', 'tea', 'matcha'])
+        self.assertEqual(get_breadcrumbs(self.sweets.id)[0][0], self.food.id)
+
+    def test_index_read_without_query(self):
+        get_category_index()
+        with self.assertNumQueries(0):
+            name = self.matcha.get_full_category_name()
+            queryset = ProductSKU.objects.filter_category_products(
+                self.tea, ProductSKU.objects.all())
+        self.assertEqual(name, 'food/tea/matcha')
+        sku = SkuFactory(category=self.matcha)
+        self.assertEqual(list(queryset), [sku])
+
+    def test_index_rebuilt_after_move(self):
+        get_category_index()
+        matcha = Category.objects.get(id=self.matcha.id)
+        matcha.parent = self.drink
+        matcha.save()
+        self.assertCountEqual(get_descendant_ids(self.drink.id),
+                              [self.drink.id, self.matcha.id])
+        self.assertEqual(Category.objects.get(id=self.matcha.id)
+                         .get_full_category_name(), 'drink/matcha')
+
+    def test_local_copy_dropped_with_redis_copy(self):
+        index = get_category_index()
+        self.assertIs(get_category_index(), index)
+        get_redis_connection("default").flushdb()
+        self.assertIsNot(get_category_index(), index)
@@ -0,0 +1,51 @@
+from django.core.management import call_command
+from django.test import TestCase
+
+from io import StringIO
+
+from order.tests.factory import OrderProductFactory, ReviewFactory
+from shop.models import ProductSKU
+from .factory import SkuFactory
+
+
+class TestUpdateSearchVectorCommand(TestCase):
+
+    def test_backfill_search_vector(self):
+        sku = SkuFactory(name='kombu')
+        ProductSKU.objects.filter(id=sku.id).update(search_vector=None)
+        self.assertFalse(ProductSKU.objects.search('kombu').exists())
+
+        out = StringIO()
+        call_command('update_search_vector', batch_size=1, stdout=out)
+        self.assertIn(sku, ProductSKU.objects.search('kombu'))
+        self.assertIn('Search vector updated', out.getvalue())
+
+
+class TestRebuildReviewStatsCommand(TestCase):
+
+    def test_rebuild_review_stats(self):
+        sku = SkuFactory()
+        ReviewFactory(order_product=OrderProductFactory(product=sku), star=2)
+        ProductSKU.objects.filter(id=sku.id).update(
+            review_count=0, review_star_2=0)
+
+        out = StringIO()
+        call_command('rebuild_review_stats', stdout=out)
+        sku.refresh_from_db()
+        self.assertEqual(sku.review_count, 1)
+        self.assertEqual(sku.review_star_2, 1)
+        self.assertIn('Review stats rebuilt for', out.getvalue())
+
+
+class TestSyncTagSlugsCommand(TestCase):
+
+    def test_backfill_tag_slugs(self):
+        sku = SkuFactory()
+        sku.tags.add('matcha', 'gift')
+        ProductSKU.objects.filter(id=sku.id).update(tag_slugs=[])
+
+        out = StringIO()
+        call_command('sync_tag_slugs', batch_size=1, stdout=out)
+        sku.refresh_from_db()
+        self.assertEqual(sku.tag_slugs, ['gift', 'matcha'])
+        self.assertIn('Tag slugs updated', out.getvalue())
@@ -0,0 +1,57 @@
+from django.contrib.auth.models import AnonymousUser
+from django.test import TestCase, RequestFactory
+
+from django_redis import get_redis_connection
+
+from account.tests.factory import UserFactory
+from shop.context_processors import base_template_data_processor
+from .factory import CategoryFactory
+
+
+class TestBaseTemplateDataProcessor(TestCase):
+
+    def setUp(self):
+        self.request = RequestFactory().get('/')
+        self.request.user = AnonymousUser()
+
+    def tearDown(self):
+        get_redis_connection("cart").flushdb()
+        get_redis_connection("default").flushdb()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent = CategoryFactory(name='parent')
+        cls.child = CategoryFactory(name='child', parent=cls.parent)
+
+    def test_nothing_evaluated_until_used(self):
+        with self.assertNumQueries(0):
+            context = base_template_data_processor(self.request)
+        self.assertFalse(hasattr(self.request, '_cart_wishlist_count'))
+        self.assertEqual(int(context['cart_count']), 0)
+        self.assertEqual(str(context['wishlist_count']), '0')
+
+    def test_cart_and_wishlist_count(self):
+        user = UserFactory()
+        conn = get_redis_connection('cart')
+        conn.hset(f'cart_{user.id}', 1, 2)
+        conn.sadd(f'wish_{user.id}', 1, 2, 3)
+        self.request.user = user
+        context = base_template_data_processor(self.request)
+
+        self.assertEqual(int(context['cart_count']), 1)
+        self.assertEqual(int(context['wishlist_count']), 3)
+
+    def test_category_tree_cached(self):
+        context = base_template_data_processor(self.request)
+        self.assertEqual(list(context['categories']), [self.parent, self.child])
+
+        with self.assertNumQueries(0):
+            context = base_template_data_processor(self.request)
+            list(context['categories'])
+
+    def test_category_tree_invalidated_on_change(self):
+        list(base_template_data_processor(self.request)['categories'])
+        new_child = CategoryFactory(name='another child', parent=self.parent)
+        categories = base_template_data_processor(self.request)['categories']
+
+        self.assertIn(new_child, list(categories))
@@ -0,0 +1,71 @@
+from django.http import QueryDict
+from django.test import TestCase
+
+from shop.facets import (
+    count_facets, filter_facets, get_facet_filters, get_tag_filters,
+)
+from shop.models import ProductSKU
+from .factory import OriginFactory, SkuFactory
+
+
+class TestFacets(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.kyoto = OriginFactory(name='kyoto')
+        cls.uji = OriginFactory(name='uji')
+        cls.sku1 = SkuFactory(origin=cls.kyoto, brand='ippodo', price=800)
+        cls.sku2 = SkuFactory(origin=cls.kyoto, brand='ippodo', price=3500)
+        cls.sku3 = SkuFactory(origin=cls.uji, brand='marukyu', price=12000)
+        cls.sku1.tags.add('matcha', 'gift')
+        cls.sku2.tags.add('matcha')
+
+    def test_count_facets_in_one_query(self):
+        with self.assertNumQueries(1):
+            facets = count_facets(ProductSKU.objects.order_by('-price'))
+
+        self.assertEqual([(v['value'], v['label'], v['count']) for v in facets['tag']],
+                         [('matcha', 'matcha', 2), ('gift', 'gift', 1)])
+        self.assertEqual([(v['value'], v['count']) for v in facets['origin']],
+                         [(self.kyoto.id, 2), (self.uji.id, 1)])
+        self.assertEqual([(v['value'], v['count']) for v in facets['brand']],
+                         [('ippodo', 2), ('marukyu', 1)])
+        self.assertEqual(sum(v['count'] for v in facets['spu']), 3)
+        self.assertEqual([(v['value'], v['count']) for v in facets['price']],
+                         [(0, 1), (2, 1), (4, 1)])
+        self.assertEqual(facets['price'][0]['label'], 'Under ¥1,000')
+
+    def test_count_facets_of_filtered_products(self):
+        facets = count_facets(ProductSKU.objects.filter(origin=self.uji))
+        self.assertEqual(facets['tag'], [])
+        self.assertEqual([v['label'] for v in facets['origin']], ['uji'])
+
+    def test_count_facets_empty_result(self):
+        with self.assertNumQueries(0):
+            facets = count_facets(ProductSKU.objects.filter(id__in=[]))
+        self.assertEqual(facets['brand'], [])
+
+    def test_filter_facets(self):
+        filters = get_facet_filters(QueryDict(
+            f'origin={self.kyoto.id}&price=2&spu=x&brand='))
+        self.assertEqual(filters, {'origin': self.kyoto.id, 'price': 2})
+        queryset = filter_facets(ProductSKU.objects.all(), filters)
+        self.assertEqual(list(queryset), [self.sku2])
+
+    def test_invalid_price_bucket_ignored(self):
+        self.assertEqual(get_facet_filters(QueryDict('price=9')), {})
+
+    def test_get_tag_filters(self):
+        params = QueryDict('tag=Uji Matcha&tag=gift&tag=uji-matcha&tag=')
+        self.assertEqual(get_tag_filters(params), (['gift', 'uji-matcha'], True))
+        self.assertEqual(get_tag_filters(QueryDict('tag=gift&tag_match=any')),
+                         (['gift'], False))
+
+    def test_count_facets_of_tag_and_search_filters(self):
+        queryset = ProductSKU.objects.filter_tags(ProductSKU.objects.all(), ['gift'])
+        facets = count_facets(queryset)
+        self.assertEqual([v['value'] for v in facets['tag']], ['gift', 'matcha'])
+        self.assertEqual([v['value'] for v in facets['price']], [0])
+
+        facets = count_facets(ProductSKU.objects.search(self.sku3.name))
+        self.assertEqual([v['value'] for v in facets['origin']], [self.uji.id])
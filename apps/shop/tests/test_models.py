@@ -1,12 +1,24 @@
 from apps.order.tests.factory import OrderProductFactory, ReviewFactory
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
 
 import factory
 
 from shop.models import ProductSKU, Category, ProductSPU, Origin, HomeBanner
+from shop.pagination import KEYSET_ORDERINGS
+from shop.stats import (
+    CATALOG_STATS_KEY, CATALOG_STATS_LOCK_KEY, _local_stats, get_catalog_stats,
+)
 from .factory import BannerFactory, SkuFactory, CategoryFactory, SpuFactory, OriginFactory
 
 
+def reset_catalog_stats():
+    """ Drop stats cached in redis and in this process """
+    cache.delete(CATALOG_STATS_KEY)
+    _local_stats.update(stats=None, expires=0)
+
+
 class TestSkuModel(TestCase):
 
     @classmethod
@@ -42,6 +54,14 @@ class TestSkuModel(TestCase):
     #     new_sku.save()
     #     self.assertEqual(mocked_update_search_vector.call_count, 2)
 
+    def test_search_vector_updated_on_save(self):
+        sku = SkuFactory(name='matcha')
+        self.assertIn(sku, ProductSKU.objects.search('matcha'))
+        sku.name = 'sencha'
+        sku.save()
+        self.assertIn(sku, ProductSKU.objects.search('sencha'))
+        self.assertNotIn(sku, ProductSKU.objects.search('matcha'))
+
     def test_text_in_price(self):
         price = self.sku.price * (1+0.1)
         self.assertAlmostEqual(self.sku.tax_in_price, price)
@@ -51,12 +71,72 @@ class TestSkuModel(TestCase):
         for _ in range(3):
             op = OrderProductFactory(product=self.sku)
             review = ReviewFactory(order_product=op)
-        self.assertEqual(self.sku.review_count, 3)
+        sku = ProductSKU.objects.get(id=self.sku.id)
+        self.assertEqual(sku.review_count, 3)
+
+    def test_review_stats(self):
+        for star in [5, 4, 4, 1]:
+            op = OrderProductFactory(product=self.sku)
+            review = ReviewFactory(order_product=op, star=star)
+        review.delete()
+        sku = ProductSKU.objects.get(id=self.sku.id)
+        self.assertEqual(sku.review_count, 3)
+        self.assertAlmostEqual(float(sku.review_avg), 4.33)
+        self.assertEqual(sku.review_histogram, [0, 0, 0, 2, 1])
+
+    def test_rebuild_review_stats(self):
+        for star in [5, 3]:
+            op = OrderProductFactory(product=self.sku)
+            ReviewFactory(order_product=op, star=star)
+        ProductSKU.objects.filter(id=self.sku.id).update(
+            review_count=0, review_avg=0, review_star_5=0, review_star_3=0)
+        ProductSKU.objects.rebuild_review_stats()
+        sku = ProductSKU.objects.get(id=self.sku.id)
+        self.assertEqual(sku.review_count, 2)
+        self.assertEqual(float(sku.review_avg), 4)
+        self.assertEqual(sku.review_histogram, [0, 0, 1, 0, 1])
+
+    def test_tag_slugs_synced_with_tags(self):
+        sku = SkuFactory()
+        sku.tags.add('Uji Matcha', 'gift')
+        sku.refresh_from_db()
+        self.assertEqual(sku.tag_slugs, ['gift', 'uji-matcha'])
+        sku.tags.remove('gift')
+        sku.refresh_from_db()
+        self.assertEqual(sku.tag_slugs, ['uji-matcha'])
+        sku.tags.clear()
+        sku.refresh_from_db()
+        self.assertEqual(sku.tag_slugs, [])
+
+    def test_tag_slugs_follow_renamed_and_deleted_tags(self):
+        sku = SkuFactory()
+        sku.tags.add('matcha', 'gift')
+        tag = sku.tags.get(name='matcha')
+        tag.slug = 'green-tea'
+        tag.save()
+        sku.refresh_from_db()
+        self.assertEqual(sku.tag_slugs, ['gift', 'green-tea'])
+        tag.delete()
+        sku.refresh_from_db()
+        self.assertEqual(sku.tag_slugs, ['gift'])
+
+    def test_filter_tags(self):
+        both, one, other = SkuFactory(), SkuFactory(), SkuFactory()
+        both.tags.add('matcha', 'gift')
+        one.tags.add('matcha')
+        other.tags.add('sencha')
+        products = ProductSKU.objects.all()
+        self.assertCountEqual(ProductSKU.objects.filter_tags(
+            products, ['matcha', 'gift']), [both])
+        self.assertCountEqual(ProductSKU.objects.filter_tags(
+            products, ['gift', 'sencha'], match_all=False), [both, other])
+        self.assertEqual(ProductSKU.objects.filter_tags(products, []), products)
 
     def test_get_product_label_and_badge(self):
         sku1 = SkuFactory()
         sku2 = SkuFactory(sales=5)
         sku3 = SkuFactory(stock=0)
+        reset_catalog_stats()
         self.assertEqual(sku1.get_product_label(), 'new')
         self.assertEqual(sku1.get_label_badge(), 'primary')
         self.assertEqual(sku2.get_product_label(), 'hot')
@@ -65,6 +145,64 @@ class TestSkuModel(TestCase):
         self.assertEqual(sku3.get_label_badge(), 'secondary')
 
 
+class TestCatalogStats(TestCase):
+
+    def setUp(self):
+        reset_catalog_stats()
+
+    def tearDown(self):
+        reset_catalog_stats()
+
+    def test_compute_catalog_stats(self):
+        category = CategoryFactory()
+        for sales in [0, 2, 4, 10]:
+            SkuFactory(sales=sales, price=sales*100, category=category)
+        SkuFactory(sales=100, status='OFF', category=category)
+        stats = get_catalog_stats()
+
+        self.assertEqual(stats['avg_sales'], 4)
+        self.assertEqual(stats['sales_p50'], 3)
+        self.assertEqual(stats['max_price'], 1000)
+        self.assertEqual(stats['category_counts'], {category.id: 4})
+
+    def test_stats_served_from_process_memory(self):
+        SkuFactory()
+        get_catalog_stats()
+        with self.assertNumQueries(0):
+            get_catalog_stats()
+
+    def test_cold_stats_computed_by_one_process(self):
+        SkuFactory(sales=5)
+        # another process is computing them
+        cache.add(CATALOG_STATS_LOCK_KEY, 1)
+        with self.assertNumQueries(0):
+            stats = get_catalog_stats()
+        self.assertEqual(stats['avg_sales'], 0)
+        self.assertEqual(stats['sales_p75'], float('inf'))
+
+        cache.delete(CATALOG_STATS_LOCK_KEY)
+        stats = get_catalog_stats()
+        self.assertEqual(stats['avg_sales'], 5)
+        self.assertIsNone(cache.get(CATALOG_STATS_LOCK_KEY))
+
+        # the expired local copy is served while the lock is held
+        cache.delete(CATALOG_STATS_KEY)
+        _local_stats['expires'] = 0
+        cache.add(CATALOG_STATS_LOCK_KEY, 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_catalog_stats(), stats)
+        cache.delete(CATALOG_STATS_LOCK_KEY)
+
+    def test_stats_kept_on_product_change(self):
+        sku = SkuFactory()
+        get_catalog_stats()
+        # e.g. stock taken at checkout, stats wait for the beat refresh
+        sku.stock = 0
+        sku.save()
+        with self.assertNumQueries(0):
+            get_catalog_stats()
+
+
 class TestCategoryModel(TestCase):
 
     @classmethod
@@ -182,3 +320,58 @@ class TestHomeBannerModel(TestCase):
 
     def test_str_representation(self):
         self.assertEqual(str(self.banner), f'{self.banner.sku.name} banner')
+
+
+class TestSkuIndexes(TestCase):
+    """
+    Check with EXPLAIN that the storefront queries are served by their indexes,
+    the catalog is large enough and analyzed so that plans match production.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = [CategoryFactory() for _ in range(50)]
+        template = SkuFactory(category=categories[0])
+        products = []
+        for i in range(2000):
+            product = ProductSKU(
+                name=f'item {i}', slug=f'item-{i}', unit=1, price=100 + i % 97,
+                sales=i % 31, category=categories[i % 50], origin=template.origin,
+                spu=template.spu, status='ON' if i % 5 else 'OFF')
+            product.tag_slugs = ['matcha', 'gift'] if i % 500 == 0 else [f'tag-{i % 40}']
+            products.append(product)
+        products[0].name = 'uji matcha'
+        ProductSKU.objects.bulk_create(products)
+        ProductSKU.objects.update_search_vector()
+        cls.category = categories[1]
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {ProductSKU._meta.db_table}')
+
+    def test_list_ordering_uses_partial_index(self):
+        indexes = {'created_at': 'shop_sku_on_created_idx',
+                   'sales': 'shop_sku_on_sales_idx',
+                   'price': 'shop_sku_on_price_idx'}
+        for ordering, fields in KEYSET_ORDERINGS.items():
+            plan = ProductSKU.objects.order_by(*fields)[:12].explain()
+            self.assertIn(indexes[ordering.lstrip('-')], plan)
+            # rows come in index order, no sort of the whole shelf
+            self.assertNotIn('Sort', plan)
+
+    def test_category_list_uses_category_index(self):
+        for ordering, index in [('-created_at', 'shop_sku_on_cat_created_idx'),
+                                ('sales', 'shop_sku_on_cat_sales_idx'),
+                                ('price', 'shop_sku_on_cat_price_idx')]:
+            plan = ProductSKU.objects.filter(
+                category=self.category).order_by(ordering)[:12].explain()
+            self.assertIn(index, plan)
+
+    def test_search_uses_gin_index(self):
+        plan = ProductSKU.objects.search('matcha').explain()
+        self.assertIn('shop_produc_search__884a4b_gin', plan)
+
+    def test_tag_filters_use_gin_index(self):
+        products = ProductSKU.objects.all()
+        for match_all in [True, False]:
+            plan = ProductSKU.objects.filter_tags(
+                products, ['matcha', 'gift'], match_all).explain()
+            self.assertIn('shop_sku_tag_slugs_gin', plan)
@@ -0,0 +1,120 @@
+from django.test import TestCase
+
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import numpy as np
+from django_redis import get_redis_connection
+
+from order.models import OrderProduct
+from order.tests.factory import OrderFactory, OrderProductFactory
+from shop.cache import get_recommended_product_ids
+from shop.recommendations import (
+    LAST_ID_KEY, LOCK_KEY, count_copurchases, refresh_recommendations,
+    top_neighbors,
+)
+from .factory import SkuFactory
+
+
+def settle_orders():
+    """ Backdate order products so that they are counted """
+    OrderProduct.objects.update(
+        created_at=datetime.now(timezone.utc) - timedelta(hours=1))
+
+
+class TestRecommendations(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.skus = [SkuFactory() for _ in range(5)]
+
+    def tearDown(self):
+        get_redis_connection('default').flushdb()
+
+    def order(self, *indexes):
+        order = OrderFactory()
+        for index in indexes:
+            OrderProductFactory(order=order, product=self.skus[index])
+
+    def recommended(self, index):
+        ids = [sku.id for sku in self.skus]
+        return [ids.index(sku_id) for sku_id in
+                get_recommended_product_ids(self.skus[index].id)]
+
+    def test_count_copurchases(self):
+        counts = count_copurchases(
+            np.array([1, 1, 1, 2, 2]), np.array([0, 1, 1, 1, 2]), 3)
+        self.assertEqual(counts.toarray().tolist(),
+                         [[1, 1, 0], [1, 2, 1], [0, 1, 1]])
+
+    def test_top_neighbors_by_cosine_similarity(self):
+        counts = count_copurchases(
+            np.array([1, 1, 2, 2, 3, 3, 4, 4, 5, 5, 6]),
+            np.array([0, 1, 0, 1, 0, 2, 0, 2, 2, 3, 2]), 4)
+        neighbors = top_neighbors(counts, [0, 1, 2, 3], k=2)
+        # 1 is only bought with 0, 2 is bought with many others
+        self.assertEqual(neighbors, {0: [1, 2], 1: [0], 2: [0], 3: []})
+
+    def test_full_refresh(self):
+        self.order(0, 1, 2)
+        self.order(0, 1)
+        self.order(0, 2, 3)
+        self.order(0, 2)
+        self.order(3, 4)
+        settle_orders()
+        with self.assertNumQueries(1):
+            refresh_recommendations()
+
+        # 2 is bought with 0 more often, relative to the orders of both
+        self.assertEqual(self.recommended(0), [2, 1])
+        self.assertEqual(self.recommended(2), [0])
+        self.assertEqual(self.recommended(4), [])
+
+    def test_unsettled_orders_not_counted(self):
+        self.order(0, 1)
+        self.order(0, 1)
+        refresh_recommendations()
+        self.assertEqual(self.recommended(0), [])
+        self.assertEqual(int(get_redis_connection('default').get(LAST_ID_KEY)), 0)
+
+    def test_incremental_refresh(self):
+        self.order(0, 1)
+        self.order(0, 1)
+        settle_orders()
+        refresh_recommendations()
+        self.assertEqual(self.recommended(1), [0])
+
+        self.order(1, 2)
+        self.order(1, 2)
+        self.order(1, 2, 3)
+        settle_orders()
+        # products bought with 1 before are rescored too
+        self.assertEqual(refresh_recommendations(), 4)
+        self.assertEqual(self.recommended(1), [2, 0])
+        self.assertEqual(self.recommended(0), [1])
+        # nothing new
+        self.assertEqual(refresh_recommendations(), 0)
+
+        refresh_recommendations(full=True)
+        self.assertEqual(self.recommended(1), [2, 0])
+
+    def test_expired_lock_not_raised(self):
+        self.order(0, 1)
+        self.order(0, 1)
+        settle_orders()
+        conn = get_redis_connection('default')
+        with mock.patch('shop.recommendations._refresh',
+                        side_effect=lambda *args: conn.delete(LOCK_KEY) or 1):
+            self.assertEqual(refresh_recommendations(), 1)
+
+    def test_detail_page_shows_recommendations(self):
+        category = self.skus[0].category
+        same_category = [SkuFactory(category=category) for _ in range(3)]
+        self.order(0, 4)
+        self.order(0, 4)
+        settle_orders()
+        refresh_recommendations()
+        res = self.client.get(self.skus[0].get_absolute_url())
+        related = [product.id for product in res.context['related_products']]
+        self.assertEqual(related[0], self.skus[4].id)
+        self.assertCountEqual(related[1:], [sku.id for sku in same_category])
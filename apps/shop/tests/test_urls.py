@@ -1,7 +1,7 @@
 from django.test import SimpleTestCase
 from django.urls import reverse, resolve
 
-from shop.views import ProductListView, ProductDetailView, IndexView
+from shop.views import ProductListView, ProductDetailView, IndexView, ProductSuggestView
 
 
 class TestShopUrls(SimpleTestCase):
@@ -31,3 +31,9 @@ class TestShopUrls(SimpleTestCase):
         self.assertEqual(url, '/shop/1/awesome-item/')
         self.assertEqual(resolve(url).func.__name__,
                          ProductDetailView.as_view().__name__)
+
+    def test_product_suggest_url(self):
+        url = reverse('shop:product-suggest')
+        self.assertEqual(url, '/search/suggest/')
+        self.assertEqual(resolve(url).func.__name__,
+                         ProductSuggestView.as_view().__name__)
@@ -5,9 +5,11 @@ from django.urls import reverse
 from django.contrib.messages import get_messages
 
 import tempfile
+from unittest import mock
 from PIL import Image
 
 from django_redis import get_redis_connection
+from shop.cache import get_random_trending_product_ids, set_trending_product_ids
 from shop.views import ProductListView
 from .factory import BannerFactory, SkuFactory, CategoryFactory
 
@@ -95,6 +97,26 @@ class TestShopListView(TestCase):
         self.assertFalse(res.context['is_paginated'])
         self.assertTemplateUsed(res, 'shop/product-list.html')
 
+    def test_shop_list_search_result_cached(self):
+        kw = 'crapy'
+        SkuFactory(name=kw)
+        self.client.get(self.url+f'?search={kw}')
+        # factory mutes post_save, catalog version is not bumped
+        SkuFactory(name=f'{kw} {kw}')
+        res = self.client.get(self.url+f'?search=%20{kw.upper()}')
+
+        self.assertEqual(len(res.context['products']), 1)
+
+    def test_shop_list_search_cache_invalidated_on_save(self):
+        kw = 'crapy'
+        SkuFactory(name=kw)
+        self.client.get(self.url+f'?search={kw}')
+        new_sku = SkuFactory(name=f'{kw} {kw}')
+        new_sku.save()
+        res = self.client.get(self.url+f'?search={kw}')
+
+        self.assertEqual(len(res.context['products']), 2)
+
     def test_shop_list_no_result_found(self):
         res = self.client.get(
             self.url+'?search=randomstuff')
@@ -134,6 +156,61 @@ class TestShopListView(TestCase):
         res = self.client.get(self.url)
         wl_count = res.context['wishlist_count']
         self.assertEqual(int(wl_count), 10)
+        self.assertTrue(all(product.wishlist for product in res.context['products']))
+
+    def test_shop_list_facet_counts(self):
+        res = self.client.get(self.url)
+        facets = res.context['facets']
+        self.assertEqual(sum(v['count'] for v in facets['origin']), 10)
+        self.assertEqual(facets['price'][0]['count'], 10)
+
+    def test_shop_list_filter_by_facet(self):
+        sku = SkuFactory(brand='ippodo', price=12000)
+        res = self.client.get(self.url, {'price': 4})
+        self.assertEqual(list(res.context['products']), [sku])
+        price = res.context['facets']['price'][0]
+        self.assertTrue(price['active'])
+        self.assertNotIn('price', price['query'])
+
+        res = self.client.get(self.url, {'brand': 'ippodo', 'page': 1})
+        brand = res.context['facets']['brand'][0]
+        self.assertEqual((brand['label'], brand['count']), ('ippodo', 1))
+        self.assertNotIn('page', brand['query'])
+
+    def test_shop_list_filter_by_tags(self):
+        both, matcha = SkuFactory(), SkuFactory()
+        both.tags.add('Uji Matcha', 'gift')
+        matcha.tags.add('Uji Matcha')
+        SkuFactory().tags.add('sencha')
+        res = self.client.get(self.url, {'tag': ['uji matcha', 'gift']})
+        self.assertEqual(list(res.context['products']), [both])
+
+        res = self.client.get(
+            self.url, {'tag': ['gift', 'uji-matcha'], 'tag_match': 'any'})
+        self.assertCountEqual(res.context['products'], [both, matcha])
+
+    def test_shop_list_tag_facet_toggles_tags(self):
+        sku = SkuFactory()
+        sku.tags.add('matcha', 'gift')
+        res = self.client.get(self.url, {'tag': 'matcha'})
+        facets = {value['value']: value for value in res.context['facets']['tag']}
+        self.assertTrue(facets['matcha']['active'])
+        self.assertNotIn('tag=', facets['matcha']['query'])
+        self.assertFalse(facets['gift']['active'])
+        self.assertIn('tag=gift&tag=matcha', facets['gift']['query'])
+
+    def test_shop_list_facet_counts_cached(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(2):
+            # product page and images only
+            self.client.get(self.url)
+
+    def test_shop_list_facet_counts_shared_by_orderings(self):
+        self.client.get(self.url)
+        with mock.patch('shop.views.count_facets') as count_facets:
+            res = self.client.get(self.url, {'sorting': 'price'})
+        count_facets.assert_not_called()
+        self.assertEqual(sum(v['count'] for v in res.context['facets']['origin']), 10)
 
     def test_recursive_category_set_in_context(self):
         parent = CategoryFactory(name='parent')
@@ -158,6 +235,9 @@ class TestShopDetailView(TestCase):
     def setUp(self) -> None:
         self.client = Client()
 
+    def tearDown(self):
+        get_redis_connection("default").flushdb()
+
     @classmethod
     def setUpTestData(cls) -> None:
         cls.sku = SkuFactory()
@@ -195,6 +275,24 @@ class TestShopDetailView(TestCase):
         self.assertEqual(len(images), 3)
         self.assertCountEqual(images, self.sku.images.all())
 
+    def test_detail_payload_cached(self):
+        url = reverse('shop:product-detail',
+                      kwargs={'pk': self.sku.id, 'slug': self.sku.slug})
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            # no related products, categories are cached as well
+            res = self.client.get(url)
+        self.assertEqual(res.context['product'], self.sku)
+        self.assertEqual(len(res.context['images']), 3)
+
+    def test_detail_payload_invalidated_by_image(self):
+        url = reverse('shop:product-detail',
+                      kwargs={'pk': self.sku.id, 'slug': self.sku.slug})
+        self.client.get(url)
+        self.sku.images.first().delete()
+        res = self.client.get(url)
+        self.assertEqual(len(res.context['images']), 2)
+
     def test_item_does_not_exist(self):
         res = self.client.get(reverse(
             'shop:product-detail', kwargs={'pk': self.sku.id+100, 'slug': self.sku.slug+'random'}))
@@ -215,6 +313,9 @@ class TestShopIndexView(TestCase):
     def setUp(self) -> None:
         self.client = Client()
 
+    def tearDown(self):
+        get_redis_connection("default").flushdb()
+
     @classmethod
     def setUpTestData(cls) -> None:
         cls.sku = SkuFactory()
@@ -230,3 +331,151 @@ class TestShopIndexView(TestCase):
         self.assertEqual(len(products), 5)
         self.assertEqual(res.status_code, 200)
         self.assertTemplateUsed(res, 'index.html')
+
+    def test_index_view_sample_trending_set(self):
+        trending = [SkuFactory().id for _ in range(10)]
+        get_redis_connection('default').sadd('trending_products', *trending)
+        res = self.client.get(self.url)
+        products = res.context['products']
+
+        self.assertEqual(len(products), 7)
+        self.assertTrue(all(product.id in trending for product in products))
+
+    def test_index_view_empty_trending_set_cached(self):
+        self.assertIsNone(get_random_trending_product_ids(7))
+        set_trending_product_ids([])
+        self.assertEqual(get_random_trending_product_ids(7), [])
+        with mock.patch('shop.views.refresh_trending_products') as refresh:
+            res = self.client.get(self.url)
+        refresh.assert_not_called()
+        self.assertEqual(len(res.context['products']), 0)
+
+    def test_index_view_wishlist_flags(self):
+        user = UserFactory()
+        self.client.force_login(user)
+        trending = [SkuFactory().id for _ in range(3)]
+        get_redis_connection('default').sadd('trending_products', *trending)
+        get_redis_connection('cart').sadd(f'wish_{user.id}', trending[0])
+        res = self.client.get(self.url)
+        flags = {product.id: product.wishlist for product in res.context['products']}
+        self.assertEqual(flags, {trending[0]: True, trending[1]: False, trending[2]: False})
+        get_redis_connection('cart').flushdb()
+
+
+class TestProductSuggestView(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+
+    def tearDown(self):
+        get_redis_connection("default").flushdb()
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.url = reverse('shop:product-suggest')
+        cls.sku = SkuFactory(name='uji matcha powder')
+        for i in range(10):
+            SkuFactory(name=f'sencha leaves {i}')
+
+    def test_suggest_with_typo(self):
+        res = self.client.get(self.url, {'q': 'mattcha'})
+        suggestions = res.json()['suggestions']
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(suggestions[0]['id'], self.sku.id)
+        self.assertEqual(suggestions[0]['url'], self.sku.get_absolute_url())
+
+    def test_suggest_result_bounded(self):
+        res = self.client.get(self.url, {'q': 'sencha'})
+        self.assertEqual(len(res.json()['suggestions']), 8)
+
+    def test_suggest_query_too_short(self):
+        with self.assertNumQueries(0):
+            res = self.client.get(self.url, {'q': ' m '})
+        self.assertEqual(res.json()['suggestions'], [])
+
+    def test_suggest_served_from_cache(self):
+        res1 = self.client.get(self.url, {'q': 'Uji  Matcha'})
+        with self.assertNumQueries(0):
+            res2 = self.client.get(self.url, {'q': 'uji matcha'})
+        self.assertEqual(res1.json(), res2.json())
+
+
+class TestProductFeedView(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+
+    def tearDown(self):
+        get_redis_connection("default").flushdb()
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.url = reverse('shop:product-feed')
+        cls.category = CategoryFactory()
+        # equal prices to page through the id tiebreaker
+        cls.skus = [SkuFactory(price=500 if i % 2 else 800, category=cls.category)
+                    for i in range(7)]
+        SkuFactory(status='OFF', category=cls.category)
+
+    def walk(self, **params):
+        ids, cursor = [], None
+        while True:
+            query = {**params, 'limit': 3}
+            if cursor:
+                query['cursor'] = cursor
+            data = self.client.get(self.url, query).json()
+            self.assertEqual(data['res'], 1)
+            ids += [product['id'] for product in data['products']]
+            cursor = data['next']
+            if cursor is None:
+                return ids
+
+    def test_feed_pages_latest_products(self):
+        ids = self.walk()
+        self.assertEqual(ids, sorted([sku.id for sku in self.skus], reverse=True))
+
+    def test_feed_pages_tied_prices_by_id(self):
+        ids = self.walk(sorting='price')
+        expected = sorted(self.skus, key=lambda sku: (sku.price, sku.id))
+        self.assertEqual(ids, [sku.id for sku in expected])
+        ids = self.walk(sorting='-price')
+        self.assertEqual(ids, [sku.id for sku in expected[::-1]])
+
+    def test_feed_page_not_shifted_by_new_product(self):
+        data = self.client.get(self.url, {'limit': 3}).json()
+        SkuFactory()
+        data = self.client.get(self.url, {'limit': 3, 'cursor': data['next']}).json()
+        self.assertEqual([product['id'] for product in data['products']],
+                         [sku.id for sku in self.skus[3::-1][:3]])
+
+    def test_feed_filter_category(self):
+        SkuFactory()
+        ids = self.walk(category=self.category.slug)
+        self.assertEqual(len(ids), 7)
+
+    def test_feed_filter_tags(self):
+        self.skus[0].tags.add('matcha', 'gift')
+        self.skus[1].tags.add('matcha')
+        ids = self.walk(tag=['matcha', 'gift'])
+        self.assertEqual(ids, [self.skus[0].id])
+        ids = self.walk(tag=['matcha', 'gift'], tag_match='any')
+        self.assertEqual(ids, [self.skus[1].id, self.skus[0].id])
+
+    def test_feed_wishlist_flags(self):
+        user = UserFactory()
+        self.client.force_login(user)
+        get_redis_connection('cart').sadd(f'wish_{user.id}', self.skus[-1].id)
+        products = self.client.get(self.url, {'limit': 2}).json()['products']
+        self.assertEqual([product['wishlist'] for product in products], [True, False])
+        get_redis_connection('cart').flushdb()
+
+    def test_feed_invalid_cursor(self):
+        data = self.client.get(self.url, {'limit': 3}).json()
+        res = self.client.get(self.url, {'sorting': 'sales', 'cursor': data['next']})
+        self.assertEqual(res.json()['res'], 0)
+        res = self.client.get(self.url, {'cursor': 'forged'})
+        self.assertEqual(res.json()['res'], 0)
+
+    def test_feed_page_in_one_query(self):
+        data = self.client.get(self.url, {'limit': 3}).json()
+        with self.assertNumQueries(1):
+            self.client.get(self.url, {'limit': 3, 'cursor': data['next']})
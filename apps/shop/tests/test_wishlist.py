@@ -0,0 +1,51 @@
+from django.test import TestCase
+
+from unittest import mock
+
+from django_redis import get_redis_connection
+
+from cart.repository import check_wishlist
+from shop.cache import ProductIdList
+from shop.models import ProductSKU
+from shop.wishlist import WishlistProducts
+from .factory import SkuFactory
+
+
+class TestWishlistProducts(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sku_ids = [SkuFactory().id for _ in range(6)]
+
+    def setUp(self):
+        self.conn = get_redis_connection('cart')
+        self.conn.sadd('wish_1', self.sku_ids[1], self.sku_ids[4], 99999)
+
+    def tearDown(self):
+        self.conn.flushdb()
+
+    def test_flags_set_after_fetch(self):
+        products = WishlistProducts(
+            ProductSKU.objects.filter(id__in=self.sku_ids).order_by('id'), 1)
+        with mock.patch('shop.wishlist.check_wishlist', wraps=check_wishlist) as check:
+            flags = [product.wishlist for product in products]
+            # evaluated once
+            list(products)
+        check.assert_called_once()
+        self.assertEqual(flags, [False, True, False, False, True, False])
+
+    def test_slice_checks_page_only(self):
+        products = WishlistProducts(
+            ProductIdList(self.sku_ids, ProductSKU.objects.all()), 1)
+        self.assertEqual(len(products), 6)
+        with mock.patch('shop.wishlist.check_wishlist', wraps=check_wishlist) as check:
+            page = products[3:6]
+            self.assertEqual([product.wishlist for product in page],
+                             [False, True, False])
+        check.assert_called_once_with(1, self.sku_ids[3:6])
+
+    def test_guest_without_redis(self):
+        products = WishlistProducts(ProductSKU.objects.filter(id__in=self.sku_ids))
+        with mock.patch('shop.wishlist.check_wishlist') as check:
+            self.assertFalse(any(product.wishlist for product in products))
+        check.assert_not_called()
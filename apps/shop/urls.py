@@ -1,5 +1,7 @@
 from django.urls import path
-from .views import IndexView, ProductListView, ProductDetailView
+from .views import (
+    IndexView, ProductListView, ProductDetailView, ProductFeedView, ProductSuggestView,
+)
 
 
 app_name = 'shop'
@@ -7,6 +9,8 @@ app_name = 'shop'
 urlpatterns = [
     path('', IndexView.as_view(), name='index'),
     path('shop/', ProductListView.as_view(), name='product-list'),
+    path('shop/feed/', ProductFeedView.as_view(), name='product-feed'),
+    path('search/suggest/', ProductSuggestView.as_view(), name='product-suggest'),
     path('shop/<slug:category_slug>/',
          ProductListView.as_view(), name='category-list'),
     path('shop/<int:pk>/<slug:slug>/',
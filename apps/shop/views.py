@@ -1,12 +1,27 @@
 from django.contrib import messages
-from django.shortcuts import get_object_or_404
-from django.views.generic import ListView, DetailView
+from django.core.cache import cache
+from django.http import Http404, JsonResponse
+from django.urls import reverse
+from django.views.generic import ListView, DetailView, View
 
 import logging
 
-from django_redis import get_redis_connection
+from cart.repository import record_view
 
-from .models import ProductSKU, Category, HomeBanner
+from .cache import (
+    ProductIdList, get_catalog_version, get_facet_counts, get_product_detail,
+    get_random_trending_product_ids, get_recommended_product_ids,
+    get_related_product_ids,
+    get_search_result_ids, search_result_key,
+)
+from .category_index import get_category_id
+from .facets import (
+    count_facets, filter_facets, get_facet_filters, get_tag_filters,
+)
+from .models import ProductSKU, HomeBanner
+from .pagination import KEYSET_ORDERINGS, InvalidCursor, keyset_page
+from .tasks import refresh_trending_products
+from .wishlist import WishlistProducts
 
 logger = logging.getLogger(__name__)
 
@@ -16,13 +31,13 @@ class IndexView(ListView):
     context_object_name = 'products'
 
     def get_queryset(self):
-        try:
-            queryset = ProductSKU.objects.get_trending_products().\
-                order_by('?')[:7]
-            # logger.info('fetch database for index page')
-        except ValueError:
-            queryset = []
-        return queryset
+        # sample from the trending set computed by celery beat
+        sku_ids = get_random_trending_product_ids(7)
+        if sku_ids is None:
+            # not computed yet, e.g. right after a deploy
+            sku_ids = refresh_trending_products()[:7]
+        return WishlistProducts(
+            ProductSKU.objects.filter(id__in=sku_ids), self.request.user.id)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -41,41 +56,94 @@ class ProductListView(ListView):
     def get_ordering(self):
         ordering = self.request.GET.get('sorting', '-created_at')
         # validate ordering
-        if ordering not in ['-created_at', 'sales', 'price', '-price']:
+        if ordering not in ['-created_at', 'sales', 'price', '-price', '-review_avg']:
             messages.info(self.request, 'Sorted by default (latest).')
             ordering = '-created_at'
         return ordering
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        """
+        Return a lazy list over the cached ranked ids of current filters,
+        the search is only evaluated once per catalog version, pages are
+        served by slicing the id list.
+        """
+        search_term = self.request.GET.get('search', '')
+        category_slug = self.kwargs.get('category_slug', '')
+        tags, tags_match_all = get_tag_filters(self.request.GET)
+        ordering = self.get_ordering()
+        facets = get_facet_filters(self.request.GET)
+
+        key = search_result_key(search_term, category_slug, tags, ordering, facets,
+                                tags_match_all)
+
+        def filtered():
+            return self.filter_queryset(
+                search_term, category_slug, tags, ordering, facets, tags_match_all)
+        sku_ids = get_search_result_ids(key, filtered)
+        # facet counts are aggregated with the same filters, they do not depend
+        # on the ordering, so all orderings share one cache key
+        self.facet_key = search_result_key(
+            search_term, category_slug, tags, '', facets, tags_match_all)
+        self.filtered = filtered
+        if not sku_ids:
+            messages.error(self.request, 'No results found!')
+
+        # wishlist flags are checked for the products of the page only
+        return WishlistProducts(
+            ProductIdList(sku_ids, ProductSKU.objects.all()), self.request.user.id)
+
+    def filter_queryset(self, search_term, category_slug, tags, ordering, facets=None,
+                        tags_match_all=True):
+        queryset = ProductSKU.objects.all()
 
         # check if user input a search text, consider to asign seperate route for search
-        search_term = self.request.GET.get('search')
         if search_term:
             queryset = ProductSKU.objects.search(search_term)
 
         # check if search by category
-        category_slug = self.kwargs.get('category_slug')
         if category_slug:
-            category = get_object_or_404(Category, slug=category_slug)
+            category_id = get_category_id(category_slug)
+            if category_id is None:
+                raise Http404('Category does not exist')
             queryset = ProductSKU.objects.filter_category_products(
-                category, queryset)
+                category_id, queryset)
 
-        # check if search by tag
-        tag = self.request.GET.get('tag')
-        if tag:
-            queryset = queryset.filter(tags__name__in=[tag])
-        if queryset.count() == 0:
-            messages.error(self.request, 'No results found!')
-        queryset = queryset.order_by(self.get_ordering())
+        # check if search by tags, all of them or any of them
+        queryset = ProductSKU.objects.filter_tags(queryset, tags, tags_match_all)
 
-        # check if item is wishlisted
-        user = self.request.user
-        if user.is_authenticated:
-            queryset = ProductSKU.objects.filter_wishlisted_products(
-                user.id, queryset)
+        queryset = filter_facets(queryset, facets or {})
 
-        return queryset
+        return queryset.order_by(ordering)
+
+    def get_facets(self):
+        """
+        Return facet counts of the current results, with the query string
+        to select each value or clear the selected one, pages are reset.
+        """
+        facets = get_facet_counts(
+            self.facet_key, lambda: count_facets(self.filtered()))
+        params = self.request.GET.copy()
+        params.pop('page', None)
+        # tags are combined, the others replace the selected value
+        tags, _ = get_tag_filters(params)
+        for value in facets['tag']:
+            value['active'] = value['value'] in tags
+            selected = params.copy()
+            selected.setlist('tag', sorted(set(tags) ^ {value['value']}))
+            value['query'] = selected.urlencode()
+        for name, values in facets.items():
+            if name == 'tag':
+                continue
+            current = params.get(name, '')
+            for value in values:
+                value['active'] = current == str(value['value'])
+                selected = params.copy()
+                if value['active']:
+                    selected.pop(name)
+                else:
+                    selected[name] = value['value']
+                value['query'] = selected.urlencode()
+        return facets
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -87,6 +155,7 @@ class ProductListView(ListView):
                 category = category.replace('and', '&')
             context['category'] = category
 
+        context['facets'] = self.get_facets()
         return context
 
 
@@ -94,40 +163,141 @@ class ProductDetailView(DetailView):
     model = ProductSKU
     context_object_name = 'product'
     template_name = 'shop/product-detail.html'
+    related_count = 4
 
     def get(self, request, *args, **kwargs):
-        self.object = self.get_object()
+        # product, images and reviews are read through cache, invalidated by signals
+        self.payload = get_product_detail(
+            self.kwargs.get(self.pk_url_kwarg), self.get_detail_payload)
+        self.object = self.payload['product']
         context = self.get_context_data(object=self.object)
         # add view history, share same redis server with cart, saved as list
         user = request.user
         if user.is_authenticated:
-            conn = get_redis_connection('cart')
-            history_key = f'history_{user.id}'
-            product_id = self.object.id
-            # remove product if already existed in history
-            conn.lrem(history_key, 0, product_id)
-            # push current product to the beginning of list
-            conn.lpush(history_key, product_id)
-            # only save 8 historical products
-            conn.ltrim(history_key, 0, 7)
-
-            wishlisted = conn.sismember(f'wish_{user.id}', product_id)
-            if wishlisted:
+            # history update and wishlist check in one round trip
+            if record_view(user.id, self.object.id):
                 self.object.wishlist = True
 
         return self.render_to_response(context)
 
     def get_queryset(self):
         return super().get_queryset().select_related('category')\
-            .prefetch_related('order_products__review')
+            .prefetch_related('tags')
+
+    def get_detail_payload(self):
+        """
+        Build the cacheable part of the detail page, raise 404 if not found.
+        """
+        product = self.get_object()
+        order_products = product.order_products.select_related('review__user')
+        return {
+            'product': product,
+            'images': list(product.images.all()),
+            'reviews': [op.review for op in order_products if op.is_reviewed],
+        }
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         product = self.object
-        context['images'] = product.images.all()
-        context['related_products'] = ProductSKU.objects.get_related_products(
-            product)[:4]
+        context['images'] = self.payload['images']
+        # products often bought together first, computed offline
+        related_ids = get_recommended_product_ids(product.id)
+        if len(related_ids) < self.related_count:
+            # too few orders yet, fill up with the same category
+            related_ids += [sku_id for sku_id in get_related_product_ids(
+                product.id, lambda: ProductSKU.objects.get_related_products(
+                    product)[:self.related_count]) if sku_id not in related_ids]
+        # products off the shelf are filtered out by the page query
+        products = ProductIdList(related_ids, ProductSKU.objects.all())[:]
+        context['related_products'] = WishlistProducts(
+            products[:self.related_count], self.request.user.id)
 
-        context['reviews'] = [
-            op.review for op in product.order_products.all() if op.is_reviewed]
+        context['reviews'] = self.payload['reviews']
         return context
+
+
+class ProductFeedView(View):
+    """
+    Product listing for infinite scroll, receive ajax GET request with query params
+    sorting, category, tag (repeated), tag_match, cursor and limit, response a page
+    of products and the cursor of the next page. Pages are read with keyset pagination,
+    so that deep pages cost the same as the first one and rows inserted meanwhile
+    never shift the pages into duplicates.
+    """
+    default_limit = 12
+    max_limit = 48
+
+    def get(self, request, *args, **kwargs):
+        ordering = request.GET.get('sorting', '-created_at')
+        if ordering not in KEYSET_ORDERINGS:
+            ordering = '-created_at'
+        try:
+            limit = min(int(request.GET.get('limit', self.default_limit)),
+                        self.max_limit)
+        except ValueError:
+            limit = self.default_limit
+        if limit < 1:
+            limit = self.default_limit
+
+        # only the cover image is listed, one query per page
+        queryset = ProductSKU.objects.prefetch_related(None)
+        category_slug = request.GET.get('category', '')
+        if category_slug:
+            category_id = get_category_id(category_slug)
+            if category_id is None:
+                return JsonResponse({'res': 0, 'errmsg': 'Category does not exist'})
+            queryset = ProductSKU.objects.filter_category_products(
+                category_id, queryset)
+        tags, tags_match_all = get_tag_filters(request.GET)
+        queryset = ProductSKU.objects.filter_tags(queryset, tags, tags_match_all)
+
+        try:
+            products, next_cursor = keyset_page(
+                queryset, ordering, request.GET.get('cursor'), limit)
+        except InvalidCursor:
+            return JsonResponse({'res': 0, 'errmsg': 'Invalid cursor'})
+        products = WishlistProducts(products, request.user.id)
+
+        return JsonResponse({'res': 1, 'next': next_cursor, 'products': [{
+            'id': product.id,
+            'name': product.name,
+            'price': int(product.price),
+            'url': product.get_absolute_url(),
+            'cover_img': product.cover_img.url if product.cover_img else '',
+            'label': product.get_product_label(),
+            'badge': product.get_label_badge(),
+            'wishlist': product.wishlist,
+        } for product in products]})
+
+
+class ProductSuggestView(View):
+    """
+    Autocomplete for the search box, receive ajax GET request with query param q,
+    response a bounded list of product names with similar words.
+    Results are cached in redis by the normalized query, so hot prefixes
+    typed by many customers are served without touching the database.
+    """
+    min_length = 2
+    max_length = 50
+    limit = 8
+    cache_timeout = 60 * 10
+
+    def get(self, request, *args, **kwargs):
+        search_text = ' '.join(request.GET.get('q', '').lower().split())
+        search_text = search_text[:self.max_length]
+        if len(search_text) < self.min_length:
+            return JsonResponse({'res': 1, 'suggestions': []})
+
+        cache_key = f'suggest_{get_catalog_version()}_{search_text}'
+        suggestions = cache.get(cache_key)
+        if suggestions is None:
+            products = ProductSKU.objects.suggest(search_text, self.limit)
+            suggestions = [{
+                'id': product['id'],
+                'name': product['name'],
+                'url': reverse('shop:product-detail', kwargs={
+                    'pk': product['id'], 'slug': product['slug']}),
+            } for product in products]
+            cache.set(cache_key, suggestions, self.cache_timeout)
+
+        return JsonResponse({'res': 1, 'suggestions': suggestions})
@@ -0,0 +1,50 @@
+"""
+Wishlist flags of listed products, set after the products are fetched,
+so that product queries never carry the wishlist of the user.
+"""
+from cart.repository import check_wishlist
+
+
+class WishlistProducts:
+    """
+    A lazy sequence over products, e.g. a queryset, a list or a ProductIdList,
+    adding a boolean property 'wishlist' to each product once they are fetched.
+    Membership of the fetched ids is checked with one redis round trip,
+    guests (user_id None) get False without any. Slicing wraps the slice,
+    so a paginator fetches and checks the products of one page only.
+    """
+
+    def __init__(self, products, user_id=None):
+        self.products = products
+        self.user_id = user_id
+        self._result = None
+
+    def _fetch(self):
+        if self._result is None:
+            products = list(self.products)
+            if self.user_id is None:
+                flags = [False] * len(products)
+            else:
+                flags = check_wishlist(
+                    self.user_id, [product.id for product in products])
+            for product, flag in zip(products, flags):
+                product.wishlist = flag
+            self._result = products
+        return self._result
+
+    def __len__(self):
+        if self._result is None:
+            # counting a ProductIdList is free, a queryset caches its rows
+            return len(self.products)
+        return len(self._result)
+
+    def __iter__(self):
+        return iter(self._fetch())
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice) and self._result is None:
+            return WishlistProducts(self.products[index], self.user_id)
+        return self._fetch()[index]
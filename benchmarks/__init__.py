@@ -0,0 +1,6 @@
+"""
+Regression benchmarks of the main pages and celery jobs on a seeded catalog,
+kept out of the test suite since seeding takes minutes, run with
+    python manage.py test benchmarks --pattern="bench_*.py"
+Set BENCH_SCALE (default 1, i.e. 10k SKUs and 100k orders) to run on a smaller catalog.
+"""
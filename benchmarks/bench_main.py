@@ -0,0 +1,120 @@
+import sys
+
+from django.test import TestCase
+from django.urls import reverse
+from django_redis import get_redis_connection
+
+from cart.repository import cart_key
+from order.tasks import (
+    auto_cancel_orders, auto_complete_orders, expire_payments,
+    reconcile_stock_reservations,
+)
+from shop.tasks import (
+    refresh_catalog_stats, refresh_recommendations, refresh_trending_products,
+)
+from .budgets import JOBS, PAGES, measure
+from .seed import seed_catalog
+
+
+class TestMainBenchmarks(TestCase):
+    """
+    Each page and job runs once with cold caches on the seeded catalog,
+    the measurements are reported at the end and checked against the budgets.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_catalog()
+        cls.report = []
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        sys.stderr.write('\n' + '\n'.join(cls.report) + '\n')
+
+    def setUp(self):
+        get_redis_connection('default').flushdb()
+        get_redis_connection('cart').flushdb()
+
+    def tearDown(self):
+        get_redis_connection('default').flushdb()
+        get_redis_connection('cart').flushdb()
+
+    def check_budget(self, name, budget, measurement):
+        self.report.append(f'{name:30s} {measurement}')
+        exceeded = measurement.exceeds(budget)
+        self.assertFalse(exceeded, f'{name} over budget: {", ".join(exceeded)}')
+
+    def bench_page(self, name, url, params=None, login=False):
+        if login:
+            self.client.force_login(self.data['customer'])
+        with measure() as measurement:
+            res = self.client.get(url, params)
+        self.assertEqual(res.status_code, 200)
+        self.check_budget(name, PAGES[name], measurement)
+
+    def bench_job(self, name, job):
+        with measure() as measurement:
+            job()
+        self.check_budget(name, JOBS[name], measurement)
+
+    def fill_cart(self):
+        customer = self.data['customer']
+        get_redis_connection('cart').hset(
+            cart_key(customer.id), mapping=dict(self.data['cart']))
+
+    def test_index(self):
+        self.bench_page('index', reverse('shop:index'))
+
+    def test_product_list(self):
+        self.bench_page('product list', reverse('shop:product-list'))
+
+    def test_product_list_search(self):
+        self.bench_page('product list search', reverse('shop:product-list'),
+                        {'search': 'awesome item', 'page': 2})
+
+    def test_product_list_category(self):
+        self.bench_page('product list category', reverse(
+            'shop:category-list', kwargs={'category_slug': self.data['category'].slug}),
+            {'sorting': 'sales'})
+
+    def test_product_list_tag(self):
+        self.bench_page('product list tag', reverse('shop:product-list'),
+                        {'tag': self.data['tag'].slug, 'sorting': 'price'})
+
+    def test_product_detail(self):
+        self.bench_page('product detail',
+                        self.data['product'].get_absolute_url(), login=True)
+
+    def test_cart(self):
+        self.fill_cart()
+        self.bench_page('cart', reverse('cart:info'), login=True)
+
+    def test_checkout(self):
+        self.fill_cart()
+        self.bench_page('checkout', reverse('cart:checkout'), login=True)
+
+    def test_order_list(self):
+        self.bench_page('order list', reverse('account:order'), login=True)
+
+    def test_expire_payments(self):
+        self.bench_job('expire payments', expire_payments)
+
+    def test_auto_cancel_orders(self):
+        self.bench_job('auto cancel orders', auto_cancel_orders)
+
+    def test_auto_complete_orders(self):
+        self.bench_job('auto complete orders', auto_complete_orders)
+
+    def test_refresh_trending_products(self):
+        self.bench_job('refresh trending products', refresh_trending_products)
+
+    def test_refresh_catalog_stats(self):
+        self.bench_job('refresh catalog stats', refresh_catalog_stats)
+
+    def test_reconcile_stock_reservations(self):
+        self.bench_job('reconcile stock reservations',
+                       reconcile_stock_reservations)
+
+    def test_refresh_recommendations(self):
+        self.bench_job('refresh recommendations', refresh_recommendations)
@@ -0,0 +1,65 @@
+"""
+Budgets of the benchmarks, on the full size catalog with cold caches.
+Query counts are meant to be tight, a new query per row (N+1) breaks them
+at once, times leave room for slower machines and only catch scans and sorts.
+"""
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+Budget = namedtuple('Budget', ['queries', 'sql_ms', 'wall_ms'])
+
+
+class Measurement:
+    queries = 0
+    sql_ms = 0.0
+    wall_ms = 0.0
+
+    def exceeds(self, budget):
+        """ Return the list of exceeded limits as readable strings """
+        return [f'{name} {getattr(self, name):.0f} > {limit}'
+                for name, limit in budget._asdict().items()
+                if getattr(self, name) > limit]
+
+    def __str__(self):
+        return (f'{self.queries:4d} queries {self.sql_ms:9.1f} ms SQL '
+                f'{self.wall_ms:9.1f} ms wall')
+
+
+@contextmanager
+def measure():
+    """ Record query count, total SQL time and wall time of the block """
+    measurement = Measurement()
+    with CaptureQueriesContext(connection) as context:
+        start = time.perf_counter()
+        yield measurement
+        measurement.wall_ms = (time.perf_counter() - start) * 1000
+    measurement.queries = len(context.captured_queries)
+    measurement.sql_ms = sum(
+        float(query['time']) for query in context.captured_queries) * 1000
+
+
+PAGES = {
+    'index': Budget(queries=7, sql_ms=300, wall_ms=1500),
+    'product list': Budget(queries=5, sql_ms=300, wall_ms=1500),
+    'product list search': Budget(queries=5, sql_ms=500, wall_ms=2000),
+    'product list category': Budget(queries=6, sql_ms=300, wall_ms=1500),
+    'product list tag': Budget(queries=5, sql_ms=500, wall_ms=2000),
+    'product detail': Budget(queries=9, sql_ms=500, wall_ms=3000),
+    'cart': Budget(queries=4, sql_ms=100, wall_ms=1000),
+    'checkout': Budget(queries=5, sql_ms=100, wall_ms=1000),
+    'order list': Budget(queries=8, sql_ms=300, wall_ms=1500),
+}
+
+JOBS = {
+    'expire payments': Budget(queries=10, sql_ms=1000, wall_ms=2000),
+    'auto cancel orders': Budget(queries=100, sql_ms=5000, wall_ms=8000),
+    'auto complete orders': Budget(queries=160, sql_ms=5000, wall_ms=8000),
+    'refresh trending products': Budget(queries=2, sql_ms=500, wall_ms=1000),
+    'refresh catalog stats': Budget(queries=2, sql_ms=500, wall_ms=1000),
+    'reconcile stock reservations': Budget(queries=2, sql_ms=500, wall_ms=1000),
+    'refresh recommendations': Budget(queries=1, sql_ms=1000, wall_ms=5000),
+}
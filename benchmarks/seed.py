@@ -0,0 +1,159 @@
+"""
+Seed a realistic catalog with the test factories, objects are built by the
+factories and written with bulk_create, so that 100k orders take minutes, not hours.
+Images point to a placeholder path, writing files would not change the queries.
+"""
+import os
+import random
+
+import factory.random
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from taggit.models import Tag, TaggedItem
+
+from account.models import Address, User
+from account.tests.factory import AddressFactory, UserFactory
+from order.models import Order, OrderProduct, Payment, Review
+from order.tests.factory import (
+    OrderFactory, OrderProductFactory, PaymentFactory, ReviewFactory,
+)
+from shop.models import ProductSKU
+from shop.tests.factory import CategoryFactory, OriginFactory, SkuFactory, SpuFactory
+
+SCALE = float(os.getenv('BENCH_SCALE', 1))
+SKU_COUNT = int(10000 * SCALE)
+ORDER_COUNT = int(100000 * SCALE)
+USER_COUNT = max(int(1000 * SCALE), 10)
+BATCH_SIZE = 5000
+CATEGORY_IMAGE = 'media/category/benchmark.jpg'
+COVER_IMAGE = 'media/sku_cover/benchmark.jpg'
+
+# order status: (payment status, share of orders)
+ORDER_STATUSES = {
+    'NW': ('PD', 0.05),
+    'CF': ('SC', 0.10),
+    'SP': ('SC', 0.20),
+    'CP': ('SC', 0.55),
+    'CX': ('EX', 0.10),
+}
+TAGS = ['matcha', 'sencha', 'gift', 'organic', 'limited', 'sweets',
+        'sake', 'snack', 'seasonal', 'kyoto', 'hokkaido', 'okinawa']
+
+
+def skewed(rng, n):
+    """ Index in [0, n), low indices are picked far more often, like best sellers """
+    return int(n * rng.random() ** 3)
+
+
+def created_days_ago(table, days, key='id'):
+    """ Spread created_at of seeded rows over the last days, auto_now_add sets it to now """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET created_at = now() '
+            f"- ({key} % {days}) * interval '1 day' - ({key} % 24) * interval '1 hour'")
+
+
+def seed_catalog(seed=42):
+    """
+    Seed categories, products, tags, users, orders and reviews,
+    return a dict of objects the benchmarks request.
+    """
+    rng = random.Random(seed)
+    factory.random.reseed_random(seed)
+
+    roots = [CategoryFactory(image=CATEGORY_IMAGE) for _ in range(5)]
+    categories = [CategoryFactory(image=CATEGORY_IMAGE, parent=root)
+                  for root in roots for _ in range(4)]
+    origins = [OriginFactory(name=f'origin {i}') for i in range(10)]
+    spus = [SpuFactory(name=f'spu {i}') for i in range(100)]
+
+    products = ProductSKU.objects.bulk_create([SkuFactory.build(
+        cover_img=COVER_IMAGE,
+        slug=f'item-{i}',
+        price=rng.randrange(300, 30000, 100),
+        stock=rng.randrange(1, 999),
+        sales=rng.randrange(0, 500),
+        # the best sellers requested by the benchmarks are on the shelf
+        status='ON' if i < 10 or rng.random() < 0.95 else 'OFF',
+        category=rng.choice(categories),
+        origin=rng.choice(origins),
+        spu=rng.choice(spus),
+    ) for i in range(SKU_COUNT)], batch_size=BATCH_SIZE)
+    created_days_ago(ProductSKU._meta.db_table, 365)
+
+    tags = Tag.objects.bulk_create(
+        [Tag(name=name, slug=name) for name in TAGS])
+    content_type = ContentType.objects.get_for_model(ProductSKU)
+    TaggedItem.objects.bulk_create([
+        TaggedItem(content_type=content_type, object_id=product.id, tag=tag)
+        for product in products for tag in rng.sample(tags, 2)
+    ], batch_size=BATCH_SIZE)
+
+    users = User.objects.bulk_create([UserFactory.build(
+        email=f'user{i}@example.com') for i in range(USER_COUNT)])
+    addresses = Address.objects.bulk_create(
+        [AddressFactory.build(user=user) for user in users])
+
+    statuses = list(ORDER_STATUSES)
+    weights = [share for _, share in ORDER_STATUSES.values()]
+    payments, orders = [], []
+    for i in range(ORDER_COUNT):
+        index = rng.randrange(USER_COUNT)
+        status = rng.choices(statuses, weights)[0]
+        payments.append(PaymentFactory.build(
+            user=users[index], status=ORDER_STATUSES[status][0]))
+        orders.append(OrderFactory.build(
+            number=f'B{i:011d}', status=status, user=users[index],
+            address=addresses[index], payment=None))
+    payments = Payment.objects.bulk_create(payments, batch_size=BATCH_SIZE)
+    for order, payment in zip(orders, payments):
+        order.payment = payment
+    orders = Order.objects.bulk_create(orders, batch_size=BATCH_SIZE)
+    created_days_ago(Order._meta.db_table, 90)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {Payment._meta.db_table} AS payment SET created_at = o.created_at '
+            f'FROM {Order._meta.db_table} AS o WHERE o.payment_id = payment.id')
+
+    order_products = []
+    for order in orders:
+        for index in {skewed(rng, SKU_COUNT) for _ in range(rng.randint(1, 3))}:
+            product = products[index]
+            order_products.append(OrderProductFactory.build(
+                order=order, product=product, unit_price=product.price,
+                count=rng.randint(1, 3)))
+    order_products = OrderProduct.objects.bulk_create(
+        order_products, batch_size=BATCH_SIZE)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {OrderProduct._meta.db_table} AS item SET created_at = o.created_at '
+            f'FROM {Order._meta.db_table} AS o WHERE item.order_id = o.id')
+    # sales cover the units ordered, cancelling an order takes them back
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {ProductSKU._meta.db_table} AS sku SET sales = sold.count '
+            f'FROM (SELECT product_id, SUM(count) AS count FROM {OrderProduct._meta.db_table} '
+            f'GROUP BY product_id) AS sold WHERE sku.id = sold.product_id')
+
+    completed = {order.id for order in orders if order.status == 'CP'}
+    Review.objects.bulk_create([ReviewFactory.build(
+        order_product=order_product, user=order_product.order.user,
+        star=rng.randint(1, 5),
+    ) for order_product in order_products
+        if order_product.order_id in completed and rng.random() < 0.2],
+        batch_size=BATCH_SIZE)
+
+    ProductSKU.objects.update_search_vector()
+    ProductSKU.objects.sync_tag_slugs()
+    ProductSKU.objects.rebuild_review_stats()
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+    return {
+        # the best seller, with most reviews and related products
+        'product': products[0],
+        'category': roots[0],
+        'tag': tags[0],
+        'customer': users[0],
+        'cart': [(products[index].id, 1) for index in range(1, 6)],
+    }
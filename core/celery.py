@@ -24,10 +24,35 @@ app.conf.beat_schedule = {
         'task': 'order.tasks.auto_cancel_orders',
         'schedule': crontab(minute='0', hour='*')
     },
+    'reconcile-stock-reservations': {
+        'task': 'order.tasks.reconcile_stock_reservations',
+        'schedule': crontab(minute='*/5')
+    },
+    'requeue-webhook-events': {
+        'task': 'order.tasks.requeue_webhook_events',
+        'schedule': crontab(minute='*/10')
+    },
     'auto-complete-orders': {
         'task': 'order.tasks.auto_complete_orders',
         'schedule': crontab(minute='0', hour='0')
     },
+    'refresh-trending-products': {
+        'task': 'shop.tasks.refresh_trending_products',
+        'schedule': crontab(minute='*/10')
+    },
+    'refresh-catalog-stats': {
+        'task': 'shop.tasks.refresh_catalog_stats',
+        'schedule': crontab(minute='*/10')
+    },
+    'refresh-recommendations': {
+        'task': 'shop.tasks.refresh_recommendations',
+        'schedule': crontab(minute='*/30')
+    },
+    'rebuild-recommendations': {
+        'task': 'shop.tasks.refresh_recommendations',
+        'schedule': crontab(minute='30', hour='3'),
+        'kwargs': {'full': True},
+    },
     'close-inactive-account': {
         'task': 'account.tasks.close_inactive_account',
         'schedule': crontab(minute='0', hour='*')
@@ -0,0 +1,214 @@
+"""
+Per request performance metrics, time spent in SQL, redis and template rendering
+is recorded for each request by PerformanceMiddleware, sent back in the
+Server-Timing header and aggregated per view into a rolling histogram in redis:
+    perf_<minute>: hash {<view>|<field>: <sum>} of the requests served in that minute,
+        fields are counters and a histogram of total time, see SUM_FIELDS, BUCKETS
+The last WINDOW minutes are read by the staff only metrics view, to find hot paths
+in production without the overhead of full tracing.
+"""
+import logging
+import time
+from contextvars import ContextVar
+from contextlib import ExitStack
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connections
+from django.http import JsonResponse
+from django.template.backends.django import Template
+from django_redis import get_redis_connection
+from redis.client import Pipeline, Redis
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# minutes kept in the rolling histogram
+WINDOW = 60
+# upper bounds of total time buckets in ms, slower requests fall into 'inf'
+BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 'inf')
+SUM_FIELDS = ('sql_count', 'sql_ms', 'redis_count',
+              'redis_ms', 'template_ms', 'total_ms')
+
+# metrics of the request being served, None outside requests, e.g. celery tasks
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self.redis_count = 0
+        self.redis_ms = 0.0
+        self.template_ms = 0.0
+        self.total_ms = 0.0
+
+    def add(self, kind, ms, count=1):
+        """ Add time of sql, redis or template, count of queries or commands """
+        setattr(self, f'{kind}_ms', getattr(self, f'{kind}_ms') + ms)
+        if kind != 'template':
+            setattr(self, f'{kind}_count', getattr(self, f'{kind}_count') + count)
+
+    def time_query(self, execute, sql, params, many, context):
+        """ DB execute wrapper, see connection.execute_wrapper """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add('sql', (time.perf_counter() - start) * 1000)
+
+    def server_timing(self):
+        return ', '.join([
+            f'db;dur={self.sql_ms:.1f};desc="{self.sql_count} queries"',
+            f'redis;dur={self.redis_ms:.1f};desc="{self.redis_count} commands"',
+            f'tpl;dur={self.template_ms:.1f}',
+            f'total;dur={self.total_ms:.1f}',
+        ])
+
+    def bucket(self):
+        for bound in BUCKETS[:-1]:
+            if self.total_ms <= bound:
+                return bound
+        return BUCKETS[-1]
+
+
+def _timed(func, kind, count=None):
+    """
+    Wrap func to add its time to the metrics of the current request,
+    as one command unless count(self) tells the number of commands.
+    """
+    def wrapper(self, *args, **kwargs):
+        metrics = current_metrics.get()
+        if metrics is None:
+            return func(self, *args, **kwargs)
+        commands = count(self) if count else 1
+        start = time.perf_counter()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            metrics.add(kind, (time.perf_counter() - start) * 1000, commands)
+    wrapper.__wrapped__ = func
+    return wrapper
+
+
+def install_wrappers():
+    """
+    Time redis commands, pipelines and template rendering of requests,
+    idempotent, called once by the middleware. Commands queued
+    in a pipeline are counted when the pipeline is executed.
+    """
+    if hasattr(Redis.execute_command, '__wrapped__'):
+        return
+    Redis.execute_command = _timed(Redis.execute_command, 'redis')
+    Pipeline.execute = _timed(
+        Pipeline.execute, 'redis', lambda pipe: len(pipe.command_stack))
+    Template.render = _timed(Template.render, 'template')
+
+
+def record_request(view_name, metrics, now=None):
+    """ Add a request to the histogram of the current minute, in one round trip """
+    minute = int((now or time.time()) // 60)
+    key = f'perf_{minute}'
+    pipe = get_redis_connection('default').pipeline(transaction=False)
+    pipe.hincrby(key, f'{view_name}|count', 1)
+    pipe.hincrby(key, f'{view_name}|le_{metrics.bucket()}', 1)
+    for field in SUM_FIELDS:
+        value = getattr(metrics, field)
+        if field.endswith('_count'):
+            pipe.hincrby(key, f'{view_name}|{field}', value)
+        else:
+            pipe.hincrbyfloat(key, f'{view_name}|{field}', round(value, 3))
+    pipe.expire(key, (WINDOW + 1) * 60)
+    pipe.execute()
+
+
+def percentile(histogram, count, q):
+    """ Upper bound of the bucket holding the q quantile """
+    seen = 0
+    for bound in BUCKETS:
+        seen += histogram.get(bound, 0)
+        if seen >= q * count:
+            return bound
+    return BUCKETS[-1]
+
+
+def read_metrics(minutes=WINDOW, now=None):
+    """
+    Aggregate the last minutes of the histogram, return a list of dicts per view,
+    sorted by total time spent, i.e. the hot paths first.
+    """
+    current = int((now or time.time()) // 60)
+    pipe = get_redis_connection('default').pipeline(transaction=False)
+    for minute in range(current - minutes + 1, current + 1):
+        pipe.hgetall(f'perf_{minute}')
+    sums = {}
+    for hash_ in pipe.execute():
+        for field, value in hash_.items():
+            view_name, field = field.decode().rsplit('|', 1)
+            view = sums.setdefault(view_name, {})
+            view[field] = view.get(field, 0) + float(value)
+
+    views = []
+    for view_name, view in sums.items():
+        count = int(view['count'])
+        histogram = {bound: int(view.get(f'le_{bound}', 0))
+                     for bound in BUCKETS}
+        views.append({
+            'view': view_name,
+            'count': count,
+            **{f'{field}_avg': round(view.get(field, 0) / count, 1)
+               for field in SUM_FIELDS},
+            'total_ms_sum': round(view.get('total_ms', 0), 1),
+            'p50': percentile(histogram, count, 0.5),
+            'p95': percentile(histogram, count, 0.95),
+            'p99': percentile(histogram, count, 0.99),
+            'histogram': {str(bound): n for bound, n in histogram.items()},
+        })
+    return sorted(views, key=lambda view: view['total_ms_sum'], reverse=True)
+
+
+class PerformanceMiddleware:
+    """
+    Record SQL, redis, template and total time of each request, placed first
+    in MIDDLEWARE so that the total covers the other middlewares.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install_wrappers()
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.time_query))
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        metrics.total_ms = (time.perf_counter() - start) * 1000
+
+        response['Server-Timing'] = metrics.server_timing()
+        match = request.resolver_match
+        view_name = match.view_name if match else 'unresolved'
+        try:
+            record_request(view_name, metrics)
+        except RedisError:
+            # metrics never break the response
+            logger.warning('Failed to record request metrics', exc_info=True)
+        return response
+
+
+@staff_member_required
+def metrics_view(request):
+    """
+    Response the aggregated request metrics per view of the last minutes,
+    query param minutes, up to WINDOW.
+    """
+    try:
+        minutes = min(max(int(request.GET.get('minutes', WINDOW)), 1), WINDOW)
+    except ValueError:
+        minutes = WINDOW
+    return JsonResponse({'res': 1, 'minutes': minutes, 'views': read_metrics(minutes)})
@@ -57,6 +57,8 @@ INSTALLED_APPS = [
 
 # add UpdateCacheMiddleware and FetchFromCacheMiddleware to cache site page with default cache backend
 MIDDLEWARE = [
+    # first, so that its total time covers the other middlewares
+    'core.metrics.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -208,6 +210,8 @@ CKEDITOR_CONFIGS = {
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY')
 STRIPE_PUBLIC_KEY = os.getenv('STRIPE_PUBLIC_KEY')
 WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+# order.gateways.FakeGateway to checkout without network, e.g. load tests
+PAYMENT_GATEWAY = os.getenv('PAYMENT_GATEWAY', 'order.gateways.StripeGateway')
 
 # admin UI icons
 SIMPLEUI_ICON = {
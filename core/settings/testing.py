@@ -3,6 +3,8 @@ from .base import *
 DEBUG = False
 DOMAIN = '127.0.0.1'
 EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+PAYMENT_GATEWAY = 'order.gateways.FakeGateway'
+WEBHOOK_SECRET = 'whsec_testing'
 # for debug tool:
 DEBUG_TOOLBAR_PATCH_SETTINGS = False
 if DEBUG:
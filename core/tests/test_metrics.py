@@ -0,0 +1,88 @@
+import re
+
+from django.test import TestCase, Client
+from django.urls import reverse
+from django_redis import get_redis_connection
+
+from account.tests.factory import UserFactory
+from core.metrics import RequestMetrics, percentile, read_metrics, record_request
+from shop.tests.factory import SkuFactory
+
+
+class TestPerformanceMiddleware(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+
+    def tearDown(self):
+        get_redis_connection("default").flushdb()
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.url = reverse('shop:product-suggest')
+        cls.staff = UserFactory(is_staff=True)
+        SkuFactory(name='uji matcha powder')
+
+    def server_timing(self, res):
+        return dict(re.findall(r'(\w+);dur=([\d.]+)', res['Server-Timing'])), res['Server-Timing']
+
+    def test_server_timing_header(self):
+        res = self.client.get(self.url, {'q': 'matcha'})
+        durations, header = self.server_timing(res)
+        self.assertEqual(set(durations), {'db', 'redis', 'tpl', 'total'})
+        # suggestion query on cache miss, catalog version and cache reads and writes
+        self.assertIn('desc="1 queries"', header)
+        commands = int(re.search(r'(\d+) commands', header).group(1))
+        self.assertGreaterEqual(commands, 2)
+        self.assertGreaterEqual(float(durations['total']), float(durations['db']))
+
+    def test_requests_aggregated_per_view(self):
+        self.client.get(self.url, {'q': 'matcha'})
+        self.client.get(self.url, {'q': 'matcha'})
+        view = next(view for view in read_metrics()
+                    if view['view'] == 'shop:product-suggest')
+        self.assertEqual(view['count'], 2)
+        # the second request is served from cache
+        self.assertEqual(view['sql_count_avg'], 0.5)
+        self.assertEqual(sum(view['histogram'].values()), 2)
+
+    def test_template_render_timed(self):
+        res = self.client.get(reverse('shop:product-list'))
+        durations, _ = self.server_timing(res)
+        self.assertGreater(float(durations['tpl']), 0)
+
+    def test_metrics_view_staff_only(self):
+        self.client.get(self.url, {'q': 'matcha'})
+        res = self.client.get(reverse('perf-metrics'))
+        self.assertEqual(res.status_code, 302)
+
+        self.client.force_login(self.staff)
+        res = self.client.get(reverse('perf-metrics'), {'minutes': 5})
+        data = res.json()
+        self.assertEqual(data['minutes'], 5)
+        self.assertIn('shop:product-suggest',
+                      [view['view'] for view in data['views']])
+
+
+class TestHistogram(TestCase):
+    def tearDown(self):
+        get_redis_connection("default").flushdb()
+
+    def metrics(self, total_ms):
+        metrics = RequestMetrics()
+        metrics.total_ms = total_ms
+        return metrics
+
+    def test_rolling_window(self):
+        now = 1_000_000_000
+        record_request('shop:index', self.metrics(30), now=now - 60 * 10)
+        record_request('shop:index', self.metrics(7000), now=now)
+        views = read_metrics(minutes=5, now=now)
+        self.assertEqual(views[0]['count'], 1)
+        self.assertEqual(views[0]['histogram']['inf'], 1)
+        self.assertEqual(read_metrics(minutes=15, now=now)[0]['count'], 2)
+
+    def test_percentile(self):
+        histogram = {10: 90, 250: 8, 'inf': 2}
+        self.assertEqual(percentile(histogram, 100, 0.5), 10)
+        self.assertEqual(percentile(histogram, 100, 0.95), 250)
+        self.assertEqual(percentile(histogram, 100, 0.99), 'inf')
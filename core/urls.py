@@ -6,6 +6,8 @@ from django.urls import path, include
 from django_ses.views import handle_bounce
 from django.views.decorators.csrf import csrf_exempt
 
+from .metrics import metrics_view
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -13,6 +15,7 @@ urlpatterns = [
     path('account/', include('account.urls', namespace='account')),
     path('order/', include('order.urls', namespace='order')),
     path('cart/', include('cart.urls', namespace='cart')),
+    path('metrics/', metrics_view, name='perf-metrics'),
 ]
 
 urlpatterns += [path('admin/django-ses/', include('django_ses.urls')),
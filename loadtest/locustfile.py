@@ -0,0 +1,88 @@
+"""
+Checkout load scenario, guest buyers browse, add to cart, place an order
+and pay it through the fake payment gateway, the checkout.session.completed
+event is posted to the webhook like Stripe does.
+
+Run the site with the fake gateway, e.g.
+    PAYMENT_GATEWAY=order.gateways.FakeGateway gunicorn core.wsgi -w 4
+    locust -f loadtest/locustfile.py --host http://127.0.0.1:8000
+
+Products in stock are picked from the product list page, restock them between
+runs to keep measuring checkout rather than understocked responses.
+"""
+import random
+import re
+import uuid
+
+from locust import HttpUser, between, task
+
+PRODUCT_URL = re.compile(r'href="(/shop/(\d+)/[\w-]+/)"')
+
+GUEST_ADDRESS = {
+    'first_name': 'Load',
+    'last_name': 'Test',
+    'phone_no': '0312345678',
+    'addr': '1-1 Chiyoda',
+    'city': 'Chiyoda',
+    'province': 'Tokyo',
+    'country': 'JP',
+    'zip_code': '1000001',
+}
+
+
+class GuestBuyer(HttpUser):
+    wait_time = between(1, 3)
+
+    def on_start(self):
+        # guest carts are keyed by the uuid cookie
+        self.client.cookies.set('uuid', str(uuid.uuid4()))
+        self.client.get('/', name='index')
+        self.products = []
+
+    def post_json(self, url, data, name=None):
+        headers = {'X-CSRFToken': self.client.cookies.get('csrftoken', '')}
+        return self.client.post(url, json=data, headers=headers, name=name)
+
+    def browse(self):
+        res = self.client.get('/shop/', name='product list')
+        self.products = PRODUCT_URL.findall(res.text) or self.products
+        if not self.products:
+            return None
+        url, sku_id = random.choice(self.products)
+        self.client.get(url, name='product detail')
+        return sku_id
+
+    @task(3)
+    def window_shopping(self):
+        self.browse()
+
+    @task(1)
+    def checkout(self):
+        sku_id = self.browse()
+        if sku_id is None:
+            return
+        res = self.post_json(
+            '/cart/add/', {'sku_id': sku_id, 'count': 1}, name='cart add')
+        if res.json().get('res') != 1:
+            return
+        self.client.get('/cart/checkout/', name='checkout page')
+
+        data = {
+            **GUEST_ADDRESS,
+            'email': f'{uuid.uuid4().hex[:12]}@example.com',
+            'payment_method': 'card',
+        }
+        result = self.post_json(
+            '/order/process/', data, name='order process').json()
+        if result.get('res') != 1:
+            # understocked is an expected answer under load
+            return
+        session_id = result['session']['id']
+
+        # the customer pays on the checkout page, the gateway notifies the webhook
+        event = self.post_json(
+            f'/order/fake-checkout/{session_id}/', {}, name='fake checkout').json()
+        self.client.post(
+            '/order/webhook/', data=event['payload'], name='webhook',
+            headers={'Stripe-Signature': event['signature'],
+                     'Content-Type': 'application/json'})
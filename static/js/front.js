@@ -189,6 +189,28 @@ $(function () {
     }
   });
 
+  // search box autocomplete, fill a datalist with suggested product names
+  let suggestTimer;
+  $("body").append('<datalist id="search-suggestions"></datalist>');
+  $("input[name='search']")
+    .attr({ list: "search-suggestions", autocomplete: "off" })
+    .on("input", function () {
+      let q = $(this).val().trim();
+      clearTimeout(suggestTimer);
+      if (q.length < 2) return;
+      suggestTimer = setTimeout(async function () {
+        const res = await fetch(`/search/suggest/?q=${encodeURIComponent(q)}`);
+        let data = await res.json();
+        if (data.res == "1") {
+          // names are set as values, never parsed as markup
+          let options = data.suggestions.map((item) =>
+            $("<option>").val(item.name)
+          );
+          $("#search-suggestions").empty().append(options);
+        }
+      }, 150);
+    });
+
   // add cart item
   $(".add-cart").click(async function (event) {
     event.preventDefault();